@@ -3,9 +3,14 @@ import os
 import re
 from datetime import datetime
 import metadata
+import logger
+import mmap
+from pattern import Pattern, Timesets, blocks_from_records, write_vec_blocks
+from progress import track_lines, sanitized
 
 author = metadata.author
 sub_script_ver = metadata.script_ver
+log = logger.get_logger("ate2vec")
 
 # -------------------- Vector Parsing --------------------
 
@@ -20,60 +25,86 @@ def sanitize_vector(vec_line):
             sanitized += "X"
     return sanitized
 
-def parse_j750_atp_vectors(atp_file):
-    """Extract vector bitstrings from J750 ATP file.
-    Stop at 'halt', but include the first vector after halt."""
-    vectors = []
+def iter_j750_atp_vectors(atp_file, progress=None, named=False):
+    """Yield (vector, comment) from a J750 ATP file as it is read.
+    Stop at 'halt', but include the first vector after halt.
+    named: yield (vector, comment, timeset) and accept every timeset, not only WFT"""
+    return sanitized(_j750_atp_records(atp_file, progress, named), sanitize_vector, progress)
+
+
+def _j750_atp_records(atp_file, progress, named):
+    """iter_j750_atp_vectors' records before sanitizing"""
     include_next_after_halt = False
+    tset = r"\w+" if named else "WFT"
+    after_halt = re.compile(rf">\s*({tset})\s+([01XxLHZlhz]+);")
+    vector_line = re.compile(rf"^\s*>\s*({tset})\b([^;]+);", re.I)
 
     with open(atp_file, "r") as f:
-        for line in f:
+        for line in track_lines(f, progress):
             line = line.strip()
             if include_next_after_halt:
                 # Capture only the first line after halt
-                if line.startswith("> WFT"):
-                    m = re.search(r"> WFT\s+([01XxLHZlhz]+);", line)
+                if line.startswith(">"):
+                    m = after_halt.search(line)
                     if m:
-                        vec = sanitize_vector(m.group(1))
+                        vec = m.group(2)
                         comment_match = re.search(r";\s*//(.*)$", line)
                         comment = comment_match.group(1).strip() if comment_match else None
-                        vectors.append((vec, comment))
+                        yield (vec, comment, m.group(1)) if named else (vec, comment)
                 break  # Stop reading after the first line after halt
 
             if line.lower() == "halt":
                 include_next_after_halt = True
                 continue
 
-            if re.match(r"^\s*>\s*WFT\b", line, re.I):
-                # Extract everything between WFT and ';'
-                m = re.search(r">\s*WFT([^;]+);", line, re.I)
-                if m:
-                    raw_vec = m.group(1)  # "     1   1   0   0   Z   Z "
-                    raw_vec = raw_vec.replace(" ", "")  # "1100ZZ"
-                    vec = sanitize_vector(raw_vec)
+            # Extract everything between the timeset and ';'
+            m = vector_line.match(line)
+            if m:
+                raw_vec = m.group(2)  # "     1   1   0   0   Z   Z "
+                vec = raw_vec.replace(" ", "")  # "1100ZZ"
 
-                    comment_match = re.search(r";\s*//(.*)$", line)
-                    comment = comment_match.group(1).strip() if comment_match else None
+                comment_match = re.search(r";\s*//(.*)$", line)
+                comment = comment_match.group(1).strip() if comment_match else None
 
-                    vectors.append((vec, comment))
+                yield (vec, comment, m.group(1)) if named else (vec, comment)
 
-    return vectors
 
+def iter_chroma_pat_vectors(pat_file, progress=None, timesets=None):
+    """Yield (vector, comment) from a Chroma PAT file as it is read.
+    timesets: the file's Timesets (parse_chroma_timesets); yield (vector, comment, timeset), where
+    a vector that names no timeset keeps the one before it"""
+    return sanitized(_chroma_pat_records(pat_file, progress, timesets), sanitize_vector, progress)
 
-def parse_chroma_pat_vectors(pat_file):
-    """Extract vector bitstrings from Chroma PAT file."""
-    vectors = []
+
+def _chroma_pat_records(pat_file, progress, timesets):
+    """iter_chroma_pat_vectors' records before sanitizing"""
+    tset = timesets[0] if timesets else None
     with open(pat_file, "r") as f:
-        for line in f:
+        for line in track_lines(f, progress):
             line = line.strip()
             m = re.search(r"\*([01XxLHZlhz]+)\*", line)
             if m:
-                vec = sanitize_vector(m.group(1))
+                vec = m.group(1)
                 # Comment handling if present
                 comment_match = re.search(r";\s*//(.*)$", line)
                 comment = comment_match.group(1).strip() if comment_match else None
-                vectors.append((vec, comment))
-    return vectors
+                if timesets is None:
+                    yield vec, comment
+                    continue
+                ts = CHROMA_TS_RE.match(line, m.end())
+                if ts and ts.group(1) != "STOP":
+                    tset = ts.group(1)
+                yield vec, comment, tset
+
+
+def parse_j750_atp_vectors(atp_file, progress=None, named=False):
+    """Extract vector bitstrings from J750 ATP file (as a list)."""
+    return list(iter_j750_atp_vectors(atp_file, progress, named))
+
+
+def parse_chroma_pat_vectors(pat_file, progress=None, timesets=None):
+    """Extract vector bitstrings from Chroma PAT file (as a list)."""
+    return list(iter_chroma_pat_vectors(pat_file, progress, timesets))
 
 # -------------------- Pin Extraction --------------------
 
@@ -91,44 +122,90 @@ def parse_j750_pins(atp_file):
                     break
     return pins
 
+# -------------------- Timesets --------------------
+
+J750_IMPORT_RE = re.compile(r"^\s*import\s+tset\s+([^;]+);", re.I)
+# Chroma: the timeset follows the vector data; the last vector carries STOP before its ';'
+CHROMA_TS_RE = re.compile(r"[ \t]*(\w+?)(?:STOP)?[ \t]*;")
+# only a vector's closing '*' (preceded by a bit) can start a match, so the vector bits themselves
+# are never walked: a star opening a vector fails the lookbehind, one closing it without a name fails
+# on its ';'
+CHROMA_TS_SCAN = re.compile(rb"\*(?<=[01XxLHZlhz]\*)[ \t]*(\w+?)(?:STOP)?[ \t]*;")
+
+
+def parse_j750_timesets(atp_file):
+    """Timesets of the ATP's 'import tset' line; None if it only imports WFT"""
+    names = []
+    with open(atp_file, "r") as f:
+        for line in f:
+            m = J750_IMPORT_RE.match(line)
+            if m:
+                names += [n.strip() for n in m.group(1).split(",") if n.strip()]
+            elif "$tset" in line:
+                break
+    return Timesets(names) if names and names != ["WFT"] else None
+
+
+def parse_chroma_timesets(pat_file):
+    """Timesets named on the PAT's vectors, in first-seen order; None if there is only TS1.
+    Chroma declares timesets nowhere else, and every writer lists them in its header before the
+    first vector, so the whole file is looked at, through mmap, before the streaming parse. Only
+    the bytes after each vector's closing '*' are examined (about 1% of the parse time)."""
+    if not os.path.getsize(pat_file):
+        return None
+    names = []
+    with open(pat_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for m in CHROMA_TS_SCAN.finditer(mm):
+            name = m.group(1).decode("latin-1")
+            if name != "STOP" and name not in names:
+                names.append(name)
+    return Timesets(names) if not set(names) <= {"TS1"} else None
+
+
 def parse_chroma_pins(pat_file):
     """Extract pin names from Chroma PAT HEADER section."""
     pins = []
     with open(pat_file, "r") as f:
-        lines = f.readlines()
-        for i, line in enumerate(lines):
+        for line in f:
             if "HEADER" in line:
-                if i + 1 < len(lines):
-                    next_line = lines[i+1].strip().rstrip(';')
-                    pins = [p.strip() for p in next_line.split(',') if p.strip()]
-                    break
+                next_line = next(f, "").strip().rstrip(';')
+                pins = [p.strip() for p in next_line.split(',') if p.strip()]
+                break
     return pins
 
 # -------------------- File Generation --------------------
 
-# -------------------- File Generation --------------------
-
-def generate_vec_file(vectors, vec_file, ate_file, date):
-    with open(vec_file, "w") as f:
-        f.write("########################################################\n")
-        f.write(f"# Generated by VektorConverter: ate2vec v{sub_script_ver}\n")
-        f.write(f"# Pattern   : {ate_file}\n")
-        f.write(f"# Timestamp : {date}\n")
-        f.write("#\n")
-        f.write("########################################################\n")
-
-        # Remove last vector only if it is a dummy (all X)
-        if vectors and all(c == "X" for c in vectors[-1][0]):
-            print("Removing extra dummy vector at the end")
-            vectors = vectors[:-1]
+def vec_header(ate_file, date):
+    """Comment lines (text after '#') of the .vec header"""
+    return [
+        "#######################################################",
+        f" Generated by VektorConverter: ate2vec v{sub_script_ver}",
+        f" Pattern   : {ate_file}",
+        f" Timestamp : {date}",
+        "",
+        "#######################################################",
+    ]
+
+def drop_dummy_vector(vectors):
+    """Yield vectors, leaving out the last one if it is a dummy (all X)"""
+    prev = None
+    for item in vectors:
+        if prev is not None:
+            yield prev
+        prev = item
+    if prev is not None:
+        if all(c == "X" for c in prev[0]):
+            log.info("Removing extra dummy vector at the end")
+        else:
+            yield prev
 
-        # Write vectors with line numbers starting from 0
-        for idx, (vec, comment) in enumerate(vectors):
-            if comment:
-                f.write(f"#{comment}\n")
-            f.write(f"{idx} {vec}\n")  # Add line number before vector
+def generate_vec_file(vectors, vec_file, ate_file, date, timesets=None):
+    # Vectors are numbered from 0; comments go on their own '#' line before the vector
+    blocks = blocks_from_records(drop_dummy_vector(vectors), header=vec_header(ate_file, date),
+                                 timesets=timesets)
+    write_vec_blocks(blocks, vec_file, timesets)
 
-    print(f"VEC file written: {vec_file}")
+    log.info(f"VEC file written: {vec_file}")
 
 
 
@@ -137,7 +214,27 @@ def generate_cmf_file(pin_names, cmf_file):
     with open(cmf_file, "w") as f:
         for idx, pin in enumerate(reversed(pin_names)):
             f.write(f"{pin},{idx},T2,USE\n")
-    print(f"CMF file written: {cmf_file}")
+    log.info(f"CMF file written: {cmf_file}")
+
+# -------------------- Pattern reader --------------------
+
+def read_pattern(ate_file, progress=None):
+    """Parse .atp/.pat once into a Pattern whose blocks are exactly the .vec generate_vec_file writes.
+    Vectors are parsed as the blocks are consumed; only the last one is held back (dummy check)."""
+    ext = os.path.splitext(ate_file)[1].lower()
+    if ext == ".atp":
+        timesets = parse_j750_timesets(ate_file)
+        vectors = iter_j750_atp_vectors(ate_file, progress, named=timesets is not None)
+        pins = parse_j750_pins(ate_file)
+    else:
+        timesets = parse_chroma_timesets(ate_file)
+        vectors = iter_chroma_pat_vectors(ate_file, progress, timesets)
+        pins = parse_chroma_pins(ate_file)
+
+    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    header = vec_header(os.path.basename(ate_file), date)
+    blocks = blocks_from_records(drop_dummy_vector(vectors), header=header, timesets=timesets)
+    return Pattern(pins, blocks, source=ate_file, timesets=timesets)
 
 # -------------------- Main --------------------
 
@@ -151,10 +248,12 @@ def main():
     date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     if ext == ".atp":
-        vectors = parse_j750_atp_vectors(input_file)
+        timesets = parse_j750_timesets(input_file)
+        vectors = parse_j750_atp_vectors(input_file, named=timesets is not None)
         pins = parse_j750_pins(input_file)
     elif ext == ".pat":
-        vectors = parse_chroma_pat_vectors(input_file)
+        timesets = parse_chroma_timesets(input_file)
+        vectors = parse_chroma_pat_vectors(input_file, timesets=timesets)
         pins = parse_chroma_pins(input_file)
     else:
         print("ERROR: Unsupported file type. Use .atp or .pat")
@@ -174,10 +273,11 @@ def main():
     cmf_file = os.path.join(os.path.dirname(input_file), base_name + ".cmf")
 
     # Pass ate_file and date to include in header
-    generate_vec_file(vectors, vec_file, ate_file, date)
+    generate_vec_file(vectors, vec_file, ate_file, date, timesets)
     generate_cmf_file(pins, cmf_file)
 
 if __name__ == "__main__":
+    logger.init_logger()
     print("#############################################################")
     print("#\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t#")
     print("#\t\t\t\t\t\tVektorConverter\t\t\t\t\t\t#")
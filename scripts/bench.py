@@ -0,0 +1,171 @@
+# bench.py
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import metadata
+import patgen
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+
+# Times every main.run_conversion path on synthetic patterns (see patgen.py).
+# Each conversion runs in a fresh interpreter so its peak RSS is its own.
+
+# name, input format, targets
+PATHS = [
+    ("atp->vec", "atp", None),
+    ("pat->vec", "pat", None),
+    ("stil->vec", "stil", None),
+    ("vcd->vec", "vcd", None),
+    ("vec->J750", "vec", ["J750"]),
+    ("vec->C3380", "vec", ["C3380"]),
+    ("vec->vecb", "vec", ["VECB"]),
+    ("vecb->J750", "vecb", ["J750"]),
+    ("stil->vec+J750+C3380", "stil", ["J750", "C3380"]),
+]
+
+DEFAULT_SIZES = [(100_000, 64)]
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _child(file_path, targets):
+    """Run one conversion quietly and print its timing as one JSON line"""
+    import main
+    if "--pipeline" in targets:
+        import pipeline
+        targets.remove("--pipeline")
+        pipeline.enable()
+    t0 = time.perf_counter()
+    main.run_conversion(file_path, targets or None, interval=patgen.PERIOD_PS)
+    seconds = time.perf_counter() - t0
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": _peak_rss_mb()}))
+
+
+def _inputs(work_dir, n_vectors, n_pins, toggle, comment_every, seed):
+    """Generate one input per format (vecb packed from the vec); returns {format: path}"""
+    import vecb
+    paths = {}
+    for fmt in patgen.FORMATS:
+        paths[fmt] = patgen.generate(fmt, os.path.join(work_dir, fmt), n_vectors, n_pins, toggle,
+                                     comment_every, seed)
+    paths["vecb"] = vecb.vec_to_vecb(paths["vec"])
+    return paths
+
+
+def run_path(name, file_path, targets, n_vectors, n_pins, pipeline=False):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", file_path] + (targets or [])
+    if pipeline:
+        cmd.append("--pipeline")
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"ERROR: {name} failed:\n{proc.stderr.strip()}")
+        return {"path": name, "vectors": n_vectors, "pins": n_pins, "error": proc.stderr.strip().splitlines()[-1:]}
+    r = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "path": name,
+        "vectors": n_vectors,
+        "pins": n_pins,
+        "input_bytes": os.path.getsize(file_path),
+        "seconds": round(r["seconds"], 3),
+        "vectors_per_s": round(n_vectors / r["seconds"]) if r["seconds"] else None,
+        "peak_rss_mb": r["peak_rss_mb"],
+    }
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, paths=None, toggle=0.1, comment_every=1000, seed=1, work_dir=None,
+                   pipeline=False):
+    """Run the selected PATHS for every (vectors, pins) size; returns the result document"""
+    selected = [p for p in PATHS if paths is None or p[0] in paths]
+    results = []
+    own_dir = work_dir is None
+    work_dir = work_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_work")
+    try:
+        for n_vectors, n_pins in sizes:
+            print(f"Generating {n_vectors} vectors x {n_pins} pins...")
+            inputs = _inputs(work_dir, n_vectors, n_pins, toggle, comment_every, seed)
+            for name, fmt, targets in selected:
+                r = run_path(name, inputs[fmt], targets, n_vectors, n_pins, pipeline)
+                results.append(r)
+                if "error" not in r:
+                    print(f"{name:<22} {r['seconds']:>9.2f} s {r['vectors_per_s']:>12,} vec/s "
+                          f"{r['peak_rss_mb'] or '-':>8} MB")
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "version": sub_script_ver,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"toggle": toggle, "comment_every": comment_every, "seed": seed, "pipeline": pipeline},
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """Print throughput of new relative to old for every (path, vectors, pins) in both"""
+    key = lambda r: (r["path"], r["vectors"], r["pins"])
+    before = {key(r): r for r in old["results"] if r.get("vectors_per_s")}
+    print(f"Compared with v{old['version']} ({old['time']}):")
+    for r in new["results"]:
+        b = before.get(key(r))
+        if b and r.get("vectors_per_s"):
+            print(f"{r['path']:<22} {r['vectors_per_s'] / b['vectors_per_s']:>6.2f}x")
+
+
+def _size(text):
+    """'1000000x64' -> (1000000, 64)"""
+    vectors, _, pins = text.lower().partition("x")
+    return int(vectors), int(pins or 64)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        _child(sys.argv[2], sys.argv[3:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark VektorConverter conversion paths")
+    parser.add_argument("-s", "--size", type=_size, action="append",
+                        help="VECTORSxPINS, may be repeated (default 100000x64)")
+    parser.add_argument("--path", action="append", choices=[p[0] for p in PATHS], help="only this path")
+    parser.add_argument("-t", "--toggle", type=float, default=0.1)
+    parser.add_argument("-c", "--comment-every", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir", help="keep generated inputs here")
+    parser.add_argument("-o", "--output", default=f"bench_v{sub_script_ver}.json")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--pipeline", action="store_true", help="run the conversions in pipeline mode")
+    parser.add_argument("--max-rss", type=float, metavar="MB",
+                        help="fail (exit 1) if any path peaks above MB; checks that conversions stream")
+    args = parser.parse_args()
+
+    doc = run_benchmarks(args.size or DEFAULT_SIZES, args.path, args.toggle, args.comment_every, args.seed,
+                         args.work_dir, args.pipeline)
+    with open(args.output, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"Results written: {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), doc)
+    if args.max_rss:
+        over = [r for r in doc["results"] if "error" in r or (r["peak_rss_mb"] or 0) > args.max_rss]
+        for r in over:
+            print(f"FAIL: {r['path']} {r.get('peak_rss_mb') or 'error'} MB (budget {args.max_rss} MB)")
+        if over:
+            sys.exit(1)
+        print(f"All paths stayed under {args.max_rss} MB")
@@ -0,0 +1,131 @@
+# formats.py
+import importlib
+
+# Readers and writers are registered by name ("module", "function") and only imported
+# the first time they are used, so starting the GUI/CLI does not load every converter.
+
+_readers = {}   # extension -> ReaderSpec
+_writers = {}   # target name -> WriterSpec
+
+
+class ReaderSpec:
+    """Input format: extension(s), GUI input type and the options its reader takes"""
+
+    def __init__(self, kind, module, func, options=(), intermediate=True):
+        self.kind = kind                  # GUI input type: ate / stil / vcd / vec
+        self.module = module
+        self.func = func
+        self.options = tuple(options)     # keyword options the reader accepts, e.g. ("interval",)
+        self.intermediate = intermediate  # True if the reader's stream is also saved as .vec/.cmf
+
+    def load(self):
+        return getattr(importlib.import_module(self.module), self.func)
+
+
+class WriterSpec:
+    """Output target: file extension and the writer factory that produces it"""
+
+    def __init__(self, target, extension, module, func, options=()):
+        self.target = target
+        self.extension = extension
+        self.module = module
+        self.func = func
+        self.options = tuple(options)
+
+    def load(self):
+        return getattr(importlib.import_module(self.module), self.func)
+
+
+# -------------------- Registration --------------------
+
+def register_reader(extensions, kind, module, func, options=(), intermediate=True):
+    """register_reader([".atp"], "ate", "ate2vec", "read_pattern")
+    The reader is called as func(path, progress=..., **options) and must return a pattern.Pattern"""
+    spec = ReaderSpec(kind, module, func, options, intermediate)
+    for ext in extensions:
+        _readers[ext.lower()] = spec
+    return spec
+
+
+def register_writer(target, extension, module, func, options=()):
+    """register_writer("J750", ".atp", "vec2ate", "ate_writer", options=("dec_file",))
+    The factory is called as func(pattern, vec_file, target, progress=..., **options) and must return
+    a callable that consumes the block stream, with the paths it writes in its .outputs"""
+    spec = WriterSpec(target.upper(), extension, module, func, options)
+    _writers[spec.target] = spec
+    return spec
+
+
+# -------------------- Lookup --------------------
+
+def get_reader(ext):
+    return _readers.get(ext.lower())
+
+
+def get_writer(target):
+    return _writers.get(target.upper())
+
+
+def input_extensions():
+    return sorted(_readers)
+
+
+def input_kind(ext):
+    """GUI input type for a file extension, or None if unsupported"""
+    spec = get_reader(ext)
+    return spec.kind if spec else None
+
+
+def extensions_of_kind(kind):
+    return [ext for ext, spec in sorted(_readers.items()) if spec.kind == kind]
+
+
+def targets():
+    return list(_writers)
+
+
+def modules():
+    """Every module a registered reader or writer lives in. They are only imported by name, so a
+    frozen build has to list them as hidden imports (see the release workflow)"""
+    return sorted({spec.module for spec in list(_readers.values()) + list(_writers.values())})
+
+
+def load_all():
+    """Import every registered converter up front (warm worker processes)"""
+    for spec in list(_readers.values()) + list(_writers.values()):
+        spec.load()
+
+
+def _pick(options, names):
+    return {k: v for k, v in options.items() if k in names}
+
+
+def read(path, ext, progress=None, **options):
+    """Open `path` with the reader registered for `ext`, passing only the options it takes.
+    Every reader accepts a progress.Progress"""
+    spec = get_reader(ext)
+    return spec.load()(path, progress=progress, **_pick(options, spec.options))
+
+
+def make_writer(target, pattern, vec_file, progress=None, **options):
+    """Writer for `target`; the returned callable lists the files it creates in .outputs"""
+    spec = get_writer(target)
+    return spec.load()(pattern, vec_file, spec.target, progress=progress, **_pick(options, spec.options))
+
+
+# -------------------- Built-in formats --------------------
+
+register_reader([".atp", ".pat"], "ate", "ate2vec", "read_pattern")
+register_reader([".stil"], "stil", "stil2vec", "read_pattern")
+register_reader([".vcd"], "vcd", "vcd2vec", "read_pattern", options=("interval",))
+register_reader([".vec"], "vec", "vec2ate", "read_pattern", options=("start", "stop"), intermediate=False)
+register_reader([".vecb"], "vec", "vecb", "read_pattern", options=("start", "stop"), intermediate=False)
+
+register_writer("VEC", ".vec", "pattern", "vec_writer", options=("start", "stop"))
+register_writer("VECB", ".vecb", "vecb", "vecb_writer", options=("start", "stop"))
+register_writer("STATS", ".stats.json", "patstats", "stats_writer", options=("start", "stop"))
+register_writer("VCD", ".vcd", "vec2vcd", "vcd_writer", options=("start", "stop"))
+register_writer("STIL", ".stil", "vec2stil", "stil_writer", options=("start", "stop"))
+for _ate in ["J750", "C3380", "C3850"]:
+    register_writer(_ate, ".atp" if _ate == "J750" else ".pat", "vec2ate", "ate_writer",
+                    options=("dec_file", "start", "stop", "script_ver", "workers"))
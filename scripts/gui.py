@@ -1,16 +1,29 @@
 # gui.py
+import time
+_LOADED = time.time()   # --startup-check falls back to this where the process start is unknown
 
 import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+from tkinter import filedialog, messagebox, simpledialog, ttk
 import os
+import sys
+import queue
+import importlib
+import threading
 import main
+import jobs
+import formats
+import preview
+from progress import CancelToken, Cancelled
 from metadata import info_text, script_ver, author as author_text
 import webbrowser
 import logger
-import builtins
 from datetime import datetime
 
 now = datetime.now()
+log = logger.get_logger("gui")
+
+# How often the Tk loop drains messages from the conversion worker
+POLL_MS = 100
 
 
 class ConverterGUI(tk.Tk):
@@ -27,6 +40,12 @@ class ConverterGUI(tk.Tk):
         self.dec_file = tk.StringVar()
         self.interval = None
         self.logging_enabled = tk.BooleanVar(value=False)
+        self.progress_text = tk.StringVar(value="")
+
+        # Background conversion: the worker thread only talks to Tk through this queue
+        self.messages = queue.Queue()
+        self.worker = None
+        self.cancel_token = None
 
         # Store radio buttons
         self.input_rbs = {}
@@ -34,21 +53,20 @@ class ConverterGUI(tk.Tk):
         self.convert_button = None
 
         self.title(f"VektorConverter v{script_ver}")
-        self.geometry("600x420")
+        self.geometry("600x480")
         self.resizable(False, False)
 
         self.create_widgets()
 
-        # Override print() for logging when checkbox is enabled
-        self.original_print = builtins.print
-        builtins.print = self.print_override
-
-        # Override status_var.set to log messages with timestamps
+        # Override status_var.set to log status messages
         self.original_status_set = self._wrap_status_set()
 
         # ---- Call cleanup logger on GUI close ----
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
+        self.batch_window = None
+        self.poll_id = self.after(POLL_MS, self.poll_worker)
+
     # -------------------- Create Widgets --------------------
     def create_widgets(self):
         # Vector File
@@ -102,13 +120,28 @@ class ConverterGUI(tk.Tk):
         )
         self.log_checkbox.pack(pady=5)
 
-        # Convert Button
-        self.convert_button = tk.Button(self, text="Convert", command=self.convert, state="disabled")
-        self.convert_button.pack(pady=10)
-
-        # About Button
-        self.about_button = tk.Button(self, text="About", command=self.show_about)
-        self.about_button.pack(pady=5)
+        # Convert / Cancel Buttons
+        frame_run = tk.Frame(self)
+        frame_run.pack(pady=10)
+        self.convert_button = tk.Button(frame_run, text="Convert", command=self.convert, state="disabled")
+        self.convert_button.pack(side="left", padx=5)
+        self.cancel_button = tk.Button(frame_run, text="Cancel", command=self.cancel_conversion, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+
+        # Progress Bar
+        self.progress_bar = ttk.Progressbar(self, orient="horizontal", length=400, mode="determinate", maximum=1.0)
+        self.progress_bar.pack(pady=(0, 2))
+        tk.Label(self, textvariable=self.progress_text).pack()
+
+        # Batch / About Buttons
+        frame_misc = tk.Frame(self)
+        frame_misc.pack(pady=5)
+        self.batch_button = tk.Button(frame_misc, text="Batch...", command=self.show_batch)
+        self.batch_button.pack(side="left", padx=5)
+        self.preview_button = tk.Button(frame_misc, text="Preview", command=self.show_preview)
+        self.preview_button.pack(side="left", padx=5)
+        self.about_button = tk.Button(frame_misc, text="About", command=self.show_about)
+        self.about_button.pack(side="left", padx=5)
 
         # Status Bar
         self.status_var = tk.StringVar(value="Ready")
@@ -124,23 +157,13 @@ class ConverterGUI(tk.Tk):
             logger.disable_file_logging()
             self.status_var.set("Logging disabled")
 
-    # -------------------- Override print --------------------
-    def print_override(self, *args, **kwargs):
-        self.original_print(*args, **kwargs)
-        if self.logging_enabled.get():
-            msg = " ".join(str(a) for a in args)
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            logger.log(f"{timestamp} | {msg}")
-
     # -------------------- Wrap status_var.set --------------------
     def _wrap_status_set(self):
         orig_set = self.status_var.set
 
         def new_set(value):
             orig_set(value)
-            if self.logging_enabled.get():
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                logger.log(f"{timestamp} | STATUS: {value}")
+            log.info(f"STATUS: {value}")
 
         self.status_var.set = new_set
         return orig_set
@@ -153,14 +176,9 @@ class ConverterGUI(tk.Tk):
         if file:
             self.input_file.set(file)
             ext = os.path.splitext(file)[1].lower()
-            if ext in [".atp", ".pat"]:
-                self.input_type.set("ate")
-            elif ext == ".stil":
-                self.input_type.set("stil")
-            elif ext == ".vcd":
-                self.input_type.set("vcd")
-            elif ext == ".vec":
-                self.input_type.set("vec")
+            kind = formats.input_kind(ext)
+            if kind:
+                self.input_type.set(kind)
             else:
                 self.status_var.set("ERROR")
                 messagebox.showerror("Error", f"Unsupported file type: {ext}")
@@ -213,6 +231,8 @@ class ConverterGUI(tk.Tk):
 
     # -------------------- Convert button --------------------
     def convert(self):
+        if self.worker is not None:
+            return
         file_path = self.input_file.get().strip()
         if not file_path or not os.path.isfile(file_path):
             messagebox.showerror("Error", "Please select a valid input file")
@@ -222,13 +242,7 @@ class ConverterGUI(tk.Tk):
         input_type = self.input_type.get()
         output_type = self.output_type.get().upper()
 
-        valid_ext = {
-            "ate": [".atp", ".pat"],
-            "stil": [".stil"],
-            "vcd": [".vcd"],
-            "vec": [".vec"]
-        }
-        if input_ext not in valid_ext.get(input_type, []):
+        if input_ext not in formats.extensions_of_kind(input_type):
             messagebox.showerror("Error", f"Selected file ({input_ext}) does not match input type {input_type.upper()}")
             self.status_var.set("ERROR")
             return
@@ -256,24 +270,114 @@ class ConverterGUI(tk.Tk):
                 return
 
         dec_file_full_path = self.dec_file.get() or None
-        dec_file_path = f"./{os.path.basename(dec_file_full_path)}"
-
-        try:
-            main.run_conversion(file_path, ate_type=output_type, dec_file=dec_file_path, interval=interval)
+        dec_file_path = f"./{os.path.basename(dec_file_full_path)}" if dec_file_full_path else None
+
+        self.start_worker(file_path, output_type, dec_file_path, interval)
+
+    # -------------------- Background conversion --------------------
+    def start_worker(self, file_path, output_type, dec_file_path, interval):
+        """Run main.run_conversion on a worker thread; results come back through self.messages"""
+        self.cancel_token = CancelToken()
+
+        def on_progress(info):
+            self.messages.put(("progress", info))
+
+        def run():
+            try:
+                main.run_conversion(file_path, ate_type=output_type, dec_file=dec_file_path, interval=interval,
+                                    progress=on_progress, cancel=self.cancel_token)
+                self.messages.put(("done", None))
+            except Cancelled:
+                self.messages.put(("cancelled", None))
+            except Exception as e:
+                self.messages.put(("error", e))
+
+        self.set_running(True)
+        self.status_var.set(f"Converting {os.path.basename(file_path)}...")
+        self.worker = threading.Thread(target=run, daemon=True)
+        self.worker.start()
+
+    def poll_worker(self):
+        """Runs every POLL_MS for the life of the window"""
+        while True:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.show_progress(value)
+            else:
+                self.finish_worker(kind, value)
+        self.poll_id = self.after(POLL_MS, self.poll_worker)
+
+    def show_progress(self, info):
+        self.progress_bar["value"] = info.fraction
+        text = f"{info.stage}: {info.vectors:,} vectors  {info.rate:,.0f} vec/s"
+        if info.eta is not None:
+            text += f"  ETA {info.eta:.0f} s"
+        self.progress_text.set(text)
+
+    def finish_worker(self, kind, error):
+        self.worker = None
+        self.set_running(False)
+        if kind == "done":
+            self.progress_bar["value"] = 1.0
             self.status_var.set("Conversion completed successfully!")
             messagebox.showinfo("Success", "Conversion completed successfully!")
-        except Exception as e:
+        elif kind == "cancelled":
+            self.progress_bar["value"] = 0.0
+            self.progress_text.set("")
+            self.status_var.set("Conversion cancelled")
+        else:
             self.status_var.set("ERROR")
-            messagebox.showerror("Error", f"Conversion failed:\n{e}")
+            messagebox.showerror("Error", f"Conversion failed:\n{error}")
+
+    def cancel_conversion(self):
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+            self.status_var.set("Cancelling...")
+
+    def set_running(self, running):
+        """Lock the inputs of a running conversion; the window itself stays responsive"""
+        self.convert_button.config(state="disabled" if running else "normal")
+        self.cancel_button.config(state="normal" if running else "disabled")
+        self.log_checkbox.config(state="disabled" if running else "normal")
+        if running:
+            self.progress_bar["value"] = 0.0
+            self.progress_text.set("")
+        else:
+            self.check_dec_requirement()
 
     # -------------------- Close window --------------------
     def on_close(self):
-        if self.logging_enabled.get():
-            logger.disable_file_logging()
-        builtins.print = self.original_print
+        if self.worker is not None:
+            self.cancel_token.cancel()
+            self.worker.join(timeout=5)
+        if self.batch_window is not None and self.batch_window.winfo_exists():
+            self.batch_window.on_close()
+        self.after_cancel(self.poll_id)
         self.status_var.set = self.original_status_set
+        # flushes whatever the file listener still has queued
+        logger.close_logger()
         self.destroy()
 
+    # -------------------- Batch window --------------------
+    def show_batch(self):
+        if self.batch_window is None or not self.batch_window.winfo_exists():
+            self.batch_window = BatchWindow(self)
+        self.batch_window.lift()
+
+    # -------------------- Preview window --------------------
+    def show_preview(self):
+        file_path = self.input_file.get().strip()
+        if not file_path or not os.path.isfile(file_path):
+            messagebox.showerror("Error", "Please select a valid input file")
+            return
+        if not preview.supported(file_path):
+            messagebox.showerror("Error", "Preview supports .vec, .atp and .pat files")
+            return
+        PreviewWindow(self, file_path)
+
     # -------------------- About window --------------------
     def show_about(self):
         try:
@@ -303,6 +407,351 @@ class ConverterGUI(tk.Tk):
         tk.Button(about_win, text="Close", command=about_win.destroy).pack(pady=10)
 
 
+# -------------------- Batch window --------------------
+class BatchWindow(tk.Toplevel):
+    """Job list for converting many files or whole folders on a pool of workers"""
+
+    COLUMNS = (("file", "File", 260), ("output", "Output", 60), ("status", "Status", 90),
+               ("time", "Time", 60), ("error", "Error", 260))
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title("Batch Conversion")
+        self.geometry("780x440")
+
+        self.updates = queue.Queue()
+        self.job_queue = jobs.JobQueue(on_update=self.updates.put)
+        self.jobs_by_row = {}
+
+        self.target = tk.StringVar(value="J750")
+        self.dec_file = tk.StringVar(value=master.dec_file.get())
+        self.interval = tk.IntVar(value=41665)
+        self.workers = tk.IntVar(value=jobs.DEFAULT_WORKERS)
+
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.poll_id = self.after(POLL_MS, self.poll_jobs)
+
+    def create_widgets(self):
+        # Options for newly added (or selected) jobs
+        frame_opt = tk.Frame(self)
+        frame_opt.pack(fill="x", padx=5, pady=5)
+        tk.Label(frame_opt, text="Output:").pack(side="left")
+        ttk.Combobox(frame_opt, textvariable=self.target, values=["VEC", "J750", "C3380"], width=7,
+                     state="readonly").pack(side="left", padx=(0, 10))
+        tk.Label(frame_opt, text="Dec File:").pack(side="left")
+        tk.Entry(frame_opt, textvariable=self.dec_file, width=24).pack(side="left")
+        tk.Button(frame_opt, text="...", command=self.browse_dec_file).pack(side="left", padx=(0, 10))
+        tk.Label(frame_opt, text="VCD interval:").pack(side="left")
+        tk.Spinbox(frame_opt, textvariable=self.interval, from_=1, to=10 ** 9, width=8).pack(side="left", padx=(0, 10))
+        tk.Label(frame_opt, text="Workers:").pack(side="left")
+        tk.Spinbox(frame_opt, textvariable=self.workers, from_=1, to=os.cpu_count() or 1, width=3).pack(side="left")
+
+        frame_btn = tk.Frame(self)
+        frame_btn.pack(fill="x", padx=5)
+        for text, command in (("Add Files...", self.add_files), ("Add Folder...", self.add_folder),
+                              ("Apply Options", self.apply_options), ("Remove", self.remove_selected),
+                              ("Run", self.run_jobs), ("Retry Failed", self.retry_failed),
+                              ("Cancel", self.job_queue.cancel_all)):
+            tk.Button(frame_btn, text=text, command=command).pack(side="left", padx=2)
+
+        # Job table
+        frame_tbl = tk.Frame(self)
+        frame_tbl.pack(fill="both", expand=True, padx=5, pady=5)
+        self.table = ttk.Treeview(frame_tbl, columns=[c[0] for c in self.COLUMNS], show="headings")
+        for name, heading, width in self.COLUMNS:
+            self.table.heading(name, text=heading)
+            self.table.column(name, width=width, anchor="w")
+        scroll = ttk.Scrollbar(frame_tbl, orient="vertical", command=self.table.yview)
+        self.table.configure(yscrollcommand=scroll.set)
+        self.table.pack(side="left", fill="both", expand=True)
+        scroll.pack(side="right", fill="y")
+
+        self.summary = tk.StringVar(value="Add files or a folder")
+        tk.Label(self, textvariable=self.summary, anchor="w").pack(fill="x", padx=5, pady=(0, 5))
+
+    # ---------- job list ----------
+    def job_options(self):
+        dec = self.dec_file.get()
+        try:
+            interval = self.interval.get()
+        except tk.TclError:
+            interval = None
+        return self.target.get(), f"./{os.path.basename(dec)}" if dec else None, interval
+
+    def add_paths(self, paths):
+        target, dec, interval = self.job_options()
+        files = jobs.find_inputs(paths)
+        for path in files:
+            job = jobs.Job(path, target, dec, interval)
+            self.jobs_by_row[self.table.insert("", "end", iid=str(job.id))] = job
+            self.job_queue.add(job)
+        self.summary.set(f"{len(files)} file(s) added")
+
+    def add_files(self):
+        self.add_paths(filedialog.askopenfilenames(parent=self, title="Select input files"))
+
+    def add_folder(self):
+        folder = filedialog.askdirectory(parent=self, title="Select folder")
+        if folder:
+            self.add_paths([folder])
+
+    def browse_dec_file(self):
+        dec_file = filedialog.askopenfilename(parent=self, title="Select DEC file", filetypes=[("DEC files", "*.dec")])
+        if dec_file:
+            self.dec_file.set(dec_file)
+
+    def selected_jobs(self):
+        return [self.jobs_by_row[row] for row in self.table.selection()]
+
+    def apply_options(self):
+        target, dec, interval = self.job_options()
+        for job in self.selected_jobs():
+            if job.status != jobs.RUNNING:
+                job.target, job.dec_file, job.interval = target.upper(), dec, interval
+                self.show_job(job)
+
+    def remove_selected(self):
+        for job in self.selected_jobs():
+            if self.job_queue.remove(job):
+                self.table.delete(str(job.id))
+                del self.jobs_by_row[str(job.id)]
+
+    def run_jobs(self):
+        try:
+            workers = max(1, self.workers.get())
+        except tk.TclError:
+            workers = jobs.DEFAULT_WORKERS
+        self.job_queue.start(workers)
+
+    def retry_failed(self):
+        for job in self.job_queue.jobs:
+            self.job_queue.retry(job)
+        self.run_jobs()
+
+    # ---------- updates from the workers ----------
+    def show_job(self, job):
+        status = job.status
+        if status == jobs.RUNNING and job.progress is not None:
+            status = f"running {job.progress.fraction:.0%}"
+        duration = f"{job.duration:.1f} s" if job.duration is not None else ""
+        self.table.item(str(job.id), values=(job.path, job.target, status, duration, job.error or ""))
+
+    def poll_jobs(self):
+        changed = {}
+        while True:
+            try:
+                job = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            changed[job.id] = job
+        for job in changed.values():
+            if self.table.exists(str(job.id)):
+                self.show_job(job)
+        if changed:
+            counts = {}
+            for job in self.job_queue.jobs:
+                counts[job.status] = counts.get(job.status, 0) + 1
+            self.summary.set("  ".join(f"{k}: {v}" for k, v in sorted(counts.items())))
+        self.poll_id = self.after(POLL_MS, self.poll_jobs)
+
+    def on_close(self):
+        self.job_queue.close()
+        self.after_cancel(self.poll_id)
+        self.destroy()
+
+
+# -------------------- Preview window --------------------
+class PreviewWindow(tk.Toplevel):
+    """Pin header plus a scrollable vector grid; only the rows on screen are read from the file"""
+
+    VISIBLE_ROWS = 30
+    NUM_WIDTH = 10
+
+    def __init__(self, master, path):
+        super().__init__(master)
+        self.title(f"Preview - {os.path.basename(path)}")
+        self.index = preview.LazyVectorIndex(path)
+        self.pins = preview.read_pins(path)
+        self.top = 0
+        self.closed = False
+        self.pending = False    # rows on screen not indexed yet
+
+        self.create_widgets()
+        self.show_header()
+        self.render()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Finish the index in the background so the scrollbar becomes exact
+        threading.Thread(target=self.index_in_background, daemon=True).start()
+        self.poll_id = self.after(POLL_MS, self.poll_index)
+
+    def create_widgets(self):
+        font = "TkFixedFont"
+        header_rows = max((len(p) for p in self.pins), default=0)
+        self.header = tk.Text(self, height=max(header_rows, 1), width=100, wrap="none", font=font)
+        self.body = tk.Text(self, height=self.VISIBLE_ROWS, width=100, wrap="none", font=font)
+        self.vbar = tk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.hbar = tk.Scrollbar(self, orient="horizontal", command=self.on_xscroll)
+        self.body.configure(xscrollcommand=self.hbar.set)
+        self.status = tk.StringVar()
+
+        self.header.grid(row=0, column=0, sticky="ew")
+        self.body.grid(row=1, column=0, sticky="nsew")
+        self.vbar.grid(row=1, column=1, sticky="ns")
+        self.hbar.grid(row=2, column=0, sticky="ew")
+        tk.Label(self, textvariable=self.status, anchor="w").grid(row=3, column=0, columnspan=2, sticky="ew")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        for widget in (self.body, self.header):
+            widget.bind("<MouseWheel>", lambda e: self.scroll_by(-1 if e.delta > 0 else 1, "units"))
+            widget.bind("<Button-4>", lambda e: self.scroll_by(-1, "units"))
+            widget.bind("<Button-5>", lambda e: self.scroll_by(1, "units"))
+        self.bind("<Prior>", lambda e: self.scroll_by(-1, "pages"))
+        self.bind("<Next>", lambda e: self.scroll_by(1, "pages"))
+        self.bind("<Home>", lambda e: self.on_scroll("moveto", 0))
+        self.bind("<End>", lambda e: self.on_scroll("moveto", 1))
+
+    def show_header(self):
+        """Pin names written top-down, one character per row, above their vector column"""
+        rows = max((len(p) for p in self.pins), default=0)
+        pad = " " * (self.NUM_WIDTH + 1)
+        lines = [pad + "".join(p[r] if r < len(p) else " " for p in self.pins) for r in range(rows)]
+        self.header.insert("1.0", "\n".join(lines) or pad + "(no pin names found)")
+        self.header.config(state="disabled")
+
+    def render(self):
+        # the background thread does all the scanning; rows it has not reached yet get a placeholder
+        # and are drawn by poll_index once indexed
+        rows = self.index.rows(self.top, self.VISIBLE_ROWS, wait=False)
+        if rows == [] and self.top:
+            # the estimated length was too long: snap back to the real end
+            self.top = max(self.index.count - self.VISIBLE_ROWS, 0)
+            rows = self.index.rows(self.top, self.VISIBLE_ROWS, wait=False)
+        self.pending = rows is None
+        if self.pending:
+            text = f"{'':>{self.NUM_WIDTH}} (indexing up to vector {self.top + self.VISIBLE_ROWS:,}...)"
+        else:
+            text = "\n".join(f"{num:>{self.NUM_WIDTH}} {bits}  {'// ' + comment if comment else ''}"
+                             for num, bits, comment in rows)
+        self.body.config(state="normal")
+        self.body.delete("1.0", "end")
+        self.body.insert("1.0", text)
+        self.body.config(state="disabled")
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = max(self.index.estimated_count(), 1)
+        self.vbar.set(self.top / total, min((self.top + self.VISIBLE_ROWS) / total, 1.0))
+        state = "" if self.index.complete else " (indexing...)"
+        approx = "" if self.index.complete else "~"
+        self.status.set(f"Vectors {self.top:,}-{self.top + self.VISIBLE_ROWS - 1:,} of {approx}{total:,}{state}"
+                        f"  |  {len(self.pins)} pins")
+
+    def move_to(self, top):
+        last = max(self.index.estimated_count() - self.VISIBLE_ROWS, 0)
+        top = min(max(int(top), 0), last)
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def scroll_by(self, n, what):
+        self.move_to(self.top + n * (self.VISIBLE_ROWS if what == "pages" else 1))
+
+    def on_scroll(self, *args):
+        if args[0] == "moveto":
+            self.move_to(float(args[1]) * self.index.estimated_count())
+        elif args[0] == "scroll":
+            self.scroll_by(int(args[1]), args[2])
+
+    def on_xscroll(self, *args):
+        self.body.xview(*args)
+        self.header.xview(*args)
+
+    def index_in_background(self):
+        while not self.closed and not self.index.scan_some():
+            pass
+
+    def poll_index(self):
+        complete = self.index.complete
+        if self.pending and self.index.ready(self.top, self.VISIBLE_ROWS):
+            self.render()
+        self.update_scrollbar()
+        if not complete:
+            self.poll_id = self.after(POLL_MS * 2, self.poll_index)
+
+    def on_close(self):
+        self.closed = True
+        self.after_cancel(self.poll_id)
+        self.index.close()
+        self.destroy()
+
+
+# -------------------- Startup check --------------------
+# Converters are loaded through formats.py on first use; none may be imported at startup
+STARTUP_BUDGET_S = 3.0
+
+
+def process_start():
+    """When this process was created (time.time() scale), so startup includes interpreter start-up
+    and every import. In a one-file build this is the unpacked child; the release workflow also
+    times the whole executable from outside"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            times = [wintypes.FILETIME() for _ in range(4)]
+            kernel32 = ctypes.windll.kernel32
+            if kernel32.GetProcessTimes(kernel32.GetCurrentProcess(), *[ctypes.byref(t) for t in times]):
+                created = times[0].dwHighDateTime << 32 | times[0].dwLowDateTime    # 100 ns since 1601
+                return created / 1e7 - 11644473600
+        elif os.path.exists("/proc/self/stat"):
+            with open("/proc/self/stat") as f:
+                ticks = int(f.read().rsplit(")", 1)[1].split()[19])                # starttime, after boot
+            with open("/proc/uptime") as f:
+                uptime = float(f.read().split()[0])
+            return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    return _LOADED
+
+
+def startup_check(report=None):
+    """Build the main window, then report time-to-window from process start, any converter loaded
+    too early and any registered converter that cannot be imported (a frozen build missing a hidden
+    import). Used by the release workflow on the frozen executable:
+    `VektorConverter.exe --startup-check startup.txt` (a windowed build has no console)"""
+    start = process_start()
+    app = ConverterGUI()
+    app.update()
+    elapsed = time.time() - start
+    app.on_close()
+
+    # pattern is the shared data model main.py imports anyway
+    eager = [m for m in formats.modules() if m != "pattern" and m in sys.modules]
+    missing = []
+    for module in formats.modules():
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            missing.append(f"{module} ({e})")
+
+    lines = [f"Startup: {elapsed * 1000:.0f} ms from process start (budget {STARTUP_BUDGET_S * 1000:.0f} ms)"]
+    if eager:
+        lines.append(f"ERROR: converters imported at startup: {', '.join(eager)}")
+    if missing:
+        lines.append(f"ERROR: converters missing from this build: {', '.join(missing)}")
+    print("\n".join(lines))
+    if report:
+        with open(report, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return 0 if elapsed <= STARTUP_BUDGET_S and not eager and not missing else 1
+
+
 if __name__ == "__main__":
+    if "--startup-check" in sys.argv:
+        args = sys.argv[sys.argv.index("--startup-check") + 1:]
+        sys.exit(startup_check(args[0] if args else None))
     app = ConverterGUI()
     app.mainloop()
@@ -0,0 +1,210 @@
+# jobs.py
+import os
+import time
+import itertools
+import threading
+import main
+import formats
+from progress import CancelToken, Cancelled
+
+# Batch conversion: a list of Jobs run by a pool of worker threads.
+# Jobs whose outputs would collide (x.atp and x.pat both write x.vec/x.cmf) never run at the same time.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+DEFAULT_WORKERS = 2
+
+_ids = itertools.count(1)
+
+
+class Job:
+    """One input file plus its conversion options"""
+
+    def __init__(self, path, target="VEC", dec_file=None, interval=None):
+        self.id = next(_ids)
+        self.path = path
+        self.target = target.upper()
+        self.dec_file = dec_file
+        self.interval = interval
+        self.status = QUEUED
+        self.error = None
+        self.duration = None
+        self.progress = None    # last progress.ProgressInfo
+        self.cancel = None
+
+    @property
+    def base(self):
+        """Output files are written next to the input under this name"""
+        return os.path.splitext(os.path.abspath(self.path))[0]
+
+
+def find_inputs(paths):
+    """Expand files and directories (recursively) into the supported input files, sorted"""
+    exts = set(formats.input_extensions())
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                found += [os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in exts]
+        elif os.path.splitext(path)[1].lower() in exts:
+            found.append(path)
+    return sorted(found)
+
+
+def check_job(job):
+    """Reason the job cannot run as configured, or None"""
+    ext = os.path.splitext(job.path)[1].lower()
+    reader = formats.get_reader(ext)
+    if not os.path.isfile(job.path):
+        return "File not found"
+    if reader is None:
+        return f"Unsupported file type: {ext}"
+    if formats.get_writer(job.target) is None:
+        return f"Unknown output type: {job.target}"
+    if (ext, job.target) in ((".atp", "J750"), (".pat", "C3380"), (".vec", "VEC")):
+        return "Same file type conversion is not allowed"
+    if job.target == "VEC" and not reader.intermediate:
+        return "Vec output needs an ATE/STIL/VCD input"
+    if job.target in ("C3380", "C3850") and not job.dec_file:
+        return "DEC file required"
+    if "interval" in reader.options and not job.interval:
+        return "VCD interval required"
+    return None
+
+
+class JobQueue:
+    """Runs queued jobs on up to `workers` threads.
+
+    on_update(job) is called from the worker threads whenever a job changes status or reports
+    progress; GUIs must hand it over to their own thread."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, on_update=None):
+        self.jobs = []
+        self.workers = workers
+        self.on_update = on_update
+        self._cond = threading.Condition()
+        self._busy = set()          # output bases of running jobs
+        self._slots = {}            # worker slot -> its thread; slots >= workers retire after their job
+        self._closed = False
+
+    def add(self, job):
+        with self._cond:
+            self.jobs.append(job)
+            self._cond.notify_all()
+        self._update(job)
+        return job
+
+    def remove(self, job):
+        with self._cond:
+            if job.status != RUNNING and job in self.jobs:
+                self.jobs.remove(job)
+                return True
+        return False
+
+    def retry(self, job):
+        """Queue a failed or cancelled job again"""
+        with self._cond:
+            if job.status not in (FAILED, CANCELLED):
+                return False
+            job.status, job.error, job.duration, job.progress = QUEUED, None, None, None
+            self._cond.notify_all()
+        self._update(job)
+        return True
+
+    def start(self, workers=None):
+        """Start (or resize) the pool; queued jobs begin running"""
+        with self._cond:
+            if workers:
+                self.workers = workers
+            for slot in range(self.workers):
+                if slot not in self._slots:
+                    t = threading.Thread(target=self._work, args=(slot,), daemon=True)
+                    self._slots[slot] = t
+                    t.start()
+            self._cond.notify_all()
+
+    def cancel_all(self):
+        """Cancel running jobs and take queued ones off the queue"""
+        with self._cond:
+            for job in self.jobs:
+                if job.status == QUEUED:
+                    job.status = CANCELLED
+                elif job.status == RUNNING and job.cancel is not None:
+                    job.cancel.cancel()
+            queued = [j for j in self.jobs if j.status == CANCELLED]
+        for job in queued:
+            self._update(job)
+
+    def close(self):
+        self.cancel_all()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def idle(self):
+        with self._cond:
+            return not any(j.status in (QUEUED, RUNNING) for j in self.jobs)
+
+    def wait(self):
+        with self._cond:
+            while any(j.status in (QUEUED, RUNNING) for j in self.jobs):
+                self._cond.wait()
+
+    # ---------- worker side ----------
+
+    def _update(self, job):
+        if self.on_update is not None:
+            self.on_update(job)
+
+    def _next_job(self):
+        for job in self.jobs:
+            if job.status == QUEUED and job.base not in self._busy:
+                return job
+        return None
+
+    def _work(self, slot):
+        while True:
+            with self._cond:
+                job = None
+                while not self._closed and slot < self.workers:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    # free the slot under the lock, so a later start() fills it again
+                    del self._slots[slot]
+                    return
+                job.status = RUNNING
+                job.cancel = CancelToken()
+                self._busy.add(job.base)
+            self._run(job)
+            with self._cond:
+                self._busy.discard(job.base)
+                self._cond.notify_all()
+
+    def _run(self, job):
+        self._update(job)
+        t0 = time.monotonic()
+        error = check_job(job)
+        status = FAILED if error else DONE
+
+        def on_progress(info):
+            job.progress = info
+            self._update(job)
+
+        if error is None:
+            try:
+                main.run_conversion(job.path, job.target, job.dec_file, job.interval,
+                                    progress=on_progress, cancel=job.cancel)
+            except Cancelled:
+                status = CANCELLED
+            except Exception as e:
+                status, error = FAILED, str(e) or type(e).__name__
+        job.duration = time.monotonic() - t0
+        job.status, job.error = status, error
+        self._update(job)
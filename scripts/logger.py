@@ -1,79 +1,99 @@
 #logger.py
 import sys
+import atexit
+import queue
 import logging
-from logging import StreamHandler
-from datetime import datetime, timedelta
-import os
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# All modules log through children of the "vektor" logger (get_logger("vec2ate") -> "vektor.vec2ate").
+# Console output is written directly so CLI messages keep their order with print()/input();
+# the log file is fed through a queue and written by a QueueListener thread, so file I/O never
+# runs on the conversion thread. Retention is done by rotating the file at midnight and keeping
+# LOG_RETENTION_DAYS old files, so startup never has to read the log.
 
 LOG_FILE = "app.log"
 LOG_RETENTION_DAYS = 7
+ROOT = "vektor"
+
+_logger = logging.getLogger(ROOT)
+# Library use without init_logger() (benchmarks, patdiff) stays silent
+_logger.addHandler(logging.NullHandler())
+_logger.propagate = False
 
-_logger = None
-_file_handler = None
+_queue_handler = None
+_listener = None
+_listener_running = False
 _logger_initialized = False
 
-def cleanup_old_logs():
-    if not os.path.exists(LOG_FILE):
-        return
 
-    new_lines = []
-    cutoff = datetime.now() - timedelta(days=LOG_RETENTION_DAYS)
-    with open(LOG_FILE, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                ts_str = line.split(" | ")[0]
-                ts = datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S")
-                if ts >= cutoff:
-                    new_lines.append(line)
-            except:
-                continue
-    with open(LOG_FILE, "w", encoding="utf-8") as f:
-        f.writelines(new_lines)
+class ConsoleFormatter(logging.Formatter):
+    """Plain messages, with the ERROR:/WARNING: prefix the converters always printed"""
+
+    def format(self, record):
+        msg = super().format(record)
+        if record.levelno >= logging.WARNING:
+            return f"{record.levelname}: {msg}"
+        return msg
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT}.{name}")
+
 
 def init_logger():
     """Initialize logger (console always on, file optional)"""
-    global _logger, _file_handler, _logger_initialized
+    global _queue_handler, _listener, _logger_initialized
     if _logger_initialized:
         return
 
-    cleanup_old_logs()
-
-    _logger = logging.getLogger("VektorLogger")
     _logger.setLevel(logging.INFO)
-    _logger.handlers.clear()
 
-    console_handler = StreamHandler(sys.stdout)
-    formatter = logging.Formatter("%(asctime)s | %(message)s", "%Y-%m-%d %H:%M:%S")
-    console_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(ConsoleFormatter("%(message)s"))
     _logger.addHandler(console_handler)
 
-    # File handler (disabled by default)
-    _file_handler = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8")
-    _file_handler.setFormatter(formatter)
+    # File handler (disabled by default); opened on the first record
+    file_handler = TimedRotatingFileHandler(LOG_FILE, when="midnight", backupCount=LOG_RETENTION_DAYS,
+                                            encoding="utf-8", delay=True)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+                                                "%Y-%m-%d %H:%M:%S"))
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    _listener = QueueListener(_queue_handler.queue, file_handler)
 
+    atexit.register(close_logger)
     _logger_initialized = True
 
+
+def _start_listener():
+    global _listener_running
+    if not _listener_running:
+        _listener.start()
+        _listener_running = True
+
+
 def enable_file_logging():
-    global _logger, _file_handler
-    if _logger and _file_handler and _file_handler not in _logger.handlers:
-        _logger.addHandler(_file_handler)
+    if _queue_handler is not None and _queue_handler not in _logger.handlers:
+        _start_listener()
+        _logger.addHandler(_queue_handler)
+
 
 def disable_file_logging():
-    global _logger, _file_handler
-    if _logger and _file_handler and _file_handler in _logger.handlers:
-        _logger.removeHandler(_file_handler)
+    if _queue_handler is not None and _queue_handler in _logger.handlers:
+        _logger.removeHandler(_queue_handler)
 
-def log(msg):
-    global _logger
-    if _logger:
-        _logger.info(msg)
 
 def close_logger():
-    global _logger, _file_handler
-    if _logger:
-        for handler in _logger.handlers[:]:
-            try:
-                handler.close()
-            except:
-                pass
+    """Flush queued records to the file and close all handlers"""
+    global _logger_initialized, _listener_running
+    disable_file_logging()
+    if _listener_running:
+        _listener.stop()
+        _listener_running = False
+    if _listener is not None:
+        for handler in _listener.handlers:
+            handler.close()
+    for handler in _logger.handlers[:]:
+        if not isinstance(handler, logging.NullHandler):
+            handler.close()
             _logger.removeHandler(handler)
+    _logger_initialized = False
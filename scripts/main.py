@@ -1,109 +1,215 @@
 # main.py
 import os
-from datetime import datetime
-import ate2vec
-import stil2vec
-import vcd2vec
-import vec2ate
+import formats
 import metadata
+import pipeline
+import logger
+from pattern import fan_out
+from progress import Progress, Cancelled, MemoryBudgetExceeded, track_blocks, remove_outputs
 
 author = metadata.author
 sub_script_ver = metadata.script_ver
+log = logger.get_logger("main")
 
-def run_conversion(file_path, ate_type=None, dec_file=None, interval=None):
+
+def _split_targets(ate_type):
+    """ate_type as given (None, one name or a list) -> list of upper-case target names"""
+    if not ate_type:
+        return []
+    if isinstance(ate_type, str):
+        return [ate_type.upper()]
+    return [t.upper() for t in ate_type]
+
+
+def run_conversion(file_path, ate_type=None, dec_file=None, interval=None, vector_range=None,
+                   progress=None, cancel=None, profile=None, workers=None, memory_budget=None, transform_rules=None,
+                   incremental=False):
     """
     file_path: str, path to input file
-    ate_type: str, J750/C3380/C3850, only for vec->ATE conversion
+    ate_type: str or list of str, any target registered in formats.py (VEC/VECB/STATS/VCD/STIL/J750/C3380/C3850);
+              the input is parsed once and every requested target is written from that single parse
     dec_file: str, only needed for Chroma vec2ate conversion
     interval: int, only for VCD->VEC
+    vector_range: (start, stop) tuple, only for vec->ATE conversion of part of a .vec
+    progress: callable(progress.ProgressInfo), called a few times per second with bytes read,
+              vectors processed, throughput and ETA
+    cancel: progress.CancelToken; cancelling stops the conversion at the next block, removes
+            partial outputs and raises progress.Cancelled
+    profile: True or a profiler.Profiler to time each stage (parse, sample, sanitize, format,
+             write); the profiler.ProfileReport is then returned
+    workers: ATE targets format their vectors on this many processes (0 = all cores)
+    memory_budget: MB; every input/output pair streams, and the conversion is stopped with
+                   progress.MemoryBudgetExceeded (partial outputs removed) if the process grows past it
+    transform_rules: transform.py rules (mask/force/invert/swap/map) applied to the vectors before
+                     every writer, including the .vec an ATE/STIL/VCD input leaves
+    incremental: for a whole .vec input, ATE targets only re-format the chunks that changed since
+                 the last incremental run and splice them into the previous output (vecsplice.py)
+    Returns the list of files written (the ProfileReport when profiling), or None if nothing ran.
     """
     if not os.path.exists(file_path):
-        print(f"ERROR: Path '{file_path}' does not exist")
+        log.error(f"Path '{file_path}' does not exist")
         return
 
     ext = os.path.splitext(file_path)[1].lower()
+    reader = formats.get_reader(ext)
+    if reader is None:
+        log.error(f"Unsupported file type: {ext}")
+        return
+
+    targets = _split_targets(ate_type)
+    if not targets and not reader.intermediate:
+        targets = _split_targets(input("Enter ATE type (J750,C3380,C3850): ").strip())
+    for t in targets:
+        if formats.get_writer(t) is None:
+            log.error(f"Unknown ATE type '{t}'")
+    targets = [t for t in targets if formats.get_writer(t)]
+
+    if "interval" in reader.options and interval is None:
+        while True:
+            try:
+                interval = int(input("Enter timing interval (ns, e.g. 41665): ").strip())
+                if interval <= 0:
+                    raise ValueError
+                break
+            except ValueError:
+                print("Invalid input. Enter a positive integer for interval.")
+
+    spliced = []
+    if incremental and ext == ".vec" and vector_range is None and not transform_rules and not profile:
+        import vecsplice
+        for t in [t for t in targets if formats.get_writer(t).module == "vec2ate"]:
+            spliced.append(vecsplice.convert_incremental(file_path, t, dec_file, script_ver=sub_script_ver)[0])
+            targets.remove(t)
+        if not targets:
+            return spliced
+
+    if not profile:
+        _, outputs = _convert(file_path, ext, reader, targets, dec_file, interval, vector_range, progress, cancel,
+                              workers=workers, memory_budget=memory_budget, transform_rules=transform_rules)
+        return spliced + outputs
+
+    import profiler
+    prof = profile if isinstance(profile, profiler.Profiler) else profiler.Profiler()
+    prof.start()
+    try:
+        tracker, outputs = _convert(file_path, ext, reader, targets, dec_file, interval, vector_range,
+                                    progress, cancel, prof, workers, memory_budget, transform_rules)
+    finally:
+        prof.stop()
+    prof.count("lines", tracker.lines)
+    prof.count("vectors", tracker.vector_count)
+    prof.count("bytes_in", os.path.getsize(file_path))
+    prof.count("bytes_out", sum(os.path.getsize(p) for p in outputs if os.path.exists(p)))
+    report = prof.report(file_path)
+    log.info(report)
+    return report
 
-    vec_file = None
-    cmf_file = None
-
-    # --- ATE input ---
-    if ext in [".atp", ".pat"]:
-        print(f"Processing {ext} file with ate2vec...")
-        vectors = ate2vec.parse_j750_atp_vectors(file_path) if ext == ".atp" else ate2vec.parse_chroma_pat_vectors(file_path)
-        pins = ate2vec.parse_j750_pins(file_path) if ext == ".atp" else ate2vec.parse_chroma_pins(file_path)
-        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        vec_file = os.path.join(os.path.dirname(file_path), base_name + ".vec")
-        cmf_file = os.path.join(os.path.dirname(file_path), base_name + ".cmf")
-        ate2vec.generate_vec_file(vectors, vec_file, os.path.basename(file_path), date)
-        ate2vec.generate_cmf_file(pins, cmf_file)
-        print(f"VEC file written: {vec_file}")
-        print(f"CMF file written: {cmf_file}")
-        print("ate2vec conversion done!")
-
-        # If ate_type is specified, convert vec -> ATE
-        if ate_type != "VEC":
-            #template_file = "J750_pat_template" if ate_type.upper() == "J750" else "Chroma_pat_template"
-            file_ext = ".atp" if ate_type.upper() == "J750" else ".pat"
-            print(f"Converting {vec_file} -> {ate_type} using vec2ate...")
-            vec2ate.convert_vec_file(vec_file, cmf_file, dec_file or "",
-                                     file_extension=file_ext,
-                                     ate_type=ate_type.upper(),
-                                     script_ver=sub_script_ver)
-            print("vec2ate conversion done!")
-
-    # --- STIL input ---
-    elif ext == ".stil":
-        print("Processing STIL file with stil2vec...")
-        vec_file, cmf_file = stil2vec.convert_stil_to_vec(file_path)
-        print(f"VEC file: {vec_file}, CMF file: {cmf_file}")
-        if ate_type != "VEC":
-            #template_file = vec2ate.J750_TEMPLATE if ate_type.upper() == "J750" else vec2ate.CHROMA_TEMPLATE
-            file_ext = ".atp" if ate_type.upper() == "J750" else ".pat"
-            print(f"Converting {vec_file} -> {ate_type} using vec2ate...")
-            vec2ate.convert_vec_file(vec_file, cmf_file, dec_file or "",
-                                     file_extension=file_ext,
-                                     ate_type=ate_type.upper(),
-                                     script_ver=sub_script_ver)
-            print("vec2ate conversion done!")
-
-    # --- VCD input ---
-    elif ext == ".vcd":
-        print("Processing VCD file with vcd2vec...")
-        if interval is None:
-            while True:
-                try:
-                    interval = int(input("Enter timing interval (ns, e.g. 41665): ").strip())
-                    if interval <= 0:
-                        raise ValueError
-                    break
-                except ValueError:
-                    print("Invalid input. Enter a positive integer for interval.")
-        vec_file, cmf_file = vcd2vec.convert_vcd_to_vec(file_path, interval)
-        print(f"VEC file: {vec_file}, CMF file: {cmf_file}")
-        if ate_type != "VEC":
-            #template_file = vec2ate.J750_TEMPLATE if ate_type.upper() == "J750" else vec2ate.CHROMA_TEMPLATE
-            file_ext = ".atp" if ate_type.upper() == "J750" else ".pat"
-            print(f"Converting {vec_file} -> {ate_type} using vec2ate...")
-            vec2ate.convert_vec_file(vec_file, cmf_file, dec_file or "",
-                                     file_extension=file_ext,
-                                     ate_type=ate_type.upper(),
-                                     script_ver=sub_script_ver)
-            print("vec2ate conversion done!")
-
-    # --- VEC input ---
-    elif ext == ".vec":
-        print("Converting .vec to ATE pattern using vec2ate...")
-        if not ate_type:
-            ate_type = input("Enter ATE type (J750,C3380,C3850): ").strip().upper()
-        cmf_file = os.path.splitext(file_path)[0] + ".cmf"
-        #template_file = vec2ate.J750_TEMPLATE if ate_type.upper() == "J750" else vec2ate.CHROMA_TEMPLATE
-        file_ext = ".atp" if ate_type.upper() == "J750" else ".pat"
-        vec2ate.convert_vec_file(file_path, cmf_file, dec_file or "",
-                                 file_extension=file_ext,
-                                 ate_type=ate_type.upper(),
-                                 script_ver=sub_script_ver)
-        print("vec2ate conversion done!")
 
+def _convert(file_path, ext, reader, targets, dec_file, interval, vector_range, progress, cancel, prof=None,
+             workers=None, memory_budget=None, transform_rules=None):
+    """Parse once and run every target writer; returns (Progress, output paths)"""
+    start, stop = vector_range or (None, None)
+    tracker = Progress(progress, cancel, total_bytes=os.path.getsize(file_path), memory_budget=memory_budget)
+    tracker.profiler = prof
+    tracker.set_stage("parse")
+    log.info(f"Processing {ext} file with {reader.module}...")
+    if prof:
+        with prof.stage("parse"):
+            pattern = formats.read(file_path, ext, progress=tracker, interval=interval, start=start, stop=stop)
     else:
-        print("Unsupported file type:", ext)
+        pattern = formats.read(file_path, ext, progress=tracker, interval=interval, start=start, stop=stop)
+    if transform_rules:
+        import transform
+        pattern = transform.apply_rules(pattern, transform_rules)
+    tracker.total_vectors = pattern.count or 0
+
+    if reader.intermediate:
+        # ATE/STIL/VCD inputs always leave their .vec/.cmf next to the input
+        vec_file = os.path.splitext(file_path)[0] + ".vec"
+        targets = ["VEC"] + [t for t in targets if t != "VEC"]
+        start = stop = None
+    else:
+        vec_file = file_path
+        if ext == ".vec" and vector_range is None:
+            targets = [t for t in targets if t != "VEC"]  # the input already is that .vec
+
+    writers = [formats.make_writer(t, pattern, vec_file, progress=tracker, dec_file=dec_file,
+                                   start=start, stop=stop, script_ver=sub_script_ver, workers=workers)
+               for t in targets]
+    # inputs are streamed, so a writer must never truncate the file being read
+    source = os.path.abspath(file_path)
+    for t, w in list(zip(targets, writers)):
+        if any(os.path.abspath(path) == source for path in w.outputs):
+            log.error(f"Skipping {t}: its output would overwrite the input")
+            targets.remove(t)
+            writers.remove(w)
+    outputs = [path for w in writers for path in w.outputs]
+    blocks = track_blocks(pattern.blocks, tracker)
+    if prof:
+        blocks = prof.iterate("parse", blocks)
+        writers = [prof.wrap("write", w) for w in writers]
+    if pipeline.enabled():
+        # parse on its own thread, a bounded number of blocks ahead of the writers
+        blocks = pipeline.prefetch(blocks)
+
+    tracker.set_stage("convert")
+    try:
+        if writers:
+            fan_out(blocks, writers)
+    except BaseException as e:
+        if isinstance(e, Cancelled):
+            log.info("Conversion cancelled")
+        remove_outputs(outputs)
+        raise
+    finally:
+        if pipeline.enabled():
+            blocks.close()  # stops the parse thread if a writer failed
+    tracker.finish()
+    log.info(f"Conversion done: {', '.join(targets) or 'nothing to write'}")
+    return tracker, outputs
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"VektorConverter v{sub_script_ver}")
+    parser.add_argument("file", help="input .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("-t", "--target", action="append", help="J750, C3380, C3850, VEC, VECB, STATS, VCD or STIL; may be repeated")
+    parser.add_argument("--dec", help="DEC file for Chroma targets")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval")
+    parser.add_argument("--profile", nargs="?", const=True, metavar="JSON",
+                        help="print a per-stage profile, and save it to JSON if given")
+    parser.add_argument("--cprofile", metavar="FILE", help="with --profile, also dump cProfile stats to FILE")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also track each stage's peak memory (slows the run down)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="overlap reading, parsing and writing on separate threads")
+    parser.add_argument("-j", "--workers", type=int, help="format ATE vectors on N processes (0 = all cores)")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="stop the conversion if the process grows past MB of memory")
+    parser.add_argument("--transform", metavar="JSON", help="transform.py rule file applied before writing")
+    parser.add_argument("--incremental", action="store_true",
+                        help=".vec input: only re-format the chunks changed since the last --incremental run")
+    args = parser.parse_args()
+
+    if args.pipeline:
+        pipeline.enable()
+
+    profile = None
+    if args.profile or args.cprofile or args.profile_memory:
+        import profiler
+        profile = profiler.Profiler(memory=args.profile_memory,
+                                    json_file=args.profile if isinstance(args.profile, str) else None,
+                                    cprofile_file=args.cprofile)
+    transform_rules = None
+    if args.transform:
+        import transform
+        transform_rules = transform.load_rules(args.transform)
+    try:
+        run_conversion(args.file, args.target, args.dec, args.interval, profile=profile, workers=args.workers,
+                       memory_budget=args.memory_budget, transform_rules=transform_rules,
+                       incremental=args.incremental)
+    except (MemoryBudgetExceeded, ValueError) as e:
+        # ValueError: a transform rule that does not fit the pattern (unknown pin, bad op)
+        log.error(str(e))
+        raise SystemExit(1)
@@ -0,0 +1,185 @@
+# merge.py
+import os
+import sys
+from datetime import datetime
+import metadata
+import logger
+import formats
+from pattern import Pattern, Timesets, VectorBlock, fan_out
+from patdiff import column_map
+from progress import Progress, Cancelled, track_blocks, remove_outputs
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("merge")
+
+# Concatenate patterns (init + functional + BIST, ...) into one. The pin list is the union of
+# every input's pins, in first-seen order; each input gets one precomputed column map (an
+# itemgetter) and pins it does not have are driven with FILL. Inputs are read one after the
+# other through their regular readers, block by block, so memory does not grow with the
+# combined length. Every input's comments are kept, and its first vector is labelled with the
+# section name, which the ATE writers put on that vector as its comment.
+#
+# If any input uses several timesets the merged pattern carries the union of their names; each
+# input's timeset codes are remapped with one bytes.translate per block, and an input with a
+# single timeset gets the default one (WFT).
+
+DEFAULT_TIMESET = "WFT"
+
+FILL = "X"
+
+
+def union_pins(pin_lists):
+    """Pins of all lists, each once, in the order they are first seen"""
+    union, seen = [], set()
+    for pins in pin_lists:
+        for pin in pins:
+            if pin not in seen:
+                seen.add(pin)
+                union.append(pin)
+    return union
+
+
+def section_label(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def union_timesets(patterns):
+    """Timesets of all inputs (None if none has several) and each input's code translate table"""
+    if all(p.timesets is None for p in patterns):
+        return None, [None] * len(patterns)
+    timesets = Timesets()
+    tables = []
+    for pattern in patterns:
+        names = pattern.timesets.names if pattern.timesets is not None else [DEFAULT_TIMESET]
+        codes = [timesets.code(name) for name in names]
+        tables.append(bytes(codes + [0] * (256 - len(codes))))
+    return timesets, tables
+
+
+def _merged_blocks(patterns, pins, labels, header, fill, progress, tables):
+    start = 0
+    for i, (pattern, label) in enumerate(zip(patterns, labels)):
+        mapper = column_map(pattern.pins, pins, fill)
+        table = tables[i]
+        first = True
+        for block in pattern.blocks:
+            rows = block.rows if mapper is None else list(map(mapper, block.rows))
+            tsets = None
+            if table is not None:
+                tsets = bytearray(block.tsets if block.tsets is not None else bytes(len(rows))).translate(table)
+            comments = block.comments
+            if first:
+                comments = dict(comments)
+                comments[0] = (header if i == 0 else []) + comments.get(0, []) + [f" {label}"]
+                first = False
+            yield VectorBlock(start, rows, comments, tsets)
+            start += len(rows)
+        if first:
+            log.warning(f"{pattern.source}: no vectors")
+        if progress is not None and os.path.isfile(pattern.source):
+            progress.read(progress.bytes_read + os.path.getsize(pattern.source))
+
+
+def merge_patterns(patterns, labels=None, fill=FILL, source="", progress=None):
+    """One Pattern streaming every input in turn in the union pin order (consumes their blocks)"""
+    labels = labels or [section_label(p.source) for p in patterns]
+    pins = union_pins(p.pins for p in patterns)
+    for pattern in patterns:
+        have = set(pattern.pins)
+        missing = [pin for pin in pins if pin not in have]
+        if missing:
+            log.info(f"{pattern.source}: {len(missing)} pins filled with {fill}: {', '.join(missing)}")
+
+    periods = [p.period for p in patterns if p.period]
+    period = periods[0] if periods else None
+    if len(set(periods)) > 1:
+        log.warning(f"Inputs have different periods ({', '.join(sorted(set(periods)))} ns); using {period} ns")
+
+    header = [
+        "#######################################################",
+        f" Generated by VektorConverter: merge v{sub_script_ver}",
+    ] + [f" Section      : {label} <- {p.source}" for label, p in zip(labels, patterns)]
+    if period:
+        header.append(f" Period       : {period} ns")
+    header += [
+        f" Timestamp    : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "#######################################################",
+    ]
+    counts = [p.count for p in patterns]
+    count = sum(counts) if None not in counts else None
+    timesets, tables = union_timesets(patterns)
+    blocks = _merged_blocks(patterns, pins, labels, header, fill, progress, tables)
+    return Pattern(pins, blocks, source=source, period=period, count=count, timesets=timesets)
+
+
+def merge(paths, out_file, targets=("VEC",), labels=None, fill=FILL, dec_file=None, interval=None,
+          progress=None, cancel=None, workers=None):
+    """Concatenate `paths` (any registered input) and write every target next to out_file
+    (e.g. merged.vec -> merged.vec/.cmf, merged.atp, ...); returns the files written"""
+    for path in paths:
+        if formats.get_reader(os.path.splitext(path)[1]) is None:
+            raise ValueError(f"Unsupported file type: {path}")
+        if "interval" in formats.get_reader(os.path.splitext(path)[1]).options and not interval:
+            raise ValueError(f"VCD interval required: {path}")
+    vec_file = os.path.splitext(out_file)[0] + ".vec"
+    tracker = Progress(progress, cancel, total_bytes=sum(os.path.getsize(p) for p in paths))
+    patterns = [formats.read(p, os.path.splitext(p)[1].lower(), interval=interval) for p in paths]
+    pattern = merge_patterns(patterns, labels, fill, source=vec_file, progress=tracker)
+    tracker.total_vectors = pattern.count or 0
+
+    writers = [formats.make_writer(t, pattern, vec_file, progress=tracker, dec_file=dec_file,
+                                   script_ver=sub_script_ver, workers=workers) for t in targets]
+    outputs = [path for w in writers for path in w.outputs]
+    # the inputs are streamed, so no output may replace one of them
+    sources = {os.path.abspath(p) for p in paths}
+    clash = [path for path in outputs if os.path.abspath(path) in sources]
+    if clash:
+        raise ValueError(f"Output would overwrite an input: {', '.join(clash)}")
+
+    tracker.set_stage("merge")
+    try:
+        fan_out(track_blocks(pattern.blocks, tracker), writers)
+    except BaseException as e:
+        if isinstance(e, Cancelled):
+            log.info("Merge cancelled")
+        remove_outputs(outputs)
+        raise
+    tracker.finish()
+    log.info(f"Merged {len(paths)} patterns, {tracker.vector_count} vectors x {len(pattern.pins)} pins")
+    return outputs
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Pattern merge v{sub_script_ver}")
+    parser.add_argument("files", nargs="+", help="inputs in order: .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("-o", "--output", required=True, help="output .vec (other targets use its base name)")
+    parser.add_argument("-t", "--target", action="append",
+                        help="VEC (default), VECB, STATS, VCD, STIL, J750, C3380 or C3850; may be repeated")
+    parser.add_argument("--label", action="append", help="section label per input (default: file name)")
+    parser.add_argument("--fill", default=FILL, help="state of pins an input does not have")
+    parser.add_argument("--dec", help="DEC file for Chroma targets")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval")
+    args = parser.parse_args()
+
+    targets = [t.upper() for t in args.target or ["VEC"]]
+    unknown = [t for t in targets if formats.get_writer(t) is None]
+    if unknown:
+        log.error(f"Unknown output type: {', '.join(unknown)}")
+        sys.exit(1)
+    if args.label and len(args.label) != len(args.files):
+        log.error("Give one --label per input file")
+        sys.exit(1)
+    if any(t in ("C3380", "C3850") for t in targets) and not args.dec:
+        log.error("DEC file required")
+        sys.exit(1)
+    if len(args.fill) != 1:
+        log.error("--fill must be a single character")
+        sys.exit(1)
+    try:
+        merge(args.files, args.output, targets, args.label, args.fill, args.dec, args.interval)
+    except (OSError, ValueError) as e:
+        log.error(str(e))
+        sys.exit(1)
@@ -0,0 +1,186 @@
+# patdiff.py
+import os
+import sys
+import hashlib
+import argparse
+from operator import itemgetter
+import metadata
+import logger
+import formats
+from pattern import BLOCK_SIZE
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("patdiff")
+
+# Semantic pattern compare: both inputs go through their regular readers, pins are matched
+# by name, and vectors are compared in fixed-size chunks by digest. Only chunks whose
+# digests differ are walked row by row, so equal patterns never hit a per-character loop.
+
+DEFAULT_MAX_DIFFS = 10
+
+
+class DiffResult:
+    """Outcome of compare(); differences holds (cycle, [(pin, value_a, value_b), ...])"""
+
+    def __init__(self, pins, only_a, only_b):
+        self.pins = pins            # compared pins, in pattern A's order
+        self.only_a = only_a        # pins missing from B
+        self.only_b = only_b        # pins missing from A
+        self.count_a = 0
+        self.count_b = 0
+        self.chunks = 0
+        self.chunks_differing = 0
+        self.cycles_differing = 0
+        self.differences = []
+
+    @property
+    def equal(self):
+        return (not self.only_a and not self.only_b and self.count_a == self.count_b
+                and not self.cycles_differing)
+
+    def __str__(self):
+        lines = []
+        if self.only_a:
+            lines.append(f"Pins only in A: {', '.join(self.only_a)}")
+        if self.only_b:
+            lines.append(f"Pins only in B: {', '.join(self.only_b)}")
+        if self.count_a != self.count_b:
+            lines.append(f"Vector count differs: A has {self.count_a}, B has {self.count_b}")
+        for cycle, pins in self.differences:
+            lines.append(f"cycle {cycle}: " + ", ".join(f"{pin} {a}->{b}" for pin, a, b in pins))
+        if self.cycles_differing > len(self.differences):
+            lines.append(f"... {self.cycles_differing - len(self.differences)} more differing cycles")
+        lines.append(f"{'EQUAL' if self.equal else 'DIFFERENT'}: {min(self.count_a, self.count_b)} vectors x "
+                     f"{len(self.pins)} pins compared, {self.chunks_differing} of {self.chunks} chunks differ")
+        return "\n".join(lines)
+
+
+# -------------------- Normalisation --------------------
+
+def column_map(pins, order, fill=None):
+    """Callable turning a row in `pins` column order into a row in `order` (None if identical).
+    With `fill` set, pins of `order` missing from `pins` get that character"""
+    if list(pins) == list(order):
+        return None
+    index = {pin: i for i, pin in enumerate(pins)}
+    if fill is not None:
+        # missing pins read the fill character appended after the last column
+        getter = itemgetter(*(index.get(pin, len(pins)) for pin in order))
+        if len(order) == 1:
+            return lambda row: getter(row + fill)
+        return lambda row: "".join(getter(row + fill))
+    getter = itemgetter(*(index[pin] for pin in order))
+    if len(order) == 1:
+        return getter
+    return lambda row: "".join(getter(row))
+
+
+def fold_table(spec):
+    """'HL:10' -> str.translate table treating H as 1 and L as 0"""
+    if not spec:
+        return None
+    src, _, dst = spec.partition(":")
+    if len(src) != len(dst):
+        raise ValueError(f"fold '{spec}' needs as many characters after ':' as before")
+    return str.maketrans(src.upper() + src.lower(), dst.upper() + dst.upper())
+
+
+def rows_in_chunks(blocks, mapper=None, table=None, size=BLOCK_SIZE):
+    """Re-cut any block stream into `size`-row lists of normalised rows; comments are dropped"""
+    pending = []
+    for block in blocks:
+        rows = block.rows
+        if mapper is not None:
+            rows = list(map(mapper, rows))
+        if table is not None:
+            rows = "\n".join(rows).translate(table).split("\n") if rows else []
+        pending.extend(rows)
+        while len(pending) >= size:
+            yield pending[:size]
+            del pending[:size]
+    if pending:
+        yield pending
+
+
+def chunk_digest(rows):
+    return hashlib.blake2b("\n".join(rows).encode("latin-1"), digest_size=16).digest()
+
+
+# -------------------- Compare --------------------
+
+def open_pattern(path, interval=None):
+    ext = os.path.splitext(path)[1].lower()
+    if formats.get_reader(ext) is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return formats.read(path, ext, interval=interval)
+
+
+def compare_patterns(a, b, max_diffs=DEFAULT_MAX_DIFFS, fold=None, chunk_size=BLOCK_SIZE):
+    """Compare two pattern.Pattern streams; see DiffResult"""
+    names_b = set(b.pins)
+    names_a = set(a.pins)
+    pins = [p for p in a.pins if p in names_b]
+    result = DiffResult(pins, [p for p in a.pins if p not in names_b], [p for p in b.pins if p not in names_a])
+    if not pins:
+        # nothing to compare row by row (and no columns to map): only count both sides
+        result.count_a = sum(len(block.rows) for block in a.blocks)
+        result.count_b = sum(len(block.rows) for block in b.blocks)
+        return result
+    table = fold_table(fold)
+
+    chunks_a = rows_in_chunks(a.blocks, column_map(a.pins, pins), table, chunk_size)
+    chunks_b = rows_in_chunks(b.blocks, column_map(b.pins, pins), table, chunk_size)
+    cycle = 0
+    while True:
+        rows_a = next(chunks_a, None)
+        rows_b = next(chunks_b, None)
+        if rows_a is None or rows_b is None:
+            # one side ended: only count what is left of the other
+            result.count_a += len(rows_a or ()) + sum(map(len, chunks_a))
+            result.count_b += len(rows_b or ()) + sum(map(len, chunks_b))
+            break
+        result.count_a += len(rows_a)
+        result.count_b += len(rows_b)
+        n = min(len(rows_a), len(rows_b))
+        result.chunks += 1
+        if len(rows_a) != len(rows_b):
+            rows_a, rows_b = rows_a[:n], rows_b[:n]
+        if chunk_digest(rows_a) != chunk_digest(rows_b):
+            result.chunks_differing += 1
+            _diff_rows(result, cycle, rows_a, rows_b, max_diffs)
+        cycle += n
+    return result
+
+
+def _diff_rows(result, first_cycle, rows_a, rows_b, max_diffs):
+    for i, (ra, rb) in enumerate(zip(rows_a, rows_b)):
+        if ra == rb:
+            continue
+        result.cycles_differing += 1
+        if len(result.differences) < max_diffs:
+            pins = [(result.pins[j], x, y) for j, (x, y) in enumerate(zip(ra, rb)) if x != y]
+            result.differences.append((first_cycle + i, pins))
+
+
+def compare(path_a, path_b, max_diffs=DEFAULT_MAX_DIFFS, fold=None, interval=None):
+    """Compare two pattern files of any supported format; returns a DiffResult"""
+    return compare_patterns(open_pattern(path_a, interval), open_pattern(path_b, interval), max_diffs, fold)
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    parser = argparse.ArgumentParser(description=f"Semantic pattern compare v{sub_script_ver}")
+    parser.add_argument("a")
+    parser.add_argument("b")
+    parser.add_argument("-n", "--max-diffs", type=int, default=DEFAULT_MAX_DIFFS, help="differing cycles to list")
+    parser.add_argument("--fold", help="treat states as equal, e.g. HL:10 compares H as 1 and L as 0")
+    parser.add_argument("--interval", type=int, help="sampling interval for .vcd inputs")
+    args = parser.parse_args()
+    try:
+        diff = compare(args.a, args.b, args.max_diffs, args.fold, args.interval)
+    except (ValueError, OSError) as e:
+        log.error(str(e))
+        sys.exit(2)
+    print(diff)
+    sys.exit(0 if diff.equal else 1)
@@ -0,0 +1,173 @@
+# patgen.py
+import os
+import sys
+import random
+import argparse
+import metadata
+import vec2ate
+from pattern import write_cmf_file
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+
+# Deterministic synthetic patterns for benchmarking: the same (vectors, pins, toggle,
+# comment_every, seed) always gives byte-identical files.
+
+FORMATS = ["vec", "atp", "pat", "stil", "vcd"]
+MAX_VECTORS = 10_000_000
+MAX_PINS = 2048
+PERIOD_NS = "41.665"
+PERIOD_PS = 41665
+
+# drive pins toggle 0 <-> 1, compare pins H <-> L
+FLIP = bytes.maketrans(b"01HL", b"10LH")
+
+
+def pin_names(n_pins):
+    return [f"P{i:04d}" for i in range(n_pins)]
+
+
+def _initial_state(n_pins):
+    return bytearray(b"".join(b"H" if i % 4 == 3 else b"0" for i in range(n_pins)))
+
+
+def generate_rows(n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """Yield (vector, comment, toggled pin indexes); about toggle*n_pins pins change per vector"""
+    if not 0 < n_vectors <= MAX_VECTORS:
+        raise ValueError(f"vectors must be 1..{MAX_VECTORS}")
+    if not 0 < n_pins <= MAX_PINS:
+        raise ValueError(f"pins must be 1..{MAX_PINS}")
+    rng = random.Random(seed)
+    state = _initial_state(n_pins)
+    pins = range(n_pins)
+    mean = toggle * n_pins
+
+    for n in range(n_vectors):
+        changed = ()
+        if n:
+            k = min(int(mean + rng.random()), n_pins)  # stochastic rounding keeps the mean exact
+            changed = rng.sample(pins, k)
+            for i in changed:
+                state[i] = FLIP[state[i]]
+        comment = f"SEQ_{n // comment_every}" if comment_every and not n % comment_every else None
+        yield state.decode("ascii"), comment, changed
+
+
+# -------------------- Writers --------------------
+
+def write_vec(path, n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """.vec plus its .cmf (pins listed in reversed column order, like every .cmf here)"""
+    cmf_file = os.path.splitext(path)[0] + ".cmf"
+    write_cmf_file(pin_names(n_pins)[::-1], cmf_file)
+    with open(path, "w") as f:
+        f.write(f"# Generated    : patgen v{sub_script_ver} seed {seed}\n")
+        f.write(f"# Period       : {PERIOD_NS} ns\n")
+        for n, (vec, comment, _) in enumerate(generate_rows(n_vectors, n_pins, toggle, comment_every, seed)):
+            if comment:
+                f.write(f"# {comment}\n")
+            f.write(f"{n} {vec}\n")
+    return path
+
+
+def write_ate(path, n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """.atp (J750) or .pat (Chroma) through the regular vec2ate writer"""
+    ate_type = "J750" if path.lower().endswith(".atp") else "C3380"
+    base = os.path.splitext(path)[0]
+    vec_file = write_vec(base + ".vec", n_vectors, n_pins, toggle, comment_every, seed)
+    vec2ate.convert_vec_file(vec_file, base + ".cmf", "", os.path.splitext(path)[1], ate_type)
+    os.remove(vec_file)
+    os.remove(base + ".cmf")
+    return path
+
+
+def write_stil(path, n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """STIL with one full V statement followed by V statements of the changed pins only"""
+    names = pin_names(n_pins)
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "w") as f:
+        f.write("STIL 1.0;\n\nHeader {\n")
+        f.write(f'   Title "Generated by patgen v{sub_script_ver} seed {seed}";\n}}\n\n')
+        f.write("Signals {\n")
+        f.write("".join(f'   "{p}" InOut;\n' for p in names))
+        f.write("}\n\n")
+        f.write('Timing {\n   WaveformTable "WFT" {\n')
+        f.write(f"      Period '{PERIOD_NS}ns';\n      Waveforms {{\n")
+        f.write(f'         "all" {{ 01 {{ \'0ns\' D/U; }} LH {{ \'0.9*{PERIOD_NS}ns\' L/H; }} }}\n')
+        f.write("      }\n   }\n}\n\n")
+        f.write(f'Pattern "{name}" {{\n   W "WFT";\n')
+        for n, (vec, comment, changed) in enumerate(generate_rows(n_vectors, n_pins, toggle, comment_every, seed)):
+            if comment:
+                f.write(f"   Ann {{* {comment} *}}\n")
+            if n == 0:
+                changed = range(n_pins)
+            f.write("   V { " + " ".join(f'"{names[i]}"={vec[i]};' for i in sorted(changed)) + " }\n")
+        f.write("}\n")
+    return path
+
+
+def _vcd_id(i):
+    """Short printable VCD identifier code for signal i"""
+    code = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 94)
+        code += chr(33 + r)
+    return code
+
+
+def write_vcd(path, n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """VCD with one timestamp per vector, PERIOD_PS apart (convert with interval=PERIOD_PS)"""
+    names = pin_names(n_pins)
+    ids = [_vcd_id(i) for i in range(n_pins)]
+    level = {"0": "0", "1": "1", "L": "0", "H": "1"}
+    with open(path, "w") as f:
+        f.write(f"$date\n\tpatgen seed {seed}\n$end\n\n$version\n\tpatgen v{sub_script_ver}\n$end\n\n")
+        f.write("$timescale\n\t1ps\n$end\n\n$scope module patgen $end\n")
+        f.write("".join(f"$var reg 1 {c} {p} $end\n" for c, p in zip(ids, names)))
+        f.write("$upscope $end\n\n$enddefinitions $end\n\n")
+        for n, (vec, _, changed) in enumerate(generate_rows(n_vectors, n_pins, toggle, comment_every, seed)):
+            if n == 0:
+                f.write("#0\n$dumpvars\n")
+                f.write("".join(f"{level[vec[i]]}{ids[i]}\n" for i in range(n_pins)))
+                f.write("$end\n")
+                continue
+            f.write(f"#{n * PERIOD_PS}\n")
+            f.write("".join(f"{level[vec[i]]}{ids[i]}\n" for i in changed))
+    return path
+
+
+WRITERS = {
+    "vec": write_vec,
+    "atp": write_ate,
+    "pat": write_ate,
+    "stil": write_stil,
+    "vcd": write_vcd,
+}
+
+
+def generate(fmt, out_dir, n_vectors, n_pins, toggle=0.1, comment_every=0, seed=1):
+    """Write one synthetic input of format fmt into out_dir; returns its path"""
+    fmt = fmt.lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"gen_{n_vectors}x{n_pins}.{fmt}")
+    return WRITERS[fmt](path, n_vectors, n_pins, toggle, comment_every, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic vector patterns")
+    parser.add_argument("format", choices=FORMATS)
+    parser.add_argument("-o", "--out-dir", default=".")
+    parser.add_argument("-n", "--vectors", type=int, default=100_000)
+    parser.add_argument("-p", "--pins", type=int, default=64)
+    parser.add_argument("-t", "--toggle", type=float, default=0.1, help="fraction of pins changing per vector")
+    parser.add_argument("-c", "--comment-every", type=int, default=1000, help="0 for no comments")
+    parser.add_argument("-s", "--seed", type=int, default=1)
+    args = parser.parse_args()
+    try:
+        out = generate(args.format, args.out_dir, args.vectors, args.pins, args.toggle, args.comment_every, args.seed)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print(f"Pattern written: {out}")
@@ -0,0 +1,284 @@
+# patinspect.py
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import itertools
+import metadata
+import logger
+import formats
+import preview
+from pattern import PERIOD_RE
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("patinspect")
+
+# Pin list, vector count, period and the first/last few vectors of any input file, without a
+# conversion. Only the header is parsed; vectors are counted by matching a per-format marker over
+# newline-aligned mmap chunks. Markers start with a literal ("\n" + lookahead), so the regex engine
+# jumps from line to line in C, and every match is the same cached one-byte string: a file is
+# counted at close to memory speed and never decoded line by line.
+
+INSPECT_CHUNK = 8 * 1024 * 1024
+DEFAULT_EDGE = 3            # vectors shown from each end
+HEADER_SCAN = 64 * 1024     # .vec header comments (period) are looked for in this many bytes
+
+
+class LineMark:
+    """Lines starting with `head` (a regex matched at the start of the line)"""
+
+    def __init__(self, head):
+        self.first = re.compile(head)                        # the first line of a chunk
+        self.rest = re.compile(rb"\n(?=" + head + rb")")     # every later line
+
+    def count(self, chunk):
+        return len(self.rest.findall(chunk)) + (self.first.match(chunk) is not None)
+
+
+class Mark:
+    """Occurrences of a regex anywhere in the text"""
+
+    def __init__(self, pattern):
+        self.regex = re.compile(pattern)
+
+    def count(self, chunk):
+        return len(self.regex.findall(chunk))
+
+
+VEC_MARK = LineMark(rb"[ \t]*[^#\s]")
+ATP_MARK = LineMark(rb"[ \t]*>")
+PAT_MARK = LineMark(rb"[ \t]*\*")
+VCD_MARK = LineMark(rb"#\d")
+STIL_MARK = Mark(rb"V(?<![\w]V)(?=\s*\{)")    # a V { } block
+STIL_LOOP = re.compile(rb"\bLoop\b", re.IGNORECASE)
+VCD_TIME = re.compile(rb"#(\d+)")
+
+
+class PatternInfo:
+    """What inspect() found; vectors/first/last are None where the format cannot tell cheaply"""
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.format = kind
+        self.size = os.path.getsize(path)
+        self.pins = []
+        self.period = None
+        self.vectors = None
+        self.first = []
+        self.last = []
+        self.extra = {}         # format-specific fields (VCD timescale, timestamps, ...)
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return dict({"path": self.path, "format": self.format, "size": self.size, "pins": self.pins,
+                     "pin_count": len(self.pins), "period": self.period, "vectors": self.vectors,
+                     "first": self.first, "last": self.last, "seconds": round(self.seconds, 6)}, **self.extra)
+
+
+# -------------------- mmap scanning --------------------
+
+def _chunks(mm):
+    """Newline-aligned slices of the mapped file"""
+    pos, size = 0, len(mm)
+    while pos < size:
+        end = mm.find(b"\n", min(pos + INSPECT_CHUNK, size - 1))
+        end = size if end < 0 else end + 1
+        yield mm[pos:end]
+        pos = end
+
+
+def count_marks(mm, mark):
+    return sum(mark.count(chunk) for chunk in _chunks(mm))
+
+
+def _lines_forward(mm):
+    pos, size = 0, len(mm)
+    while pos < size:
+        end = mm.find(b"\n", pos)
+        end = size if end < 0 else end + 1
+        yield mm[pos:end]
+        pos = end
+
+
+def _lines_backward(mm):
+    end = len(mm)
+    while end > 0:
+        start = mm.rfind(b"\n", 0, end - 1) + 1
+        yield mm[start:end]
+        end = start
+
+
+def _edge_vectors(mm, decode, n, lines):
+    out = []
+    for line in lines:
+        if len(out) >= n:
+            break
+        decoded = decode(line)
+        if decoded is not None:
+            out.append(decoded[0].decode("latin-1"))
+    return out
+
+
+def _open_map(path):
+    f = open(path, "rb")
+    try:
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b""
+    except BaseException:
+        f.close()
+        raise
+
+
+# -------------------- per format --------------------
+
+def _inspect_lines(info, mark, edge):
+    """.vec/.atp/.pat: every vector is one self-contained line"""
+    is_vector, decode = preview.DECODERS[os.path.splitext(info.path)[1].lower()]
+    info.pins = preview.read_pins(info.path)
+    f, mm = _open_map(info.path)
+    with f:
+        if info.format == "vec":
+            info.period = _vec_period(mm[:HEADER_SCAN])
+        info.vectors = count_marks(mm, mark)
+        info.first = _edge_vectors(mm, decode, edge, _lines_forward(mm))
+        info.last = _edge_vectors(mm, decode, edge + 1, _lines_backward(mm))[::-1]
+        if info.format != "vec" and info.last and set(info.last[-1]) <= {"X", "x"}:
+            # the ATE readers drop the trailing dummy vector
+            info.vectors -= 1
+            info.last.pop()
+        info.last = info.last[-edge:] if edge else []
+        if mm:
+            mm.close()
+
+
+def _vec_period(head):
+    for line in head.decode("latin-1").splitlines():
+        if not line.startswith("#"):
+            break
+        m = PERIOD_RE.search(line)
+        if m:
+            return m.group(1)
+    return None
+
+
+def _inspect_stil(info, edge):
+    import stil2vec
+    header = stil2vec.read_stil_header(info.path)
+    info.pins = stil2vec.parse_stil_pins(info.path, header)
+    info.period = stil2vec.parse_stil_period(info.path, header)
+    f, mm = _open_map(info.path)
+    with f:
+        loops = mm and STIL_LOOP.search(mm)
+        if not loops:
+            info.vectors = count_marks(mm, STIL_MARK)
+        if mm:
+            mm.close()
+    if loops:
+        # a Loop body can hold C, W and nested Loops: count with the reader's own statement parser
+        info.vectors = stil2vec.count_stil_vectors(info.path)
+    # V blocks only list the pins that change, so only the start is decoded (reading just that far)
+    info.first = list(itertools.islice(stil2vec.iter_stil_vectors(info.path, info.pins), edge))
+    info.last = None
+
+
+def _inspect_vcd(info, edge, interval):
+    import vcd2vec
+    _, _, timescale, _ = vcd2vec.parse_header_info(info.path)
+    symbols = vcd2vec.read_vcd_symbols(info.path)
+    info.pins = [pin for _, pin in symbols]
+    f, mm = _open_map(info.path)
+    with f:
+        timestamps = count_marks(mm, VCD_MARK)
+        last_time = 0
+        for line in _lines_backward(mm):
+            m = VCD_TIME.match(line)
+            if m:
+                last_time = int(m.group(1))
+                break
+        if mm:
+            mm.close()
+    info.extra = {"timescale": timescale, "timestamps": timestamps, "last_time": last_time}
+    info.last = None
+    if interval:
+        # sampled every `interval` from 0 up to the last timestamp, as vcd2vec does
+        info.period = f"{interval} x {timescale}"
+        info.vectors = last_time // interval + 1
+        changes = vcd2vec.iter_vcd_changes(info.path, symbols)
+        info.first = [row for _, row in itertools.islice(vcd2vec.sample_states(symbols, changes, interval), edge)]
+        changes.close()
+
+
+def _inspect_vecb(info, edge):
+    import vecb
+    with vecb.VecbReader(info.path) as reader:
+        info.pins, info.period, info.vectors = reader.pins, reader.period, reader.count
+        if reader.index and edge:
+            info.first = reader.read_block(0).rows[:edge]
+            last = []
+            for i in range(len(reader.index) - 1, -1, -1):
+                last = reader.read_block(i).rows[-(edge - len(last)):] + last
+                if len(last) >= edge:
+                    break
+            info.last = last
+
+
+def inspect(path, edge=DEFAULT_EDGE, interval=None):
+    """PatternInfo of any input file registered in formats.py; interval only applies to VCD"""
+    ext = os.path.splitext(path)[1].lower()
+    kind = formats.input_kind(ext)
+    if kind is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    t0 = time.perf_counter()
+    info = PatternInfo(os.path.abspath(path), ext.lstrip("."))
+    if ext in (".vec", ".atp", ".pat"):
+        _inspect_lines(info, {".vec": VEC_MARK, ".atp": ATP_MARK, ".pat": PAT_MARK}[ext], edge)
+    elif ext == ".stil":
+        _inspect_stil(info, edge)
+    elif ext == ".vcd":
+        _inspect_vcd(info, edge, interval)
+    elif ext == ".vecb":
+        _inspect_vecb(info, edge)
+    info.seconds = time.perf_counter() - t0
+    return info
+
+
+def print_info(info):
+    d = info.to_dict()
+    print(f"{d['path']} ({d['format']}, {d['size']:,} bytes, {d['seconds'] * 1000:.1f} ms)")
+    print(f"  pins    : {d['pin_count']}  {', '.join(d['pins'][:16])}{' ...' if d['pin_count'] > 16 else ''}")
+    print(f"  period  : {d['period'] or '-'}")
+    print(f"  vectors : {d['vectors'] if d['vectors'] is not None else '- (needs --interval)'}")
+    for key in ("timescale", "timestamps", "last_time"):
+        if key in d:
+            print(f"  {key:<8}: {d[key]}")
+    for key in ("first", "last"):
+        if d[key]:
+            print(f"  {key:<8}: " + "\n            ".join(d[key]))
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Pattern inspect v{sub_script_ver}")
+    parser.add_argument("files", nargs="+", help="input .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("-n", "--edge", type=int, default=DEFAULT_EDGE, help="vectors shown from each end")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval (for the vector count)")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args()
+
+    results, failed = [], False
+    for path in args.files:
+        try:
+            results.append(inspect(path, args.edge, args.interval))
+        except (OSError, ValueError) as e:
+            log.error(f"{path}: {e}")
+            failed = True
+    if args.json:
+        docs = [info.to_dict() for info in results]
+        print(json.dumps(docs[0] if len(docs) == 1 else docs, indent=2))
+    else:
+        for info in results:
+            print_info(info)
+    sys.exit(1 if failed else 0)
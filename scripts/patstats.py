@@ -0,0 +1,265 @@
+# patstats.py
+import os
+import sys
+import json
+import itertools
+from collections import Counter
+import metadata
+import logger
+import formats
+from pattern import output_path
+from progress import track_blocks
+
+try:
+    import numpy as np
+except ImportError:     # optional: the pure-Python engine gives the same report, only slower
+    np = None
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("patstats")
+
+# Per-pin pattern statistics from any reader's block stream: value counts, toggles, X/Z density,
+# drive vs compare ratio, constant pins and the longest idle run (rows without a change), plus
+# rows repeating the previous one (compressible regions). Registered as the STATS target, so
+# `-t STATS` computes the report in the same pass as the conversion.
+#
+# With NumPy each block is one (rows x pins) uint8 matrix: counts are a single bincount over
+# (pin * 256 + character), toggles are the XOR of consecutive rows, and run lengths come from a
+# running maximum of the last change row, so no Python code runs per vector or per pin.
+
+DRIVE = "01Z"
+COMPARE = "LH"
+MASK = "X"
+VALUES = "01LHXZ"   # counted separately; anything else is reported as "other"
+
+
+class PatternStats:
+    """Running statistics; add(rows) for every block in order, then report()"""
+
+    def __init__(self, pins=(), use_numpy=None):
+        self.pins = list(pins)
+        self.use_numpy = np is not None if use_numpy is None else use_numpy and np is not None
+        self.engine = "numpy" if self.use_numpy else "python"
+        self.width = None
+        self.rows = 0
+        self.repeated = 0           # rows equal to the row before
+        self._prev = None           # last row of the previous block
+
+    def _start(self, width):
+        self.width = width
+        if self.use_numpy:
+            self._counts = np.zeros(width * 256, dtype=np.int64)
+            self._offsets = np.arange(width, dtype=np.intp) * 256
+            self._toggles = np.zeros(width, dtype=np.int64)
+            self._run_start = np.zeros(width, dtype=np.int64)   # row where each pin's current run began
+            self._best_len = np.ones(width, dtype=np.int64)
+            self._best_start = np.zeros(width, dtype=np.int64)
+        else:
+            self._counts = [Counter() for _ in range(width)]
+            self._toggles = [0] * width
+            self._run_start = [0] * width
+            self._best_len = [1] * width
+            self._best_start = [0] * width
+        self._rep_start = 0         # first row of the current run of equal rows
+        self._rep_best = (1, 0)     # (length, start) of the longest run of equal rows
+
+    def add(self, rows):
+        if not rows:
+            return
+        if self.width is None:
+            self._start(len(rows[0]))
+        width = self.width
+        if any(len(r) != width for r in rows):
+            rows = [r[:width].ljust(width, "X") for r in rows]  # ragged input: pad/cut like a mask
+        if self.use_numpy:
+            self._add_numpy(rows)
+        else:
+            self._add_python(rows)
+        self.rows += len(rows)
+        self._prev = rows[-1]
+
+    # ---------- NumPy engine ----------
+
+    def _add_numpy(self, rows):
+        n, w = len(rows), self.width
+        block = np.frombuffer("".join(rows).encode("latin-1"), dtype=np.uint8).reshape(n, w)
+        self._counts += np.bincount((block + self._offsets).ravel(), minlength=w * 256)
+
+        # changed[i]: which pins changed at vector `first + i` (compared with the vector before it)
+        if self._prev is None:
+            full, first = block, self.rows + 1
+        else:
+            prev = np.frombuffer(self._prev.encode("latin-1"), dtype=np.uint8)
+            full, first = np.vstack([prev, block]), self.rows
+        changed = np.bitwise_xor(full[1:], full[:-1]) != 0
+        if not len(changed):
+            return
+        self._toggles += np.count_nonzero(changed, axis=0)
+
+        # last change at or before each row -> length of the idle run ending there; rows are
+        # numbered from `first` within the block (int32 halves the memory traffic), earlier runs carry
+        # in as negative rows
+        row_num = np.arange(len(changed), dtype=np.int32)
+        carry = np.clip(self._run_start - first, -2 ** 31 + 1, 0).astype(np.int32)
+        last = np.maximum.accumulate(np.where(changed, row_num[:, None], carry), axis=0)
+        run = row_num[:, None] - last
+        at = run.argmax(axis=0)
+        cols = np.arange(w)
+        longest = run[at, cols] + 1
+        better = longest > self._best_len
+        self._best_len[better] = longest[better]
+        self._best_start[better] = last[at, cols][better] + first
+        self._run_start = last[-1] + first
+
+        any_change = changed.any(axis=1)
+        self.repeated += int(len(any_change) - np.count_nonzero(any_change))
+        last = np.maximum.accumulate(np.where(any_change, row_num, np.int32(max(self._rep_start - first, -2 ** 31 + 1))))
+        run = row_num - last
+        at = int(run.argmax())
+        if run[at] + 1 > self._rep_best[0]:
+            self._rep_best = (int(run[at]) + 1, int(last[at]) + first)
+        self._rep_start = int(last[-1]) + first
+
+    # ---------- pure-Python engine ----------
+
+    def _add_python(self, rows):
+        for j, col in enumerate(zip(*rows)):
+            self._counts[j].update(col)
+            row, start = self.rows, self._run_start[j]
+            best_len, best_start = self._best_len[j], self._best_start[j]
+            value = self._prev[j] if self._prev is not None else None
+            for v, group in itertools.groupby(col):
+                if value is not None and v != value:
+                    self._toggles[j] += 1
+                    start = row
+                row += sum(1 for _ in group)
+                if row - start > best_len:
+                    best_len, best_start = row - start, start
+                value = v
+            self._run_start[j] = start
+            self._best_len[j], self._best_start[j] = best_len, best_start
+
+        row, start, prev = self.rows, self._rep_start, self._prev
+        for r in rows:
+            if prev is not None:
+                if r == prev:
+                    self.repeated += 1
+                else:
+                    start = row
+            if row - start + 1 > self._rep_best[0]:
+                self._rep_best = (row - start + 1, start)
+            prev = r
+            row += 1
+        self._rep_start = start
+
+    # ---------- report ----------
+
+    def _pin_counts(self, j):
+        if self.use_numpy:
+            column = self._counts[j * 256:(j + 1) * 256]
+            counts = {chr(c): int(column[c]) for c in np.flatnonzero(column)}
+        else:
+            counts = dict(self._counts[j])
+        out = {v: counts.pop(v, 0) for v in VALUES}
+        out["other"] = sum(counts.values())
+        return out
+
+    def report(self):
+        pins = []
+        width = self.width or 0
+        names = self.pins[:width] + [f"col{j}" for j in range(len(self.pins), width)]
+        for j, name in enumerate(names):
+            counts = self._pin_counts(j)
+            drive = sum(counts[v] for v in DRIVE)
+            compare = sum(counts[v] for v in COMPARE)
+            toggles = int(self._toggles[j])
+            values = [v for v, n in counts.items() if n and v != "other"]
+            pins.append({
+                "pin": name,
+                "counts": counts,
+                "toggles": toggles,
+                "x_density": counts["X"] / self.rows,
+                "z_density": counts["Z"] / self.rows,
+                "drive_ratio": drive / (drive + compare) if drive + compare else None,
+                "constant": values[0] if toggles == 0 and len(values) == 1 else None,
+                "longest_idle": {"length": int(self._best_len[j]), "start": int(self._best_start[j])},
+            })
+        longest_repeat = {"length": self._rep_best[0], "start": self._rep_best[1]} if self.rows else None
+        return {
+            "engine": self.engine,
+            "vectors": self.rows,
+            "pin_count": width,
+            "toggles": sum(p["toggles"] for p in pins),
+            "repeated_rows": self.repeated,
+            "longest_repeat": longest_repeat,
+            "constant_pins": [p["pin"] for p in pins if p["constant"] is not None],
+            "masked_pins": [p["pin"] for p in pins if p["counts"][MASK] == self.rows],
+            "pins": pins,
+        }
+
+
+def pattern_stats(pattern, progress=None, use_numpy=None):
+    """Report for a whole Pattern (consumes its block stream)"""
+    stats = PatternStats(pattern.pins, use_numpy)
+    for block in track_blocks(pattern.blocks, progress):
+        stats.add(block.rows)
+    report = stats.report()
+    report["source"] = pattern.source
+    return report
+
+
+def stats_writer(pattern, vec_file, target="STATS", start=None, stop=None, progress=None):
+    """Writer factory (see formats.py): statistics report as <vec_file base>.stats.json"""
+    out_file, _ = output_path(vec_file, ".stats.json", start, stop)
+
+    def write(blocks):
+        stats = PatternStats(pattern.pins)
+        for block in track_blocks(blocks, progress, count=False):
+            stats.add(block.rows)
+        report = stats.report()
+        report["source"] = pattern.source
+        with open(out_file, "w") as f:
+            json.dump(report, f, indent=2)
+        log.info(f"STATS file written: {out_file}")
+    write.outputs = [out_file]
+    return write
+
+
+def print_report(report, top=10):
+    print(f"{report['source']}: {report['vectors']} vectors x {report['pin_count']} pins ({report['engine']})")
+    rep = report["longest_repeat"]
+    print(f"  toggles        : {report['toggles']}")
+    print(f"  repeated rows  : {report['repeated_rows']}" +
+          (f" (longest run {rep['length']} from vector {rep['start']})" if rep else ""))
+    print(f"  constant pins  : {', '.join(report['constant_pins']) or '-'}")
+    print(f"  masked pins    : {', '.join(report['masked_pins']) or '-'}")
+    print(f"  {'pin':<16}{'toggles':>10}{'X %':>8}{'Z %':>8}{'drive %':>9}  longest idle")
+    for p in sorted(report["pins"], key=lambda p: p["toggles"])[:top]:
+        drive = f"{p['drive_ratio'] * 100:.1f}" if p["drive_ratio"] is not None else "-"
+        idle = p["longest_idle"]
+        print(f"  {p['pin']:<16}{p['toggles']:>10}{p['x_density'] * 100:>8.1f}{p['z_density'] * 100:>8.1f}"
+              f"{drive:>9}  {idle['length']} from vector {idle['start']}")
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Pattern statistics v{sub_script_ver}")
+    parser.add_argument("file", help="input .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval")
+    parser.add_argument("--json", metavar="FILE", help="also save the full report as JSON")
+    parser.add_argument("--top", type=int, default=10, help="pins listed, least toggling first")
+    parser.add_argument("--no-numpy", action="store_true", help="use the pure-Python engine")
+    args = parser.parse_args()
+
+    ext = os.path.splitext(args.file)[1].lower()
+    if formats.get_reader(ext) is None:
+        log.error(f"Unsupported file type: {ext}")
+        sys.exit(1)
+    report = pattern_stats(formats.read(args.file, ext, interval=args.interval),
+                           use_numpy=False if args.no_numpy else None)
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
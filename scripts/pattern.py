@@ -0,0 +1,385 @@
+# pattern.py
+import os
+import re
+import queue
+import threading
+import logger
+import pipeline
+from progress import track_blocks, track_lines
+
+log = logger.get_logger("pattern")
+
+# Vectors are passed between readers and writers in blocks of this many rows
+BLOCK_SIZE = 4096
+# Blocks buffered per writer when one parse feeds several writers
+FANOUT_DEPTH = 8
+
+PERIOD_RE = re.compile(r"Period\s*:\s*([\d.]+)\s*ns", re.IGNORECASE)
+# .vec header line listing the timeset names used in its third column
+TIMESETS_RE = re.compile(r"^\s*Timesets\s*:(.*)$", re.IGNORECASE)
+MAX_TIMESETS = 256
+
+
+class Timesets:
+    """Timeset dictionary: names in first-seen order; a vector stores its name's index (one byte)"""
+
+    def __init__(self, names=()):
+        self.names = []
+        self._codes = {}
+        for name in names:
+            self.code(name)
+
+    def code(self, name):
+        """Index of name, added if it is new"""
+        code = self._codes.get(name)
+        if code is None:
+            if len(self.names) == MAX_TIMESETS:
+                raise ValueError(f"more than {MAX_TIMESETS} timesets")
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __getitem__(self, code):
+        return self.names[code]
+
+    def __repr__(self):
+        return f"Timesets({self.names!r})"
+
+
+class VectorBlock:
+    """A run of consecutive vectors.
+
+    rows     : vector strings, one character per pin
+    comments : {row offset: [comment lines]} - text after the '#' of every comment line
+               in front of that row; offset len(rows) holds comments after the last vector
+    tsets    : bytearray, the Pattern.timesets index of every row; None = all index 0
+    """
+    __slots__ = ("start", "rows", "comments", "tsets")
+
+    def __init__(self, start, rows, comments=None, tsets=None):
+        self.start = start
+        self.rows = rows
+        self.comments = comments or {}
+        self.tsets = tsets
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class Pattern:
+    """A parsed input: pin names plus a one-shot stream of VectorBlocks.
+
+    pins     : pin names in vector-column order
+    cmf_pins : pin names in the order the .cmf lists them (default: pins reversed)
+    timesets : Timesets the blocks' tsets index into; None for a single-timeset pattern, which
+               every writer gives its default timeset (WFT / TS1)
+    """
+
+    def __init__(self, pins, blocks, source="", period=None, cmf_pins=None, cmf_text=None, count=None,
+                 timesets=None):
+        self.pins = list(pins)
+        self.blocks = blocks
+        self.count = count  # number of vectors, when known before reading
+        self.source = source
+        self.period = period
+        self.cmf_pins = list(cmf_pins) if cmf_pins is not None else self.pins[::-1]
+        self.cmf_text = cmf_text  # original .cmf contents, when the input came with one
+        self.timesets = timesets
+
+    def cmf(self):
+        """.cmf file contents for this pattern"""
+        if self.cmf_text is not None:
+            return self.cmf_text
+        return "".join(f"{pin},{idx},T2,USE\n" for idx, pin in enumerate(self.cmf_pins))
+
+
+def blocks_from_records(records, header=None, block_size=BLOCK_SIZE, timesets=None):
+    """Group (vector, comment) records into VectorBlocks.
+    header: comment lines placed in front of the first vector (the .vec file header)
+    timesets: a Timesets; records are then (vector, comment, timeset name)"""
+    if timesets is not None:
+        yield from _timed_blocks_from_records(records, header, block_size, timesets)
+        return
+    rows = []
+    comments = {0: list(header)} if header else {}
+    start = 0
+    for vec, comment in records:
+        if comment:
+            comments.setdefault(len(rows), []).append(comment)
+        rows.append(vec)
+        if len(rows) == block_size:
+            yield VectorBlock(start, rows, comments)
+            start += len(rows)
+            rows, comments = [], {}
+    if rows or comments:
+        yield VectorBlock(start, rows, comments)
+
+
+def _timed_blocks_from_records(records, header, block_size, timesets):
+    rows = []
+    tsets = bytearray()
+    comments = {0: list(header)} if header else {}
+    start = 0
+    name, code = None, 0
+    for vec, comment, tset in records:
+        if tset != name:
+            name, code = tset, timesets.code(tset)
+        if comment:
+            comments.setdefault(len(rows), []).append(comment)
+        rows.append(vec)
+        tsets.append(code)
+        if len(rows) == block_size:
+            yield VectorBlock(start, rows, comments, tsets)
+            start += len(rows)
+            rows, comments, tsets = [], {}, bytearray()
+    if rows or comments:
+        yield VectorBlock(start, rows, comments, tsets)
+
+
+# -------------------- Fan-out --------------------
+
+class FanOutAborted(Exception):
+    """Raised inside a writer when the shared input stream failed"""
+
+
+_END = object()
+_ABORT = object()
+
+
+def _drain(q, state):
+    while True:
+        block = q.get()
+        if block is _END:
+            state["done"] = True
+            return
+        if block is _ABORT:
+            state["done"] = True
+            raise FanOutAborted("input stream aborted")
+        yield block
+
+
+def fan_out(blocks, writers, depth=FANOUT_DEPTH):
+    """Feed one block stream to several writers.
+
+    Each writer is a callable taking an iterator of blocks; it runs on its own thread
+    behind a bounded queue, so a slow writer holds back the parser instead of memory growing.
+    The first error (from the input or any writer) is re-raised once all threads have stopped."""
+    if len(writers) == 1:
+        writers[0](blocks)
+        return
+
+    queues = [queue.Queue(depth) for _ in writers]
+    errors = []
+
+    def run(writer, q):
+        state = {"done": False}
+        try:
+            writer(_drain(q, state))
+        except FanOutAborted:
+            pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # keep consuming so the producer never blocks on a writer that stopped early
+            while not state["done"]:
+                if q.get() in (_END, _ABORT):
+                    state["done"] = True
+
+    threads = [threading.Thread(target=run, args=(w, q), daemon=True) for w, q in zip(writers, queues)]
+    for t in threads:
+        t.start()
+
+    end = _END
+    try:
+        for block in blocks:
+            for q in queues:
+                q.put(block)
+    except BaseException as e:
+        errors.insert(0, e)
+        end = _ABORT
+    finally:
+        for q in queues:
+            q.put(end)
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+
+# -------------------- Output naming --------------------
+
+def output_path(vec_file, extension, start=None, stop=None):
+    """(output path, pattern name) next to vec_file, suffixed with the vector range if any"""
+    base_name = os.path.splitext(os.path.basename(vec_file))[0]
+    if start is not None or stop is not None:
+        base_name = f"{base_name}_{start or 0}_{stop if stop is not None else 'end'}"
+    return os.path.join(os.path.dirname(vec_file), f"{base_name}{extension}"), base_name
+
+
+# -------------------- .vec text --------------------
+
+def read_vec_blocks(vec_file, block_size=BLOCK_SIZE, progress=None, timesets=None):
+    """Read a .vec losslessly into VectorBlocks (every comment line is kept)"""
+    with open(vec_file, "r") as f:
+        yield from vec_line_blocks(track_lines(f, progress), block_size, timesets=timesets)
+
+
+def vec_line_blocks(lines, block_size=BLOCK_SIZE, start=0, timesets=None):
+    """VectorBlocks from .vec text lines; vectors are numbered from `start`.
+    timesets: a Timesets to read the third (timeset name) column into; its 'Timesets :' header
+    line is then dropped, since writing the blocks out adds it again"""
+    rows = []
+    comments = {}
+    pending = []
+    tsets = bytearray() if timesets is not None else None
+    name, code = None, 0
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith("#"):
+            if tsets is None or not TIMESETS_RE.match(stripped[1:]):
+                pending.append(line.rstrip("\r\n").lstrip()[1:])
+            continue
+        parts = stripped.split()
+        if len(parts) < 2:
+            continue
+        if pending:
+            comments[len(rows)] = pending
+            pending = []
+        rows.append(parts[1])
+        if tsets is not None:
+            # a vector without a name keeps the timeset of the one before
+            if len(parts) > 2 and parts[2] != name:
+                name, code = parts[2], timesets.code(parts[2])
+            tsets.append(code)
+        if len(rows) == block_size:
+            yield VectorBlock(start, rows, comments, tsets)
+            start += len(rows)
+            rows, comments = [], {}
+            if tsets is not None:
+                tsets = bytearray()
+
+    if pending:
+        comments[len(rows)] = pending
+    if rows or comments:
+        yield VectorBlock(start, rows, comments, tsets)
+
+
+def write_vec_blocks(blocks, vec_file, timesets=None):
+    """Write VectorBlocks as .vec text: '#' comment lines and '<num> <vector>' rows.
+    With timesets every row gets its timeset name as a third column, and the names are listed
+    in a '# Timesets : ...' first line"""
+    if timesets is not None:
+        return _write_timed_vec_blocks(blocks, vec_file, timesets)
+    with pipeline.open_output(vec_file) as f:
+        for block in blocks:
+            comments = block.comments
+            idx = block.start
+            for i, row in enumerate(block.rows):
+                if i in comments:
+                    f.write("".join(f"#{c}\n" for c in comments[i]))
+                f.write(f"{idx} {row}\n")
+                idx += 1
+            tail = comments.get(len(block.rows))
+            if tail:
+                f.write("".join(f"#{c}\n" for c in tail))
+    return vec_file
+
+
+def _write_timed_vec_blocks(blocks, vec_file, timesets):
+    names = timesets.names
+    with pipeline.open_output(vec_file) as f:
+        f.write(f"# Timesets     : {', '.join(names)}\n")
+        for block in blocks:
+            comments = block.comments
+            idx = block.start
+            tsets = block.tsets if block.tsets is not None else bytes(len(block.rows))
+            for i, row in enumerate(block.rows):
+                if i in comments:
+                    f.write("".join(f"#{c}\n" for c in comments[i]))
+                f.write(f"{idx} {row} {names[tsets[i]]}\n")
+                idx += 1
+            tail = comments.get(len(block.rows))
+            if tail:
+                f.write("".join(f"#{c}\n" for c in tail))
+    return vec_file
+
+
+def vec_writer(pattern, vec_file, target="VEC", start=None, stop=None, progress=None):
+    """Writer factory (see formats.py): .vec text plus its .cmf"""
+    out_file, _ = output_path(vec_file, ".vec", start, stop)
+    cmf_file = os.path.splitext(out_file)[0] + ".cmf"
+
+    def write(blocks):
+        with open(cmf_file, "w") as f:
+            f.write(pattern.cmf())
+        log.info(f"CMF file written: {cmf_file}")
+        write_vec_blocks(track_blocks(blocks, progress, count=False), out_file, pattern.timesets)
+        log.info(f"VEC file written: {out_file}")
+    write.outputs = [out_file, cmf_file]
+    return write
+
+
+def timesets_from_comments(comment_lines):
+    """Timesets from a '# Timesets : a, b' header line, or None"""
+    for line in comment_lines:
+        m = TIMESETS_RE.match(line)
+        if m:
+            return Timesets(n.strip() for n in m.group(1).split(",") if n.strip())
+    return None
+
+
+def read_vec_timesets(vec_file):
+    """Timesets declared in the leading comment lines of a .vec, or None"""
+    head = []
+    with open(vec_file, "r") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped and not stripped.startswith("#"):
+                break
+            head.append(stripped[1:])
+    return timesets_from_comments(head)
+
+
+def period_from_comments(comment_lines):
+    """Period (ns, as text) from a '# Period : <x> ns' header line, if any"""
+    for line in comment_lines:
+        m = PERIOD_RE.search(line)
+        if m:
+            return m.group(1)
+    return None
+
+
+# -------------------- .cmf --------------------
+
+def write_cmf_file(cmf_pins, cmf_file):
+    """Write .cmf lines '<pin>,<idx>,T2,USE' in the given order"""
+    with open(cmf_file, "w") as f:
+        for idx, pin in enumerate(cmf_pins):
+            f.write(f"{pin},{idx},T2,USE\n")
+    return cmf_file
+
+
+def parse_cmf_pins(cmf_text):
+    """Pin names in vector-column order from .cmf text (USE pins, file order reversed)"""
+    pins = []
+    for line in cmf_text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split(",")
+        if len(parts) < 4:
+            continue
+        if parts[3].strip().upper() == "USE":
+            pins.append(parts[0].strip())
+    pins.reverse()
+    return pins
@@ -0,0 +1,181 @@
+# pipeline.py
+import queue
+import threading
+
+# Overlapped read / parse / format / write. Off by default; once enabled (main.py --pipeline):
+#   - progress.track_lines reads input lines in batches on a reader thread
+#   - main runs the reader's block stream (parsing) on its own thread via prefetch()
+#   - open_output() files hand their writes to a writer thread
+# Every hand-over is a bounded queue, so a slow stage holds back the ones before it instead of
+# memory growing, and end-to-end time approaches the slowest stage instead of the sum.
+
+PIPELINE_DEPTH = 8                 # items (line batches, blocks, write chunks) queued per stage
+READ_BATCH_BYTES = 1024 * 1024     # size hint for one batch of input lines
+WRITE_CHUNK_CHARS = 1024 * 1024    # writes are joined into chunks of about this size
+
+_enabled = False
+_depth = PIPELINE_DEPTH
+
+_END = object()
+
+
+class _Raised:
+    """Carries an exception from a worker thread to the consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def enable(depth=PIPELINE_DEPTH):
+    global _enabled, _depth
+    _enabled, _depth = True, depth
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+# -------------------- Read side --------------------
+
+def prefetch(iterable, depth=None):
+    """Iterate `iterable` on a background thread, staying up to `depth` items ahead.
+    Errors are re-raised in the consumer; stopping early stops (and closes) the producer."""
+    q = queue.Queue(depth or _depth)
+    stop = threading.Event()
+
+    def produce():
+        it = iter(iterable)
+        try:
+            for item in it:
+                if stop.is_set():
+                    break
+                q.put(item)
+            else:
+                q.put(_END)
+        except BaseException as e:
+            q.put(_Raised(e))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None and stop.is_set():
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                return
+            if isinstance(item, _Raised):
+                error, item = item.error, None
+                try:
+                    raise error
+                finally:
+                    # no reference cycle through the traceback: the producer's generators
+                    # (and their reader threads) are released as soon as the error is handled
+                    error = None
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue so it can see the stop
+        while thread.is_alive():
+            try:
+                q.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+
+def read_batches(f, batch_bytes=READ_BATCH_BYTES):
+    """(lines, byte position after them) for an open text file, read on a reader thread"""
+    raw = getattr(f, "buffer", f)
+
+    def batches():
+        while True:
+            lines = f.readlines(batch_bytes)
+            if not lines:
+                return
+            yield lines, raw.tell()
+
+    return prefetch(batches())
+
+
+# -------------------- Write side --------------------
+
+class WriteBehind:
+    """Output file whose writes are joined into chunks and written by a writer thread"""
+
+    def __init__(self, path, mode="w", depth=None, chunk_chars=WRITE_CHUNK_CHARS):
+        self._f = open(path, mode)
+        self._q = queue.Queue(depth or _depth)
+        self._chunk_chars = chunk_chars
+        self._pending = []
+        self._size = 0
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, data):
+        self._pending.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_chars:
+            self._flush()
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _flush(self):
+        if self._error is not None:
+            raise self._error
+        if self._pending:
+            self._q.put(self._pending[0] if len(self._pending) == 1 else "".join(self._pending))
+            self._pending, self._size = [], 0
+
+    def _run(self):
+        while True:
+            data = self._q.get()
+            if data is _END:
+                return
+            if self._error is None:
+                try:
+                    self._f.write(data)
+                except BaseException as e:
+                    self._error = e
+
+    def close(self):
+        if self._f.closed:
+            return
+        try:
+            self._flush()
+        finally:
+            self._q.put(_END)
+            self._thread.join()
+            self._f.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # keep the original error; the partial output is removed by the caller
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+def open_output(path, mode="w"):
+    """open(path, mode), or a WriteBehind file while the pipeline is enabled"""
+    if _enabled:
+        return WriteBehind(path, mode)
+    return open(path, mode)
@@ -0,0 +1,168 @@
+# preview.py
+import os
+import re
+import mmap
+import threading
+from array import array
+from pattern import parse_cmf_pins
+from vecindex import VECTOR_FIRST, VECTOR_REST, is_vector_line, line_marks, scan_lines
+
+# Random access to the vectors of a .vec/.atp/.pat without reading the whole file.
+# The index is a checkpoint (byte offset) every PREVIEW_STRIDE vectors and is only built
+# as far as the rows asked for so far, so opening a file is instant and memory stays flat.
+
+PREVIEW_STRIDE = 256
+# Pin names are taken from the first HEADER_SCAN bytes of .atp/.pat files
+HEADER_SCAN = 1024 * 1024
+
+# Vector lines are counted in newline-aligned chunks of this size while indexing (vecindex.scan_lines);
+# about PREVIEW_STRIDE lines of a typical pattern, so many chunks hold no checkpoint and are not walked
+SCAN_CHUNK = 4 * 1024
+
+ATP_VECTOR = re.compile(rb"\s*>\s*\S+\s+([^;]+);(?:\s*//(.*))?")
+PAT_VECTOR = re.compile(rb"\s*\*([^*]+)\*[^/]*(?://(.*))?")
+
+
+def _vec_line(line):
+    parts = line.split(None, 1)
+    if len(parts) == 2 and parts[0][:1] != b"#":
+        return parts[1].strip(), None
+    return None
+
+
+def _match_line(regex):
+    def decode(line):
+        m = regex.match(line)
+        if m is None:
+            return None
+        return m.group(1).replace(b" ", b"").strip(), m.group(2)
+    return decode
+
+
+def _starts_with(marker):
+    return lambda line: line.lstrip()[:1] == marker
+
+
+# extension -> (cheap vector-line test, decoder returning (bits, comment))
+DECODERS = {
+    ".vec": (is_vector_line, _vec_line),
+    ".atp": (_starts_with(b">"), _match_line(ATP_VECTOR)),
+    ".pat": (_starts_with(b"*"), _match_line(PAT_VECTOR)),
+}
+# extension -> the same test as line_marks regexes, used to index whole chunks
+MARKS = {
+    ".vec": (VECTOR_FIRST, VECTOR_REST),
+    ".atp": line_marks(rb"[ \t\r\x0b\x0c]*>"),
+    ".pat": line_marks(rb"[ \t\r\x0b\x0c]*\*"),
+}
+
+
+def supported(path):
+    return os.path.splitext(path)[1].lower() in DECODERS
+
+
+def read_pins(path):
+    """Pin names in vector-column order: from the .cmf next to a .vec, else the ATE header"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".vec":
+        cmf_file = os.path.splitext(path)[0] + ".cmf"
+        if not os.path.exists(cmf_file):
+            return []
+        with open(cmf_file, "r") as f:
+            return parse_cmf_pins(f.read())
+
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SCAN).decode("latin-1")
+    if ext == ".atp":
+        m = re.search(r"\(\s*\$tset\s*,(.*)\)", head)
+    else:
+        m = re.search(r"HEADER\s*\n([^;]*);", head)
+    return [p.strip() for p in m.group(1).split(",") if p.strip()] if m else []
+
+
+class LazyVectorIndex:
+    """Vector number -> line offset, extended on demand (thread-safe)"""
+
+    def __init__(self, path, stride=PREVIEW_STRIDE):
+        self.path = path
+        self.stride = stride
+        ext = os.path.splitext(path)[1].lower()
+        self.is_vector, self.decode = DECODERS[ext]
+        self.marks = MARKS[ext]
+        self.size = os.path.getsize(path)
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._lock = threading.Lock()
+        self.offsets = array("Q")    # offsets[k]: start of the line of vector k*stride
+        self.count = 0               # vectors found so far
+        self._pos = 0                # scan position
+        self.complete = self.size == 0
+
+    def _scan(self, until=None, max_bytes=None):
+        """Scan forward until vector `until` is known, max_bytes were read, or EOF"""
+        mm, pos, stride, marks = self._mm, self._pos, self.stride, self.marks
+        stop = self.size if max_bytes is None else min(self.size, pos + max_bytes)
+        count = self.count
+        while pos < stop and (until is None or count <= until):
+            end = mm.find(b"\n", min(pos + SCAN_CHUNK, self.size - 1))
+            end = self.size if end < 0 else end + 1
+            n, starts = scan_lines(mm, pos, end, count, stride, 0, marks)
+            self.offsets.extend(starts)
+            count += n
+            pos = end
+        self.count = count
+        self._pos = pos
+        if pos >= self.size:
+            self.complete = True
+
+    def scan_some(self, max_bytes=4 * 1024 * 1024):
+        """Index the next max_bytes of the file (for background completion); True when done"""
+        with self._lock:
+            if not self.complete:
+                self._scan(max_bytes=max_bytes)
+            return self.complete
+
+    def estimated_count(self):
+        """Exact once complete; before that extrapolated from the bytes per vector seen so far"""
+        with self._lock:
+            if self.complete or not self.count:
+                return self.count
+            return self.count + int((self.size - self._pos) * self.count / self._pos)
+
+    def ready(self, start, n):
+        """True if rows(start, n) can be answered without scanning further"""
+        return self.complete or self.count >= start + n
+
+    def rows(self, start, n, wait=True):
+        """[(vector number, bits, comment)] for up to n vectors from `start`; only these lines are decoded.
+        wait=False: None instead of scanning if the index has not reached them yet (UI thread)"""
+        with self._lock:
+            if not self.ready(start, n):
+                if not wait:
+                    return None
+                self._scan(until=start + n)
+            if start >= self.count:
+                return []
+            k = start // self.stride
+            pos = self.offsets[k]
+            num = k * self.stride
+            out = []
+            while pos < self.size and len(out) < n:
+                end = self._mm.find(b"\n", pos)
+                end = self.size if end < 0 else end + 1
+                line = self._mm[pos:end]
+                pos = end
+                if not self.is_vector(line):
+                    continue
+                if num >= start:
+                    bits, comment = self.decode(line) or (line.strip(), None)
+                    out.append((num, bits.decode("latin-1"),
+                                comment.decode("latin-1").strip() if comment else ""))
+                num += 1
+            return out
+
+    def close(self):
+        with self._lock:
+            if self.size:
+                self._mm.close()
+            self._f.close()
@@ -0,0 +1,191 @@
+# profiler.py
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Opt-in per-stage profiling for main.run_conversion(profile=...) and `main.py --profile`.
+# Nothing here is imported unless profiling is requested. The profiler travels with the run's
+# progress.Progress (its .profiler), and readers and writers charge their blocks and batches to
+# stages through progress.stage()/staged()/sanitized(), so concurrent profiled runs stay apart.
+
+STAGES = ["parse", "sample", "sanitize", "format", "write"]
+
+
+class StageStats:
+    __slots__ = ("seconds", "calls", "peak_bytes")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.peak_bytes = 0
+
+
+class ProfileReport:
+    """Result of a profiled conversion: per-stage time/calls/peak memory plus counters"""
+
+    def __init__(self, source, total_seconds, stages, counters, cprofile_file=None):
+        self.source = source
+        self.total_seconds = total_seconds
+        self.stages = stages        # {stage: StageStats}
+        self.counters = counters    # {"lines": .., "vectors": .., "bytes_in": .., "bytes_out": ..}
+        self.cprofile_file = cprofile_file
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "total_seconds": round(self.total_seconds, 6),
+            "stages": {name: {"seconds": round(s.seconds, 6), "calls": s.calls,
+                              "peak_kb": round(s.peak_bytes / 1024, 1)}
+                       for name, s in self.stages.items()},
+            "counters": dict(self.counters),
+            "cprofile_file": self.cprofile_file,
+        }
+
+    def save(self, json_file):
+        with open(json_file, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return json_file
+
+    def __str__(self):
+        # stage seconds are CPU time; what is left of the wall time went to I/O, waiting and
+        # work outside any stage (worker processes included)
+        staged = sum(s.seconds for s in self.stages.values())
+        whole = max(self.total_seconds, staged)
+        lines = [f"Profile of {self.source} ({self.total_seconds:.3f} s)",
+                 f"{'stage':<10}{'seconds':>10}{'share':>8}{'calls':>12}{'peak KB':>12}"]
+        for name, s in self.stages.items():
+            share = s.seconds / whole if whole else 0.0
+            lines.append(f"{name:<10}{s.seconds:>10.3f}{share:>8.1%}{s.calls:>12,}{s.peak_bytes / 1024:>12,.1f}")
+        other = whole - staged
+        lines.append(f"{'other':<10}{other:>10.3f}{other / whole if whole else 0.0:>8.1%}")
+        lines.append("  ".join(f"{k}={v:,}" for k, v in self.counters.items()))
+        return "\n".join(lines)
+
+
+class Profiler:
+    """Exclusive per-stage CPU time: while a nested stage runs (e.g. sanitize inside parse) its
+    time is charged to it, not to the enclosing stage. Stage stacks are per thread and timed with
+    the thread's own CPU clock, so a writer thread blocked on the fan_out queue, the GIL or the
+    disk is charged nothing, and the stages of all threads add up to no more than the run's CPU
+    time. Formatting done on worker processes (workers > 1) is not seen.
+
+    memory        : also track the tracemalloc peak reached while each stage was running; this
+                    slows every allocation down, so the times of such a run are not representative
+                    (and tracemalloc is process-wide, so concurrent runs share the peaks)
+    json_file     : also save the report there
+    cprofile_file : dump cProfile stats of the calling thread there"""
+
+    def __init__(self, memory=False, json_file=None, cprofile_file=None):
+        self.memory = memory
+        self.json_file = json_file
+        self.cprofile_file = cprofile_file
+        self.stats = {name: StageStats() for name in STAGES}
+        self.counters = {"lines": 0, "vectors": 0, "bytes_in": 0, "bytes_out": 0}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._started_tracemalloc = False
+        self._t0 = 0.0
+        self.total_seconds = 0.0
+
+    # ---------- stage accounting ----------
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _charge(self, name, seconds, call):
+        peak = 0
+        if self.memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        with self._lock:
+            s = self.stats.get(name)
+            if s is None:
+                s = self.stats[name] = StageStats()
+            s.seconds += seconds
+            s.calls += call
+            if peak > s.peak_bytes:
+                s.peak_bytes = peak
+
+    def _enter(self, name):
+        stack = self._stack()
+        now = time.thread_time()
+        if stack:
+            parent = stack[-1]
+            self._charge(parent[0], now - parent[1], 0)
+        stack.append([name, time.thread_time()])
+
+    def _exit(self):
+        stack = self._stack()
+        name, t0 = stack.pop()
+        now = time.thread_time()
+        self._charge(name, now - t0, 1)
+        if stack:
+            stack[-1][1] = time.thread_time()
+
+    @contextmanager
+    def stage(self, name):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def iterate(self, name, iterable):
+        """Charge the time spent producing each item of iterable to `name`"""
+        it = iter(iterable)
+        while True:
+            self._enter(name)
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            yield item
+
+    def wrap(self, name, writer):
+        """Writer (see formats.py) run as stage `name`; keeps its .outputs"""
+        def timed(blocks):
+            with self.stage(name):
+                writer(blocks)
+        timed.outputs = writer.outputs
+        return timed
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # ---------- run ----------
+
+    def start(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        if self.cprofile_file:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._t0 = time.perf_counter()
+
+    def stop(self):
+        self.total_seconds = time.perf_counter() - self._t0
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_file)
+            self._cprofile = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def report(self, source=""):
+        stages = {name: s for name, s in self.stats.items() if s.calls or name in STAGES}
+        report = ProfileReport(source, self.total_seconds, stages, self.counters, self.cprofile_file)
+        if self.json_file:
+            report.save(self.json_file)
+        return report
+
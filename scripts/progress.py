@@ -0,0 +1,288 @@
+# progress.py
+import os
+import sys
+import time
+import threading
+from itertools import islice
+from contextlib import nullcontext
+import logger
+import pipeline
+
+log = logger.get_logger("progress")
+
+# Callbacks fire at most this often, however often update() is called
+PROGRESS_INTERVAL_S = 0.2
+# Line-based readers report their file position every this many lines
+LINES_PER_UPDATE = 4096
+
+
+class Cancelled(Exception):
+    """Raised at the next cancellation point after CancelToken.cancel()"""
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised at the next progress point once the process is over its memory budget"""
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB: /proc on Linux, GetProcessMemoryInfo on Windows,
+    psutil (optional) elsewhere; None where it cannot be read"""
+    try:
+        if sys.platform == "win32":
+            return _windows_rss() / (1024 * 1024)
+        if os.path.exists("/proc/self/statm"):
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError, ImportError):
+        return None
+
+
+def _windows_rss():
+    """Working set of this process in bytes (K32GetProcessMemoryInfo, in kernel32 since Windows 7)"""
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    kernel32.K32GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD]
+    counters = Counters()
+    counters.cb = ctypes.sizeof(Counters)
+    if not kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        raise OSError(ctypes.GetLastError(), "GetProcessMemoryInfo failed")
+    return counters.WorkingSetSize
+
+
+class CancelToken:
+    """Cooperative cancellation shared between the caller and a running conversion"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled("Conversion cancelled")
+
+
+class ProgressInfo:
+    """Snapshot handed to progress callbacks"""
+    __slots__ = ("stage", "bytes_read", "total_bytes", "vectors", "total_vectors", "elapsed", "rate", "eta")
+
+    def __init__(self, stage, bytes_read, total_bytes, vectors, total_vectors, elapsed):
+        self.stage = stage
+        self.bytes_read = bytes_read
+        self.total_bytes = total_bytes
+        self.vectors = vectors
+        self.total_vectors = total_vectors
+        self.elapsed = elapsed
+        self.rate = vectors / elapsed if elapsed > 0 else 0.0  # vectors/s
+        self.eta = None                                          # seconds left, if known
+        if total_vectors and vectors:
+            self.eta = elapsed * (total_vectors - vectors) / vectors
+        elif total_bytes and bytes_read:
+            self.eta = elapsed * (total_bytes - bytes_read) / bytes_read
+
+    @property
+    def fraction(self):
+        if self.total_vectors:
+            return min(self.vectors / self.total_vectors, 1.0)
+        if self.total_bytes:
+            return min(self.bytes_read / self.total_bytes, 1.0)
+        return 0.0
+
+
+class Progress:
+    """Rate-limited progress reporter and cancellation point.
+
+    Readers call read(position), the block stream calls vectors(n) and writers call check();
+    the callback only runs every PROGRESS_INTERVAL_S, so calling these per block is cheap.
+    With memory_budget (MB) set, the resident size is checked as often and MemoryBudgetExceeded
+    raised when it is over. profiler (a profiler.Profiler, set for profiled runs) is what the
+    stage helpers below charge to."""
+
+    def __init__(self, callback=None, cancel=None, total_bytes=0, total_vectors=0, interval=PROGRESS_INTERVAL_S,
+                 memory_budget=None):
+        self.callback = callback
+        self.cancel = cancel
+        self.total_bytes = total_bytes
+        self.total_vectors = total_vectors
+        self.interval = interval
+        self.stage = ""
+        self.bytes_read = 0
+        self.vector_count = 0
+        self.lines = 0
+        self.profiler = None
+        self._t0 = time.monotonic()
+        self._next = 0.0
+        self.memory_budget = memory_budget
+        self._next_memory_check = 0.0
+        if memory_budget and current_rss_mb() is None:
+            log.warning("Memory budget is not enforced on this platform")
+            self.memory_budget = None
+
+    def set_stage(self, stage):
+        self.stage = stage
+        self._report(force=True)
+
+    def read(self, position):
+        self.bytes_read = position
+        self._report()
+
+    def vectors(self, n):
+        self.vector_count += n
+        self._report()
+
+    def check(self):
+        if self.cancel is not None:
+            self.cancel.check()
+        if self.memory_budget:
+            self._check_memory()
+
+    def _check_memory(self):
+        now = time.monotonic()
+        if now < self._next_memory_check:
+            return
+        self._next_memory_check = now + self.interval
+        rss = current_rss_mb()
+        if rss > self.memory_budget:
+            raise MemoryBudgetExceeded(f"Memory budget exceeded: {rss:.0f} MB in use, "
+                                       f"budget {self.memory_budget} MB")
+
+    def finish(self):
+        if self.total_bytes:
+            self.bytes_read = self.total_bytes
+        self._report(force=True)
+
+    def info(self):
+        return ProgressInfo(self.stage, self.bytes_read, self.total_bytes, self.vector_count,
+                            self.total_vectors, time.monotonic() - self._t0)
+
+    def _report(self, force=False):
+        if self.cancel is not None:
+            self.cancel.check()
+        if self.memory_budget:
+            self._check_memory()
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next:
+            return
+        self._next = now + self.interval
+        self.callback(self.info())
+
+
+# -------------------- Stream helpers --------------------
+
+def track_lines(f, progress):
+    """Iterate a text file, reporting its byte position every LINES_PER_UPDATE lines"""
+    if pipeline.enabled():
+        # lines are read in batches on a reader thread; report once per batch
+        batches = pipeline.read_batches(f)
+        try:
+            for lines, position in batches:
+                if progress is not None:
+                    progress.lines += len(lines)
+                    progress.read(position)
+                yield from lines
+        finally:
+            # stop the reader thread now, not when the traceback holding this frame goes away
+            batches.close()
+        return
+    if progress is None:
+        yield from f
+        return
+    raw = getattr(f, "buffer", f)
+    n = 0
+    try:
+        for line in f:
+            n += 1
+            if n == LINES_PER_UPDATE:
+                progress.lines += n
+                n = 0
+                progress.read(raw.tell())
+            yield line
+    finally:
+        # also when the reader stops early (ATP halt, a vector range)
+        progress.lines += n
+
+
+def track_blocks(blocks, progress, count=True):
+    """Pass VectorBlocks through, counting vectors (count=True) and checking for cancellation"""
+    if progress is None:
+        yield from blocks
+        return
+    for block in blocks:
+        if count:
+            progress.vectors(len(block))
+        else:
+            progress.check()
+        yield block
+
+
+# Profiled runs charge work to stages (profiler.py) through the Progress every reader and writer
+# already receives. Stages are entered once per block or batch, never per vector, so an unprofiled
+# run pays nothing and a profiled one only a little.
+
+def stage(progress, name):
+    """Context charging the enclosed work to profiler stage `name`"""
+    prof = getattr(progress, "profiler", None)
+    return nullcontext() if prof is None else prof.stage(name)
+
+
+def staged(iterable, progress, name):
+    """iterable with the time spent producing each item (a block or batch) charged to `name`"""
+    prof = getattr(progress, "profiler", None)
+    return iterable if prof is None else prof.iterate(name, iterable)
+
+
+def staged_batches(iterable, progress, name, size=LINES_PER_UPDATE):
+    """iterable produced `size` items at a time, each batch charged to `name`"""
+    prof = getattr(progress, "profiler", None)
+    if prof is None:
+        return iterable
+    return (item for batch in prof.iterate(name, _batches(iterable, size)) for item in batch)
+
+
+def _batches(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def sanitized(records, func, progress, size=LINES_PER_UPDATE):
+    """Records (data, ...) with data replaced by func(data), a batch at a time; each batch is one
+    call of the sanitize stage"""
+    for batch in _batches(records, size):
+        with stage(progress, "sanitize"):
+            data = list(map(func, [r[0] for r in batch]))
+        for d, r in zip(data, batch):
+            yield (d,) + r[1:]
+
+
+def remove_outputs(paths):
+    """Delete partial outputs of a failed or cancelled conversion"""
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                log.info(f"Removed partial output: {path}")
+        except OSError as e:
+            log.warning(f"Could not remove '{path}': {e}")
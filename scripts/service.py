@@ -0,0 +1,458 @@
+# service.py
+import os
+import sys
+import json
+import time
+import hashlib
+import itertools
+import threading
+import multiprocessing
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import metadata
+import logger
+import formats
+import jobs
+from progress import CancelToken, Cancelled
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("service")
+
+# Local conversion service: main.run_conversion behind a small HTTP/JSON API on localhost, run on a
+# pool of worker processes that are started (and have every converter imported) once, so build
+# scripts pay neither interpreter start-up nor imports per pattern.
+#
+#   POST   /jobs               {"path", "targets", "dec", "interval", "range", "memory_budget"} -> job
+#   GET    /jobs               all jobs
+#   GET    /jobs/<id>          one job (status, progress, outputs, error)
+#   GET    /jobs/<id>/events   the job as one JSON line per change, until it finishes
+#   DELETE /jobs/<id>          cancel
+#   GET    /health
+#
+# A job is keyed by a hash of its input file, DEC file and options. Submitting the same file with
+# the same options again returns the queued/running job, or the finished one while its outputs
+# still exist, instead of converting again. As in jobs.JobQueue, jobs writing the same output
+# base never run at the same time.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+HASH_CHUNK = 1024 * 1024
+MAX_FINISHED = 1000         # finished jobs kept for status queries
+EVENT_TIMEOUT_S = 15.0      # an unchanged job is re-sent this often on /events (keep-alive)
+
+FINISHED = (jobs.DONE, jobs.FAILED, jobs.CANCELLED)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------- Worker processes --------------------
+
+_updates = None     # progress queue shared with the service process
+
+
+class _SharedCancel(CancelToken):
+    """CancelToken backed by a Manager event, so the service process can cancel a worker's job"""
+
+    def __init__(self, event):
+        self._event = event
+
+
+def _init_worker(updates):
+    global _updates
+    _updates = updates
+    formats.load_all()
+
+
+def _warm():
+    return os.getpid()
+
+
+def _progress_dict(info):
+    return {"stage": info.stage, "bytes_read": info.bytes_read, "total_bytes": info.total_bytes,
+            "vectors": info.vectors, "total_vectors": info.total_vectors, "elapsed": info.elapsed,
+            "rate": info.rate, "eta": info.eta, "fraction": info.fraction}
+
+
+def _run_job(job_id, path, targets, dec_file, interval, vector_range, memory_budget, cancel_event):
+    """(output paths, seconds)"""
+    import main
+    _updates.put((job_id, jobs.RUNNING, None))
+    t0 = time.monotonic()
+    outputs = main.run_conversion(path, targets, dec_file, interval, vector_range,
+                                  progress=lambda info: _updates.put((job_id, jobs.RUNNING, _progress_dict(info))),
+                                  cancel=_SharedCancel(cancel_event), memory_budget=memory_budget)
+    if outputs is None:
+        raise RuntimeError("Conversion did not run")
+    return outputs, time.monotonic() - t0
+
+
+# -------------------- Service --------------------
+
+class ServiceJob:
+    """A submitted conversion; `version` goes up on every change"""
+
+    def __init__(self, key, path, targets, dec_file=None, interval=None, vector_range=None, memory_budget=None):
+        self.id = next(_ids)
+        self.key = key
+        self.path = path
+        self.targets = targets
+        self.dec_file = dec_file
+        self.interval = interval
+        self.vector_range = vector_range
+        self.memory_budget = memory_budget
+        self.status = jobs.QUEUED
+        self.progress = None
+        self.outputs = []
+        self.error = None
+        self.submitted = time.time()
+        self.duration = None
+        self.version = 0
+        self.cancel_event = None
+
+    @property
+    def base(self):
+        """Output files are written next to the input under this name"""
+        return os.path.splitext(self.path)[0]
+
+    def to_dict(self):
+        return {"id": self.id, "path": self.path, "targets": self.targets, "status": self.status,
+                "progress": self.progress, "outputs": self.outputs, "error": self.error,
+                "duration": self.duration, "version": self.version}
+
+
+_ids = itertools.count(1)
+
+
+class ConversionService:
+    """Runs submitted jobs on `workers` warm processes; thread-safe"""
+
+    def __init__(self, workers=jobs.DEFAULT_WORKERS):
+        self.workers = workers
+        self._manager = multiprocessing.Manager()
+        self._updates = self._manager.Queue()
+        self._pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self._updates,))
+        # start every worker now, before any request comes in
+        for f in [self._pool.submit(_warm) for _ in range(workers)]:
+            f.result()
+        self._jobs = {}         # id -> ServiceJob
+        self._by_key = {}       # key -> ServiceJob
+        self._waiting = []      # queued jobs not handed to the pool yet
+        self._busy = set()      # output bases of jobs in the pool
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reader = threading.Thread(target=self._read_updates, daemon=True)
+        self._reader.start()
+
+    # ---------- client side ----------
+
+    def submit(self, path, targets, dec_file=None, interval=None, vector_range=None, memory_budget=None):
+        """(job, deduplicated); ValueError if the job cannot run as given"""
+        path = os.path.abspath(path)
+        targets = [targets.upper()] if isinstance(targets, str) else [t.upper() for t in targets or []]
+        dec_file = os.path.abspath(dec_file) if dec_file else None
+        vector_range = tuple(vector_range) if vector_range else None
+        reader = formats.get_reader(os.path.splitext(path)[1])
+        if not targets and reader is not None and not reader.intermediate:
+            raise ValueError("No target given")
+        for target in targets or ["VEC"]:
+            error = jobs.check_job(jobs.Job(path, target, dec_file, interval))
+            if error:
+                raise ValueError(f"{target}: {error}")
+
+        key = hashlib.sha256(json.dumps([path, file_digest(path), targets,
+                                         file_digest(dec_file) if dec_file else None,
+                                         interval, vector_range]).encode()).hexdigest()
+        with self._cond:
+            job = self._by_key.get(key)
+            if job is not None and (job.status in (jobs.QUEUED, jobs.RUNNING) or
+                                    (job.status == jobs.DONE and all(map(os.path.exists, job.outputs)))):
+                return job, True
+            job = ServiceJob(key, path, targets, dec_file, interval, vector_range, memory_budget)
+            job.cancel_event = self._manager.Event()
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._waiting.append(job)
+            self._forget_old()
+            log.info(f"Job {job.id}: {path} -> {', '.join(targets) or 'VEC'}")
+            self._dispatch()
+        return job, False
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._cond:
+            return [j.to_dict() for j in self._jobs.values()]
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.cancel_event.set()
+            if job in self._waiting:
+                self._waiting.remove(job)
+                job.status = jobs.CANCELLED
+                self._changed(job)
+            return True
+
+    def wait_change(self, job, version, timeout=EVENT_TIMEOUT_S):
+        """Block until the job's version differs from `version` (or timeout); returns its dict"""
+        with self._cond:
+            self._cond.wait_for(lambda: job.version != version, timeout)
+            return job.to_dict()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for job in self._waiting:
+                job.status = jobs.CANCELLED
+            self._waiting = []
+            for job in self._jobs.values():
+                if job.status not in FINISHED:
+                    job.cancel_event.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._updates.put(None)
+        self._reader.join()
+        self._manager.shutdown()
+
+    # ---------- service side ----------
+
+    def _changed(self, job):
+        job.version += 1
+        self._cond.notify_all()
+
+    def _dispatch(self):
+        """Hand waiting jobs to the pool unless a job with the same output base is in it (holds _cond)"""
+        for job in list(self._waiting):
+            if job.base in self._busy:
+                continue
+            self._waiting.remove(job)
+            self._busy.add(job.base)
+            future = self._pool.submit(_run_job, job.id, job.path, job.targets, job.dec_file, job.interval,
+                                       job.vector_range, job.memory_budget, job.cancel_event)
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+    def _read_updates(self):
+        while True:
+            item = self._updates.get()
+            if item is None:
+                return
+            job_id, status, progress = item
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in FINISHED:
+                    continue
+                job.status = status
+                if progress is not None:
+                    job.progress = progress
+                self._changed(job)
+
+    def _finish(self, job, future):
+        with self._cond:
+            self._busy.discard(job.base)
+            if future.cancelled():
+                job.status = jobs.CANCELLED
+            else:
+                error = future.exception()
+                if error is None:
+                    job.status = jobs.DONE
+                    job.outputs, job.duration = future.result()
+                elif isinstance(error, Cancelled):
+                    job.status = jobs.CANCELLED
+                else:
+                    job.status, job.error = jobs.FAILED, str(error) or type(error).__name__
+            self._changed(job)
+            if not self._closed:
+                self._dispatch()
+        log.info(f"Job {job.id}: {job.status}" + (f" ({job.error})" if job.error else ""))
+
+    def _forget_old(self):
+        finished = [j for j in self._jobs.values() if j.status in FINISHED]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+
+# -------------------- HTTP --------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = f"VektorConverter/{sub_script_ver}"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, fmt, *args):
+        log.debug(fmt % args)
+
+    def _send(self, code, doc):
+        body = json.dumps(doc).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job(self, part):
+        try:
+            return self.service.get(int(part))
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["health"]:
+            return self._send(200, {"version": sub_script_ver, "workers": self.service.workers})
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": self.service.list()})
+        job = self._job(parts[1]) if len(parts) in (2, 3) and parts[0] == "jobs" else None
+        if job is None:
+            return self._send(404, {"error": "Not found"})
+        if len(parts) == 2:
+            return self._send(200, job.to_dict())
+        if parts[2] != "events":
+            return self._send(404, {"error": "Not found"})
+        # one JSON line per change; the response ends when the job does
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        version = None
+        try:
+            while True:
+                doc = self.service.wait_change(job, version)
+                version = doc["version"]
+                self.wfile.write(json.dumps(doc).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                if doc["status"] in FINISHED:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            return self._send(404, {"error": "Not found"})
+        try:
+            doc = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            job, deduplicated = self.service.submit(doc["path"], doc.get("targets"), doc.get("dec"),
+                                                    doc.get("interval"), doc.get("range"), doc.get("memory_budget"))
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            return self._send(400, {"error": str(e) or type(e).__name__})
+        self._send(200 if deduplicated else 202, dict(job.to_dict(), deduplicated=deduplicated))
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        job = self._job(parts[1]) if len(parts) == 2 and parts[0] == "jobs" else None
+        if job is None:
+            return self._send(404, {"error": "Not found"})
+        self._send(200, dict(job.to_dict(), cancelling=self.service.cancel(job.id)))
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=jobs.DEFAULT_WORKERS):
+    service = ConversionService(workers)
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    log.info(f"Conversion service on http://{host}:{port} with {workers} worker(s), Ctrl+C to stop")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+        service.close()
+
+
+# -------------------- Client --------------------
+
+class ServiceClient:
+    """Client for a running service; errors from the service are raised as RuntimeError"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=60):
+        self.url = f"http://{host}:{port}"
+        self.timeout = timeout
+
+    def _call(self, method, path, doc=None):
+        data = json.dumps(doc).encode("utf-8") if doc is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(json.loads(e.read() or b"{}").get("error", str(e))) from None
+
+    def health(self):
+        return self._call("GET", "/health")
+
+    def submit(self, path, targets=None, dec_file=None, interval=None, vector_range=None, memory_budget=None):
+        return self._call("POST", "/jobs", {"path": os.path.abspath(path), "targets": targets,
+                                            "dec": os.path.abspath(dec_file) if dec_file else None,
+                                            "interval": interval, "range": vector_range,
+                                            "memory_budget": memory_budget})
+
+    def status(self, job_id):
+        return self._call("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id):
+        return self._call("DELETE", f"/jobs/{job_id}")
+
+    def events(self, job_id):
+        """Yield the job's dict on every change until it finishes"""
+        with urllib.request.urlopen(f"{self.url}/jobs/{job_id}/events", timeout=EVENT_TIMEOUT_S * 2) as r:
+            for line in r:
+                yield json.loads(line)
+
+    def convert(self, path, targets=None, dec_file=None, interval=None, vector_range=None, on_progress=None):
+        """Submit and wait; returns the finished job's dict"""
+        job = self.submit(path, targets, dec_file, interval, vector_range)
+        for job in self.events(job["id"]):
+            if on_progress is not None and job["progress"]:
+                on_progress(job["progress"])
+        return job
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"VektorConverter service v{sub_script_ver}")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="run the service")
+    p_serve.add_argument("-w", "--workers", type=int, default=jobs.DEFAULT_WORKERS, help="worker processes")
+    p_conv = sub.add_parser("convert", help="convert a file on a running service")
+    p_conv.add_argument("file")
+    p_conv.add_argument("-t", "--target", action="append", help="J750, C3380, C3850, VEC, VECB, STATS, VCD or STIL; may be repeated")
+    p_conv.add_argument("--dec", help="DEC file for Chroma targets")
+    p_conv.add_argument("--interval", type=int, help="VCD sampling interval")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            serve(args.host, args.port, args.workers)
+        except KeyboardInterrupt:
+            log.info("Stopped")
+    else:
+        client = ServiceClient(args.host, args.port)
+        try:
+            result = client.convert(args.file, args.target, args.dec, args.interval,
+                                    on_progress=lambda p: print(f"\r{p['fraction']:.0%} {p['rate']:.0f} vec/s",
+                                                                end="", flush=True))
+        except (RuntimeError, OSError) as e:
+            log.error(str(e))
+            sys.exit(1)
+        print()
+        if result["status"] != jobs.DONE:
+            log.error(f"{result['status']}: {result['error'] or ''}")
+            sys.exit(1)
+        log.info("\n".join(result["outputs"]))
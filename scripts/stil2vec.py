@@ -3,6 +3,8 @@ import os
 import re
 from datetime import datetime
 import metadata
+from progress import LINES_PER_UPDATE, track_blocks, remove_outputs, stage
+from pattern import Pattern, Timesets, blocks_from_records, write_vec_blocks
 
 author = metadata.author
 sub_script_ver = metadata.script_ver
@@ -32,80 +34,256 @@ def generate_cmf_from_pins(pin_list, cmf_file):
     return cmf_file
 
 # ---------------- STIL Parsing ----------------
-def parse_stil_period(stil_file):
+# The file is read in chunks of this many characters; only an unfinished statement is carried over
+STIL_CHUNK = 1024 * 1024
+
+V_BLOCK = re.compile(r'V\s*\{(.*?)\}', re.DOTALL | re.IGNORECASE)
+PATTERN_BLOCK = re.compile(r'\bPattern\s+"?[\w.\-]+"?\s*\{', re.IGNORECASE)
+# Statements followed in the Pattern: V { } (a vector), C { } (pin states without a vector),
+# W name; (the WaveformTable of the vectors after it) and Loop n { ... } (its body run n times)
+STATEMENT = re.compile(r'(V)\s*\{|\b(C)\s*\{|\bW\s+"?([\w.\-]+)"?\s*;|\bLoop\s+(\d+)\s*\{', re.IGNORECASE)
+# Where a statement may start whose first token is cut off at the end of the buffer
+STATEMENT_OPEN = re.compile(r'V\s*\Z|\bC\s*\Z|\bL(?:o(?:op?)?)?\Z|\bLoop\s*\d*\s*\Z|\bW\s*"?[\w.\-]*"?\s*\Z',
+                            re.IGNORECASE)
+# Everything a Loop body may hold; anything else in it is an error rather than a dropped repeat
+LOOP_BODY = re.compile(r'\s*(?:(V|C)\s*\{([^}]*)\}|W\s+"?([\w.\-]+)"?\s*;|Loop\s+(\d+)\s*\{'
+                       r'|Ann\s*\{\*.*?\*\}|"[^"]*"\s*:|[\w.\-]+\s*:)', re.DOTALL | re.IGNORECASE)
+# braces, skipping annotations Ann {* ... *} (one still open runs to the end of the text)
+BRACE = re.compile(r'\{\*.*?(?:\*\}|\Z)|[{}]', re.DOTALL)
+ASSIGNMENT = re.compile(r'"([^"]+)"\s*=\s*([^\s;]+);')
+WAVEFORM_TABLE = re.compile(r'WaveformTable\s+"?([\w.\-]+)"?\s*\{', re.IGNORECASE)
+
+def _read_chunks(stil_file, size=STIL_CHUNK):
+    with open(stil_file, "r") as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+def read_stil_header(stil_file):
+    """STIL text up to the first V { } block (Signals, Timing, ...), read without the patterns"""
+    header = ""
+    for chunk in _read_chunks(stil_file):
+        header += chunk
+        m = V_BLOCK.search(header)
+        if m:
+            return header[:m.start()]
+    return header
+
+def parse_stil_period(stil_file, header=None):
     """Extract period from STIL Timing block"""
     period = None
-    with open(stil_file, "r") as f:
-        content = f.read()
-        match = re.search(
-            r'Timing\s*\{.*?WaveformTable\s*"[^"]+"\s*\{.*?Period\s+[\'"]([\d\.]+)ns[\'"]',
-            content,
-            re.DOTALL | re.IGNORECASE
-        )
-        if match:
-            period = match.group(1)
+    content = read_stil_header(stil_file) if header is None else header
+    match = re.search(
+        r'Timing\s*\{.*?WaveformTable\s*"[^"]+"\s*\{.*?Period\s+[\'"]([\d\.]+)ns[\'"]',
+        content,
+        re.DOTALL | re.IGNORECASE
+    )
+    if match:
+        period = match.group(1)
     return period
 
-def parse_stil_pins(stil_file):
+def parse_stil_pins(stil_file, header=None):
     """Extract all signal names from STIL Signals block"""
-    with open(stil_file, "r") as f:
-        content = f.read()
-        signals_match = re.search(r"Signals\s*\{(.*?)\}", content, re.DOTALL | re.IGNORECASE)
-        if signals_match:
-            signals_block = signals_match.group(1)
-            return re.findall(r'"([^"]+)"', signals_block)
+    content = read_stil_header(stil_file) if header is None else header
+    signals_match = re.search(r"Signals\s*\{(.*?)\}", content, re.DOTALL | re.IGNORECASE)
+    if signals_match:
+        signals_block = signals_match.group(1)
+        return re.findall(r'"([^"]+)"', signals_block)
     return []
 
+def parse_stil_timesets(stil_file, header=None):
+    """Timesets of the WaveformTables in the Timing block; None if there is only one"""
+    content = read_stil_header(stil_file) if header is None else header
+    names = WAVEFORM_TABLE.findall(content)
+    return Timesets(names) if len(set(names)) > 1 else None
+
 def sanitize_value(val):
     """Ensure vector values are only L,H,0,1,X"""
     return VALUE_MAP.get(val, 'X')
 
-def parse_stil_vectors(stil_file, pins):
-    """Return vector lines for STIL file based on pin order, mapping all values to allowed characters"""
+def _closing_brace(text, pos):
+    """Index of the '}' that closes the '{' just before pos; -1 if it is not in text yet"""
+    depth = 1
+    for m in BRACE.finditer(text, pos):
+        if len(m.group()) > 1:
+            continue
+        depth += 1 if m.group() == "{" else -1
+        if depth == 0:
+            return m.start()
+    return -1
+
+def _loop_body(text, source, assignments=True):
+    """Statements of a complete Loop body (the text between its braces), as _statements gives them"""
+    body = []
+    pos = 0
+    while pos < len(text):
+        m = LOOP_BODY.match(text, pos)
+        if m is None:
+            if not text[pos:].strip():
+                break
+            raise ValueError(f"{source}: cannot expand Loop statement at '{text[pos:pos + 40].strip()}'")
+        pos = m.end()
+        if m.group(1):
+            body.append((m.group(1).upper(), 0, ASSIGNMENT.findall(m.group(2)) if assignments else None))
+        elif m.group(3):
+            body.append(("W", 0, m.group(3)))
+        elif m.group(4):
+            close = _closing_brace(text, pos)
+            if close < 0:
+                raise ValueError(f"{source}: unbalanced braces in Loop {m.group(4)}")
+            body.append(("Loop", 0, (int(m.group(4)), _loop_body(text[pos:close], source, assignments))))
+            pos = close + 1
+    return body
+
+def _statements(buffer, source, assignments=True):
+    """Complete statements in buffer: (list of (kind, end, argument), where the rest starts).
+    kind V/C: argument is the (pin, value) assignments; W: the table name; Loop: (repeat, body)"""
+    found = []
+    pos = 0
+    while True:
+        m = STATEMENT.search(buffer, pos)
+        if m is None:
+            break
+        if m.group(1) or m.group(2):
+            close = buffer.find("}", m.end())
+            if close < 0:
+                return found, m.start()
+            found.append(((m.group(1) or m.group(2)).upper(), close + 1,
+                          ASSIGNMENT.findall(buffer, m.end(), close) if assignments else None))
+        elif m.group(3):
+            close = m.end() - 1
+            found.append(("W", m.end(), m.group(3)))
+        else:
+            close = _closing_brace(buffer, m.end())
+            if close < 0:
+                return found, m.start()     # the Loop's end is in a later chunk
+            found.append(("Loop", close + 1, (int(m.group(4)),
+                                             _loop_body(buffer[m.end():close], source, assignments))))
+        pos = close + 1
+    m = STATEMENT_OPEN.search(buffer, pos)
+    return found, m.start() if m else len(buffer)
+
+def _sanitized(statements):
+    return [(kind, end, [(name, sanitize_value(val)) for name, val in arg]) if kind in ("V", "C")
+            else (kind, end, (arg[0], _sanitized(arg[1]))) if kind == "Loop" else (kind, end, arg)
+            for kind, end, arg in statements]
+
+def _iter_statements(stil_file, progress=None, assignments=True):
+    """Yield (characters before the chunk, its statements) for each chunk of the Pattern"""
+    # the header may define a waveform character C; statements only count inside the Pattern
+    m = PATTERN_BLOCK.search(read_stil_header(stil_file))
+    skip = m.end() if m else 0
+    consumed = 0    # characters of the file before `buffer`
+    buffer = ""
+    for chunk in _read_chunks(stil_file):
+        if progress is not None:
+            progress.lines += chunk.count("\n")
+        buffer += chunk
+        if skip:
+            cut = min(skip, len(buffer))
+            consumed, buffer, skip = consumed + cut, buffer[cut:], skip - cut
+        found, keep = _statements(buffer, stil_file, assignments)
+        yield consumed, found
+        consumed += keep
+        buffer = buffer[keep:]
+
+def count_stil_vectors(stil_file):
+    """Vectors of the STIL file, Loops expanded, without building them"""
+    def count(statements):
+        return sum(1 if kind == "V" else arg[0] * count(arg[1]) if kind == "Loop" else 0
+                   for kind, _, arg in statements)
+    return sum(count(found) for _, found in _iter_statements(stil_file, assignments=False))
+
+def iter_stil_vectors(stil_file, pins, progress=None, timesets=None):
+    """Yield vector lines for STIL file based on pin order, mapping all values to allowed characters.
+    The file is scanned a chunk at a time, so memory does not grow with its size.
+    timesets: the file's Timesets (parse_stil_timesets); yield (vector, WaveformTable) instead"""
     state = {p: 'X' for p in pins}  # all pins default to X
-    vectors = []
+    n = 0
+    tset = timesets[0] if timesets else None
+    # a profiled run sanitizes each chunk on its own so the stage can be timed; otherwise values
+    # are mapped as they are assigned, without copying the statements
+    profiled = progress is not None and progress.profiler is not None
+    value = (lambda val, default: val) if profiled else VALUE_MAP.get
 
-    with open(stil_file, "r") as f:
-        content = f.read()
-        # Find all V { ... } blocks
-        v_blocks = re.findall(r'V\s*\{(.*?)\}', content, re.DOTALL | re.IGNORECASE)
-        for block in v_blocks:
-            # Update only pins listed in this block
-            for name, val in re.findall(r'"([^"]+)"\s*=\s*([^\s;]+);', block):
-                if name in state:
-                    state[name] = sanitize_value(val)
-            # Build vector line in pin order
-            vec_line = "".join(state[p] for p in pins)
-            vectors.append(vec_line)
-    return vectors
+    def run(statements, consumed, loop_end=None):
+        nonlocal n, tset
+        for kind, end, arg in statements:
+            if kind == "V":
+                if progress and not n % LINES_PER_UPDATE:
+                    progress.read(consumed + (loop_end or end))
+                n += 1
+                # Update only pins listed in this block
+                for name, val in arg:
+                    if name in state:
+                        state[name] = value(val, 'X')
+                # Build vector line in pin order
+                vec = "".join(state[p] for p in pins)
+                yield vec if timesets is None else (vec, tset)
+            elif kind == "C":
+                for name, val in arg:
+                    if name in state:
+                        state[name] = value(val, 'X')
+            elif kind == "W":
+                tset = arg
+            else:
+                repeat, body = arg
+                for _ in range(repeat):
+                    yield from run(body, consumed, loop_end or end)
 
-# ---------------- Callable Function ----------------
-def convert_stil_to_vec(stil_file_path):
-    """Convert STIL file to .vec and .cmf; returns (vec_file, cmf_file)"""
-    stil_file = os.path.abspath(stil_file_path)
-    base_name = os.path.splitext(os.path.basename(stil_file))[0]
+    for consumed, found in _iter_statements(stil_file, progress):
+        if profiled:
+            with stage(progress, "sanitize"):
+                found = _sanitized(found)
+        yield from run(found, consumed)
 
-    period = parse_stil_period(stil_file)
-    pins = parse_stil_pins(stil_file)
-    vectors = parse_stil_vectors(stil_file, pins)
+def parse_stil_vectors(stil_file, pins, progress=None):
+    """Return vector lines for STIL file based on pin order, mapping all values to allowed characters"""
+    return list(iter_stil_vectors(stil_file, pins, progress))
 
-    if not pins and vectors:
-        pins = [f"PIN{i}" for i in range(len(vectors[0]))]
+# ---------------- Pattern reader ----------------
+def read_pattern(stil_file_path, progress=None):
+    """Parse STIL once into a Pattern whose blocks are exactly the .vec convert_stil_to_vec writes"""
+    stil_file = os.path.abspath(stil_file_path)
 
-    cmf_file = os.path.join(os.path.dirname(stil_file), base_name + ".cmf")
-    generate_cmf_from_pins(pins, cmf_file)
+    header = read_stil_header(stil_file)
+    period = parse_stil_period(stil_file, header)
+    pins = parse_stil_pins(stil_file, header)
+    timesets = parse_stil_timesets(stil_file, header)
+    vectors = iter_stil_vectors(stil_file, pins, progress, timesets)
 
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    vec_file = os.path.join(os.path.dirname(stil_file), base_name + ".vec")
-    with open(vec_file, "w") as f:
-        f.write("########################################################\n")
-        f.write(f"# Generated by VektorConverter: stil2vec v{sub_script_ver}\n")
-        f.write(f"# STIL File    : {stil_file}\n")
-        if period:
-            f.write(f"# Period       : {period} ns\n")
-        f.write(f"# Timestamp    : {timestamp}\n")
-        f.write("########################################################\n")
-        for idx, vec in enumerate(vectors):
-            f.write(f"{idx} {vec}\n")
+    header = [
+        "#######################################################",
+        f" Generated by VektorConverter: stil2vec v{sub_script_ver}",
+        f" STIL File    : {stil_file}",
+    ]
+    if period:
+        header.append(f" Period       : {period} ns")
+    header += [
+        f" Timestamp    : {timestamp}",
+        "#######################################################",
+    ]
+    if timesets is None:
+        blocks = blocks_from_records(((vec, None) for vec in vectors), header=header)
+    else:
+        blocks = blocks_from_records(((vec, None, tset) for vec, tset in vectors), header=header,
+                                     timesets=timesets)
+    return Pattern(pins, blocks, source=stil_file, period=period, timesets=timesets)
+
+# ---------------- Callable Function ----------------
+def convert_stil_to_vec(stil_file_path, progress=None):
+    """Convert STIL file to .vec and .cmf; returns (vec_file, cmf_file)"""
+    pattern = read_pattern(stil_file_path, progress)
+    base = os.path.splitext(pattern.source)[0]
+
+    cmf_file = generate_cmf_from_pins(pattern.pins, base + ".cmf")
+    try:
+        vec_file = write_vec_blocks(track_blocks(pattern.blocks, progress), base + ".vec", pattern.timesets)
+    except BaseException:
+        remove_outputs([base + ".vec", cmf_file])
+        raise
 
     return vec_file, cmf_file
@@ -0,0 +1,277 @@
+# transform.py
+import os
+import sys
+import json
+import metadata
+import logger
+import formats
+from pattern import Pattern, VectorBlock, fan_out
+from progress import Progress, Cancelled, track_blocks, remove_outputs
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("transform")
+
+# Declarative edits applied to the block stream between a reader and the writers:
+#   {"op": "mask",   "pins": ["A", "B"], "start": 1000, "stop": 5000}   H/L compares -> X
+#   {"op": "force",  "pins": ["A"], "value": "0"}                        every vector -> value
+#   {"op": "invert", "pins": ["C"]}                                      0<->1, H<->L
+#   {"op": "swap",   "pins": ["D", "E"]}                                 exchange two columns
+#   {"op": "map",    "pins": ["F"], "map": "HL:10"}                      any state -> state
+# start/stop select vectors [start, stop) of the stream; without them a rule covers every vector.
+#
+# Rules are compiled once: the ranges split the stream into segments, and inside a segment all
+# rules fold into one column permutation plus one 256-byte translate table per touched column.
+# A block is packed into a bytearray ("\n"-joined rows), so a column is the extended slice
+# [j::width + 1] and each touched column costs one C-level translate per segment, however many
+# rules there are.
+
+OPS = ("mask", "force", "invert", "swap", "map")
+
+_IDENTITY = bytes(range(256))
+
+
+def _table(src, dst):
+    return bytes.maketrans(src.encode("latin-1"), dst.encode("latin-1"))
+
+
+MASK_TABLE = _table("HLhl", "XXXX")
+INVERT_TABLE = _table("01HLhl", "10LHlh")
+
+
+def map_table(spec):
+    """'HL:10' -> translate table turning H into 1 and L into 0"""
+    src, _, dst = spec.partition(":")
+    if not src or len(src) != len(dst):
+        raise ValueError(f"map '{spec}' needs as many characters after ':' as before")
+    return _table(src, dst)
+
+
+class Segment:
+    """Vectors [start, stop) and what happens to them: out[j] = tables[j][row[perm[j]]]"""
+    __slots__ = ("start", "stop", "perm", "tables")
+
+    def __init__(self, start, stop, width):
+        self.start = start
+        self.stop = stop
+        self.perm = list(range(width))
+        self.tables = {}
+
+    @property
+    def identity(self):
+        return not self.tables and self.perm == sorted(self.perm)
+
+    def translate(self, col, table):
+        self.tables[col] = self.tables.get(col, _IDENTITY).translate(table)
+
+    def swap(self, a, b):
+        self.perm[a], self.perm[b] = self.perm[b], self.perm[a]
+        ta, tb = self.tables.pop(a, None), self.tables.pop(b, None)
+        if ta is not None:
+            self.tables[b] = ta
+        if tb is not None:
+            self.tables[a] = tb
+
+
+def load_rules(path):
+    """Rule list from a JSON file (a list, or {"rules": [...]})"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["rules"] if isinstance(data, dict) else data
+
+
+def _check_rule(rule, index):
+    op = rule.get("op")
+    pins = rule.get("pins")
+    if op not in OPS:
+        raise ValueError(f"rule {index}: unknown op '{op}' (use {', '.join(OPS)})")
+    if not pins:
+        raise ValueError(f"rule {index}: no pins")
+    if op == "swap" and len(pins) != 2:
+        raise ValueError(f"rule {index}: swap takes two pins")
+    if op == "force" and len(str(rule.get("value", ""))) != 1:
+        raise ValueError(f"rule {index}: force needs a one-character value")
+    if op == "map":
+        map_table(rule.get("map", ""))
+
+
+def compile_rules(rules, pins):
+    """Segments covering the rules' ranges (vectors outside every segment pass unchanged)"""
+    index = {pin: i for i, pin in enumerate(pins)}
+    for n, rule in enumerate(rules):
+        _check_rule(rule, n)
+        unknown = [p for p in rule["pins"] if p not in index]
+        if unknown:
+            raise ValueError(f"rule {n}: unknown pins {', '.join(unknown)}")
+
+    cuts = {0}
+    for rule in rules:
+        cuts.add(rule.get("start") or 0)
+        if rule.get("stop") is not None:
+            cuts.add(rule["stop"])
+    cuts = sorted(cuts) + [None]
+
+    segments = []
+    for start, stop in zip(cuts, cuts[1:]):
+        seg = Segment(start, stop, len(pins))
+        for rule in rules:
+            r_start, r_stop = rule.get("start") or 0, rule.get("stop")
+            if start < r_start or (r_stop is not None and (stop is None or stop > r_stop)):
+                continue
+            cols = [index[p] for p in rule["pins"]]
+            op = rule["op"]
+            if op == "swap":
+                seg.swap(*cols)
+                continue
+            if op == "mask":
+                table = MASK_TABLE
+            elif op == "invert":
+                table = INVERT_TABLE
+            elif op == "force":
+                table = str(rule["value"]).encode("latin-1") * 256
+            else:
+                table = map_table(rule["map"])
+            for col in cols:
+                seg.translate(col, table)
+        if not seg.identity:
+            segments.append(seg)
+    return segments
+
+
+def _apply(packed, seg, first, last, stride):
+    """Transform rows [first, last) of a packed block in place"""
+    lo, hi = first * stride, last * stride
+    part = packed[lo:hi]
+    src = bytes(part)
+    for col, from_col in enumerate(seg.perm):
+        if from_col != col:
+            part[col::stride] = src[from_col::stride]
+    for col, table in seg.tables.items():
+        part[col::stride] = part[col::stride].translate(table)
+    packed[lo:hi] = part
+
+
+def transform_blocks(blocks, segments, width):
+    """Apply compiled segments to a block stream; rows keep their comments"""
+    stride = width + 1
+    for block in blocks:
+        rows, n = block.rows, len(block.rows)
+        begin, end = block.start, block.start + n
+        hits = [s for s in segments if s.start < end and (s.stop is None or s.stop > begin)]
+        if not hits or not n:
+            yield block
+            continue
+        joined = "\n".join(rows)
+        if len(joined) != n * stride - 1 or any(len(r) != width for r in rows):
+            joined = "\n".join(r[:width].ljust(width, "X") for r in rows)   # ragged input
+        packed = bytearray(joined.encode("latin-1"))
+        for seg in hits:
+            first = max(seg.start, begin) - begin
+            last = (min(seg.stop, end) if seg.stop is not None else end) - begin
+            _apply(packed, seg, first, last, stride)
+        yield VectorBlock(block.start, packed.decode("latin-1").split("\n"), block.comments, block.tsets)
+
+
+def apply_rules(pattern, rules):
+    """Pattern whose block stream has `rules` applied (pins and header stay the same)"""
+    segments = compile_rules(rules, pattern.pins)
+    log.info(f"{len(rules)} transform rules in {len(segments)} segments")
+    if not segments:
+        return pattern
+    blocks = transform_blocks(pattern.blocks, segments, len(pattern.pins))
+    return Pattern(pattern.pins, blocks, source=pattern.source, period=pattern.period,
+                   cmf_pins=pattern.cmf_pins, cmf_text=pattern.cmf_text, count=pattern.count,
+                   timesets=pattern.timesets)
+
+
+def transform_file(path, rules, out_file, targets=("VEC",), dec_file=None, interval=None,
+                   progress=None, cancel=None, workers=None):
+    """Read `path`, apply `rules` and write every target next to out_file; returns the files written"""
+    ext = os.path.splitext(path)[1].lower()
+    if formats.get_reader(ext) is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    vec_file = os.path.splitext(out_file)[0] + ".vec"
+    tracker = Progress(progress, cancel, total_bytes=os.path.getsize(path))
+    pattern = apply_rules(formats.read(path, ext, progress=tracker, interval=interval), rules)
+    tracker.total_vectors = pattern.count or 0
+
+    writers = [formats.make_writer(t, pattern, vec_file, progress=tracker, dec_file=dec_file,
+                                   script_ver=sub_script_ver, workers=workers) for t in targets]
+    outputs = [p for w in writers for p in w.outputs]
+    # the input is streamed, so no output may replace it
+    if any(os.path.abspath(p) == os.path.abspath(path) for p in outputs):
+        raise ValueError(f"Output would overwrite the input: {path}")
+
+    tracker.set_stage("transform")
+    try:
+        fan_out(track_blocks(pattern.blocks, tracker), writers)
+    except BaseException as e:
+        if isinstance(e, Cancelled):
+            log.info("Transform cancelled")
+        remove_outputs(outputs)
+        raise
+    tracker.finish()
+    log.info(f"Transformed {tracker.vector_count} vectors: {', '.join(outputs)}")
+    return outputs
+
+
+def parse_rule(op, text):
+    """CLI rule 'A,B@1000-5000' (force: 'A,B=0', map: 'A,B=HL:10'; the range is optional)"""
+    body, _, vectors = text.partition("@")
+    rule = {"op": op}
+    if op in ("force", "map"):
+        body, _, arg = body.partition("=")
+        rule["value" if op == "force" else "map"] = arg
+    rule["pins"] = [p.strip() for p in body.replace("/", ",").split(",") if p.strip()]
+    if vectors:
+        start, _, stop = vectors.partition("-")
+        try:
+            rule["start"] = int(start) if start else None
+            rule["stop"] = int(stop) if stop else None
+        except ValueError:
+            raise ValueError(f"bad vector range '{vectors}' (use START-STOP)")
+    return rule
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    from functools import partial
+    parser = argparse.ArgumentParser(description=f"Pattern transform v{sub_script_ver}")
+    parser.add_argument("file", help="input .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("-o", "--output", required=True, help="output .vec (other targets use its base name)")
+    parser.add_argument("-t", "--target", action="append",
+                        help="VEC (default), VECB, STATS, VCD, STIL, J750, C3380 or C3850; may be repeated")
+    parser.add_argument("-r", "--rules", help="JSON rule file; applied before the rules below")
+    # rules given on the command line keep their order (after the file's rules)
+    parser.add_argument("--mask", action="append", dest="cli_rules", type=partial(parse_rule, "mask"),
+                        metavar="PINS[@START-STOP]", help="H/L compares -> X")
+    parser.add_argument("--force", action="append", dest="cli_rules", type=partial(parse_rule, "force"),
+                        metavar="PINS=V[@START-STOP]", help="drive or compare a fixed state")
+    parser.add_argument("--invert", action="append", dest="cli_rules", type=partial(parse_rule, "invert"),
+                        metavar="PINS[@START-STOP]", help="0<->1, H<->L")
+    parser.add_argument("--swap", action="append", dest="cli_rules", type=partial(parse_rule, "swap"),
+                        metavar="A/B[@START-STOP]", help="exchange two pins' columns")
+    parser.add_argument("--map", action="append", dest="cli_rules", type=partial(parse_rule, "map"),
+                        metavar="PINS=FROM:TO[@START-STOP]", help="e.g. HL:10")
+    parser.add_argument("--dec", help="DEC file for Chroma targets")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval")
+    args = parser.parse_args()
+
+    targets = [t.upper() for t in args.target or ["VEC"]]
+    unknown = [t for t in targets if formats.get_writer(t) is None]
+    if unknown:
+        log.error(f"Unknown output type: {', '.join(unknown)}")
+        sys.exit(1)
+    if any(t in ("C3380", "C3850") for t in targets) and not args.dec:
+        log.error("DEC file required")
+        sys.exit(1)
+    try:
+        rules = (load_rules(args.rules) if args.rules else []) + (args.cli_rules or [])
+        if not rules:
+            log.error("No rules given")
+            sys.exit(1)
+        transform_file(args.file, rules, args.output, targets, args.dec, args.interval)
+    except (OSError, ValueError) as e:
+        log.error(str(e))
+        sys.exit(1)
@@ -2,10 +2,14 @@
 import re
 import os
 import metadata
+import logger
 from datetime import datetime
+from pattern import Pattern, blocks_from_records, write_vec_blocks, write_cmf_file
+from progress import track_lines, track_blocks, remove_outputs, staged_batches
 
 author = metadata.author
 sub_script_ver = metadata.script_ver
+log = logger.get_logger("vcd2vec")
 
 VALUE_MAP = {
     '1': '1',
@@ -17,7 +21,8 @@ VALUE_MAP = {
 }
 
 # ---------------------- CMF Generation ----------------------
-def generate_cmf_from_vcd(vcd_file, cmf_file=None):
+def read_vcd_pins(vcd_file):
+    """Pin names of the $var lines, in declaration order (the order the .cmf lists them)"""
     pins = []
     with open(vcd_file, "r") as f:
         for line in f:
@@ -27,15 +32,17 @@ def generate_cmf_from_vcd(vcd_file, cmf_file=None):
                 if len(parts) >= 5:
                     pin_name = " ".join(parts[4:-1])  # handle spaces in pin name
                     pins.append(pin_name)
+            elif line.startswith("$enddefinitions"):
+                break
+    return pins
 
+def generate_cmf_from_vcd(vcd_file, cmf_file=None):
     if not cmf_file:
         cmf_file = os.path.splitext(vcd_file)[0] + ".cmf"
 
-    with open(cmf_file, "w") as f:
-        for idx, pin in enumerate(pins):
-            f.write(f"{pin},{idx},T2,USE\n")
+    write_cmf_file(read_vcd_pins(vcd_file), cmf_file)
 
-    print(f"CMF file generated: {cmf_file}")
+    log.info(f"CMF file generated: {cmf_file}")
     return cmf_file
 
 # ---------------------- VCD Parsing ----------------------
@@ -76,40 +83,44 @@ def parse_header_info(filename):
 
             if stripped == "$end":
                 in_block = None
-            if stripped == "$enddefinitions":
+            if stripped.startswith("$enddefinitions"):
                 break
 
     return date, version, timescale, csum
 
-def parse_vcd(filename):
+def read_vcd_symbols(filename):
+    """(symbol, pin) of every $var line before $enddefinitions, in declaration order"""
     symbols = []
-    sym_to_index = {}
-    value_now = {}
-    timed_changes = {}
-
-    time = 0
-    in_dump = False
-
     with open(filename, "r") as f:
         for line in f:
             line = line.strip()
             if line.startswith("$var"):
                 parts = line.split()
-                symbol = parts[3]
                 pin = " ".join(parts[4:-1]) if len(parts) > 5 else parts[4]
-                sym_to_index[symbol] = len(symbols)
-                symbols.append((symbol, pin))
-                continue
+                symbols.append((parts[3], pin))
+            elif line.startswith("$enddefinitions"):
+                break
+    return symbols
+
+def iter_vcd_changes(filename, symbols, progress=None):
+    """Yield (time, [(symbol, value), ...]) for every #time in file order, as the file is read.
+    $dumpvars values are all kept; after that only changes of a pin's value are."""
+    known = {sym for sym, _ in symbols}
+    value_now = {}
+    time = 0
+    changes = []
+    in_dump = False
+
+    with open(filename, "r") as f:
+        for line in track_lines(f, progress):
+            line = line.strip()
             if line.startswith("#"):
-                time = int(line[1:])
-                if time not in timed_changes:
-                    timed_changes[time] = []
+                yield time, changes
+                time, changes = int(line[1:]), []
                 in_dump = False
                 continue
             if line == "$dumpvars":
                 in_dump = True
-                if 0 not in timed_changes:
-                    timed_changes[0] = []
                 continue
             if line == "$end" and in_dump:
                 in_dump = False
@@ -118,84 +129,103 @@ def parse_vcd(filename):
             if m:
                 raw_val, symbol = m.groups()
                 symbol = symbol.strip()
-                if symbol not in sym_to_index:
+                if symbol not in known:
                     continue
                 val = VALUE_MAP.get(raw_val, "X")
-                if in_dump:
-                    timed_changes[0].append((symbol, val))
+                if in_dump or value_now.get(symbol) != val:
                     value_now[symbol] = val
-                else:
-                    if value_now.get(symbol) != val:
-                        value_now[symbol] = val
-                        timed_changes[time].append((symbol, val))
+                    changes.append((symbol, val))
+    yield time, changes
+
+def sample_states(symbols, timed_changes, interval):
+    """Yield (time, row) every `interval` from 0 up to the last timestamp. The row at a sample time
+    holds every change at or before it; changes are applied as they stream past, so only the
+    current pin state is kept, however long the dump is."""
+    order = [sym for sym, _ in symbols]
+    state = {sym: "X" for sym in order}
+    row = lambda: "".join(map(state.__getitem__, order))
+    next_t = 0
+    last = 0
+
+    for time, changes in timed_changes:
+        # every sample before this timestamp sees the state so far
+        while next_t < time:
+            yield next_t, row()
+            next_t += interval
+        for sym, val in changes:
+            state[sym] = val
+        last = max(last, time)
+
+    while next_t <= last:
+        yield next_t, row()
+        next_t += interval
+
+def parse_vcd(filename, progress=None):
+    """(symbols, {time: changes}) of a whole VCD in memory; read_pattern streams instead"""
+    symbols = read_vcd_symbols(filename)
+    timed_changes = {}
+    for time, changes in iter_vcd_changes(filename, symbols, progress):
+        timed_changes.setdefault(time, []).extend(changes)
     return symbols, timed_changes
 
 def build_state_at_times(symbols, timed_changes, interval):
-    all_times = sorted(timed_changes.keys())
-    max_time = max(all_times)
-    target_times = [n * interval for n in range(1, max_time // interval + 1)]
-    state = {sym: "X" for sym, _ in symbols}
-    vec_rows = []
+    """[(time, row)] at every multiple of interval after 0, from parse_vcd's {time: changes}"""
+    return [(t, row) for t, row in sample_states(symbols, sorted(timed_changes.items()), interval) if t]
 
-    changes_iter = iter(all_times)
-    event_time = next(changes_iter, None)
-
-    for t in target_times:
-        while event_time is not None and event_time <= t:
-            for sym, val in timed_changes.get(event_time, []):
-                state[sym] = val
-            event_time = next(changes_iter, None)
-        row = "".join(state[sym] for sym, _ in symbols)
-        vec_rows.append((t, row))
+# ---------------------- Pattern reader ----------------------
+def read_pattern(vcd_file, interval, progress=None):
+    """Sample the VCD every `interval` time units into a Pattern whose blocks are
+    exactly the .vec convert_vcd_to_vec writes (each vector commented with its time)"""
+    date, version, timescale, csum = parse_header_info(vcd_file)
+    symbols = read_vcd_symbols(vcd_file)
 
-    return vec_rows
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ts_num = int(re.match(r"(\d+)", timescale).group(1))
+    freq = int(1e12 / (interval * ts_num))
+    header = [
+        "#######################################################",
+        f" Generated by VektorConverter: vcd2vec v{sub_script_ver}",
+        f" VCD                 : {vcd_file}",
+        f" User Input Timing   : [{interval}] x [{timescale}]",
+        f" Calculated Frequency: {freq} Hz",
+        f" Timestamp           : {timestamp}",
+        "#######################################################",
+    ]
+
+    def records():
+        # the first vector is the state after the time-0 changes, commented "0"
+        changes = staged_batches(iter_vcd_changes(vcd_file, symbols, progress), progress, "parse")
+        for t, row in staged_batches(sample_states(symbols, changes, interval), progress, "sample"):
+            yield row, str(t)
+
+    pins = [pin for _, pin in symbols]
+    return Pattern(pins, blocks_from_records(records(), header=header), source=vcd_file,
+                   cmf_pins=read_vcd_pins(vcd_file))
 
 # ---------------------- Export VEC + CMF ----------------------
-def convert_vcd_to_vec(vcd_file, interval, vec_file=None, cmf_file=None):
+def convert_vcd_to_vec(vcd_file, interval, vec_file=None, cmf_file=None, progress=None):
     """Convert a VCD to VEC + CMF. Returns paths of vec and cmf files."""
     if cmf_file is None:
         cmf_file = os.path.splitext(vcd_file)[0] + ".cmf"
     if vec_file is None:
         vec_file = os.path.splitext(vcd_file)[0] + ".vec"
 
-    generate_cmf_from_vcd(vcd_file, cmf_file)
-    date, version, timescale, csum = parse_header_info(vcd_file)
-    symbols, timed_changes = parse_vcd(vcd_file)
-
-    init_state = {sym: "X" for sym, _ in symbols}
-    for sym, val in timed_changes.get(0, []):
-        init_state[sym] = val
+    pattern = read_pattern(vcd_file, interval, progress)
+    write_cmf_file(pattern.cmf_pins, cmf_file)
+    log.info(f"CMF file generated: {cmf_file}")
+    try:
+        write_vec_blocks(track_blocks(pattern.blocks, progress), vec_file)
+    except BaseException:
+        remove_outputs([vec_file, cmf_file])
+        raise
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    vec_rows = build_state_at_times(symbols, timed_changes, interval)
-    ts_num = int(re.match(r"(\d+)", timescale).group(1))
-    freq = int(1e12 / (interval * ts_num))
-    print("i am here")
-    with open(vec_file, "w") as f:
-        f.write("########################################################\n")
-        f.write(f"# Generated by VektorConverter: vcd2vec v{sub_script_ver}\n")
-        f.write(f"# VCD                 : {vcd_file}\n")
-        #f.write(f"# Date     : {date}\n")
-        #f.write(f"# Version  : {version}\n")
-        #f.write(f"# Timescale: {timescale}\n")
-        #f.write(f"# Csum     : {csum}\n")
-        f.write(f"# User Input Timing   : [{interval}] x [{timescale}]\n")
-        f.write(f"# Calculated Frequency: {freq} Hz\n")
-        f.write(f"# Timestamp           : {timestamp}\n")
-        f.write("########################################################\n")
-        row0 = "".join(init_state[sym] for sym, _ in symbols)
-        f.write("#0\n0 " + row0 + "\n")
-        idx = 1
-        for t, row in vec_rows:
-            f.write(f"#{t}\n{idx} {row}\n")
-            idx += 1
-
-    print("VEC file written:", vec_file)
-    print("CMF file written:", cmf_file)
+    log.info(f"VEC file written: {vec_file}")
+    log.info(f"CMF file written: {cmf_file}")
     return vec_file, cmf_file
 
 # ---------------------- Optional CLI ----------------------
 if __name__ == "__main__":
+    logger.init_logger()
     print("#############################################################")
     print("#\t\t\t\t\t\tVektorConverter\t\t\t\t\t\t#")
     print(f"#\t\t\t\t\t\tvcd2vec + cmf v{sub_script_ver}\t\t\t\t\t#")
@@ -1,10 +1,21 @@
 # vec2ate.py
 import os
 from datetime import datetime
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import metadata
+import vecb
+import vecindex
+import pipeline
+import logger
+from pattern import (BLOCK_SIZE, TIMESETS_RE, Pattern, blocks_from_records, read_vec_blocks, read_vec_timesets,
+                     parse_cmf_pins, output_path)
+from progress import track_blocks, track_lines, remove_outputs, sanitized, stage, staged
 
 author = metadata.author
 sub_script_ver = metadata.script_ver
+log = logger.get_logger("vec2ate")
 
 # --- Allowed logic characters ---
 ALLOWED_LOGIC = {'0', '1', 'X', 'L', 'H','P'} ##added P from tst - clock pulse > 1
@@ -60,95 +71,153 @@ def sanitize_vector(data):
         for c in data
     )
 # --- Vector extraction ---
-def extract_vec_data_chroma(vec_file, num_pins=1):
-    vector_lines = []
-    current_comment = ""
-    first_line_of_section = True
-    first_vector_line = True
+def read_vec_records(vec_file, start=None, stop=None, progress=None, timesets=None):
+    """Yield (data, comment) per vector of a .vec file; comment is the last '#' line before it.
+    start/stop select vectors [start, stop) and seek through the .vec index instead of scanning.
+    timesets: the file's Timesets (read_vec_timesets); records are then (data, comment, timeset)"""
+    return sanitized(_vec_records(vec_file, start, stop, progress, timesets), sanitize_vector, progress)
+
+def _vec_records(vec_file, start, stop, progress, timesets):
+    """read_vec_records' records before sanitizing"""
+    if start:
+        f, skip = vecindex.open_at_vector(vec_file, start)
+    else:
+        f, skip = open(vec_file, 'r'), 0
+    count = (stop - (start or 0)) if stop is not None else None
 
-    with open(vec_file, 'r') as f:
-        for line in f:
+    current_comment = None
+    tset = timesets[0] if timesets else None
+    with f:
+        for line in track_lines(f, progress):
             line = line.strip()
             if not line:
                 continue
             if line.startswith('#'):
-                current_comment = line[1:].strip()
-                first_line_of_section = True
+                if timesets is None or not TIMESETS_RE.match(line[1:]):
+                    current_comment = line[1:].strip()
                 continue
             parts = line.split()
             if len(parts) < 2:
                 continue
-            data = sanitize_vector(parts[1])
-
-            if first_line_of_section:
-                if current_comment and first_vector_line:
-                    formatted = f"   *{data}*   TS1;//{current_comment}"
-                    first_vector_line = False
-                else:
-                    formatted = f"   *{data}*;      //{current_comment}" if current_comment else f"   *{data}*;"
-                first_line_of_section = False
+            if timesets is not None and len(parts) > 2:
+                tset = parts[2]
+            if skip:
+                skip -= 1
+                current_comment = None
+                continue
+            if count is not None:
+                if count <= 0:
+                    break
+                count -= 1
+            if timesets is not None:
+                yield parts[1], current_comment or None, tset
             else:
-                formatted = f"   *{data}*;      //{current_comment}" if current_comment else f"   *{data}*;"
-
-            vector_lines.append(formatted)
-            current_comment = ""
-
-    if vector_lines:
-        last_vector = vector_lines[-1]
-        stop_vector = last_vector.replace(";", "STOP  ;")
-        vector_lines[-1] = stop_vector
-        dummy_vector = f"   *{'X' * num_pins}*   ; // extra blank vector"
-        vector_lines.append(dummy_vector)
-
-    return "\n".join(vector_lines)
-
-def extract_vec_data_j750(vec_file, num_pins=1):
-    def spaced(bits):
-        return " ".join(bits)  # add spaces between characters
+                yield parts[1], current_comment or None
+            current_comment = None
+
+def read_vector(vec_file, vector_num):
+    """Look up a single vector by number; returns (data, comment)"""
+    for record in read_vec_records(vec_file, vector_num, vector_num + 1):
+        return record
+    raise IndexError(f"vector {vector_num} not found in {vec_file}")
+
+def records_from_blocks(blocks, timesets=None, progress=None):
+    """Same (data, comment) stream as read_vec_records, taken from VectorBlocks;
+    with timesets (the Pattern's) the records are (data, comment, timeset name)"""
+    for block in blocks:
+        comments = block.comments
+        with stage(progress, "sanitize"):
+            data = [sanitize_vector(row) for row in block.rows]
+        if timesets is not None:
+            names = timesets.names
+            tsets = block.tsets if block.tsets is not None else bytes(len(block.rows))
+            for i, row in enumerate(data):
+                comment = comments[i][-1].strip() if i in comments else None
+                yield row, comment or None, names[tsets[i]]
+            continue
+        for i, row in enumerate(data):
+            comment = comments[i][-1].strip() if i in comments else None
+            yield row, comment or None
+
+def _chroma_line(data, comment, ts=None):
+    """ts: name of the timeset this vector switches to, if any"""
+    if ts:
+        return f"   *{data}*   {ts};//{comment}" if comment else f"   *{data}*   {ts};"
+    return f"   *{data}*;      //{comment}" if comment else f"   *{data}*;"
+
+def _chroma_stop(line):
+    return line.replace(";", "STOP  ;")
+
+def _chroma_dummy(num_pins):
+    return f"   *{'X' * num_pins}*   ; // extra blank vector"
+
+def _j750_line(bits, comment, tset="WFT"):
+    spaced_bits = " ".join(bits)  # add spaces between characters
+    if comment:
+        return f"       > {tset}    {spaced_bits}; //{comment}"
+    return f"       > {tset}    {spaced_bits};"
+
+def _j750_dummy(width, tset="WFT"):
+    dummy = " ".join(["X"] * width)
+    return f"       > {tset}    {dummy}; //dummy vector"
+
+def iter_chroma_lines(records, num_pins=1):
+    """Chroma vector lines, one at a time; only the last line is held back (it gets STOP).
+    (data, comment, timeset) records name their timeset on every vector where it changes"""
+    first_vector_line = True
+    prev = None
+    tset = None
 
-    vectors = []
-    current_comment = None
-    first_in_section = False
+    for data, comment, *named in records:
+        if named:
+            ts = named[0] if named[0] != tset else None
+            tset = named[0]
+        else:
+            # TS1 goes on the first vector that has a comment
+            ts = "TS1" if comment and first_vector_line else None
+            if comment:
+                first_vector_line = False
+        formatted = _chroma_line(data, comment, ts)
+        if prev is not None:
+            yield prev
+        prev = formatted
+
+    if prev is not None:
+        yield _chroma_stop(prev)
+        yield _chroma_dummy(num_pins)
+
+def iter_j750_lines(records):
+    """J750 vector lines, one at a time; the last vector is held back so 'halt' can precede it"""
+    it = iter(records)
+    prev = next(it, None)
+    if prev is None:
+        return
+    more = False
+    for record in it:
+        yield _j750_line(*prev)
+        prev, more = record, True
 
-    with open(vec_file, 'r') as f:
-        for raw in f:
-            line = raw.strip()
-            if not line:
-                continue
-            if line.startswith('#'):
-                current_comment = line[1:].strip()
-                first_in_section = True
-                continue
-            parts = line.split()
-            if len(parts) < 2:
-                continue
-            data = sanitize_vector(parts[1])
+    # Insert halt before the last vector
+    if more:
+        yield "halt"
+    yield _j750_line(*prev)
 
-            if first_in_section:
-                vectors.append((data, current_comment))
-                first_in_section = False
-                current_comment = None
-            else:
-                vectors.append((data, None))
+    # Dummy vector, in the timeset of the last one
+    yield _j750_dummy(len(prev[0]), *prev[2:])
 
-    out = []
-    for i, (bits, comment) in enumerate(vectors):
-        spaced_bits = spaced(bits)
-        if comment:
-            out.append(f"       > WFT    {spaced_bits}; //{comment}")
-        else:
-            out.append(f"       > WFT    {spaced_bits};")
+def format_chroma_vectors(records, num_pins=1):
+    return "\n".join(iter_chroma_lines(records, num_pins))
 
-        # Insert halt before the last vector
-        if i == len(vectors) - 2:
-            out.append("halt")
+def format_j750_vectors(records):
+    return "\n".join(iter_j750_lines(records))
 
-    # Dummy vector
-    last_len = len(vectors[-1][0])
-    dummy = " ".join(["X"] * last_len)
-    out.append(f"       > WFT    {dummy}; //dummy vector")
+def extract_vec_data_chroma(vec_file, num_pins=1, start=None, stop=None):
+    timesets = read_vec_timesets(vec_file)
+    return format_chroma_vectors(read_vec_records(vec_file, start, stop, timesets=timesets), num_pins=num_pins)
 
-    return "\n".join(out)
+def extract_vec_data_j750(vec_file, num_pins=1, start=None, stop=None):
+    timesets = read_vec_timesets(vec_file)
+    return format_j750_vectors(read_vec_records(vec_file, start, stop, timesets=timesets))
 
 
 # --- CMF reader ---
@@ -167,15 +236,15 @@ def read_cmf_file(cmf_file):
                 if status.strip().upper() == "USE":
                     pins.append(pin_name.strip())
     except FileNotFoundError:
-        print(f"ERROR: CMF file '{cmf_file}' not found!")
+        log.error(f"CMF file '{cmf_file}' not found!")
         return ""
 
     if not pins:
-        print("WARNING: No pins with 'USE' found in CMF file.")
+        log.warning("No pins with 'USE' found in CMF file.")
 
     pins.reverse()
     pin_list = ','.join(pins)
-    print(f"Collected pins: {pin_list}")
+    log.info(f"Collected pins: {pin_list}")
     return pin_list
 
 # --- HEADER_PINS generator ---
@@ -223,10 +292,9 @@ def space_out_header(header_text):
     return "\n".join(output)
 
 # --- Fill template ---
-def fill_template(template_str, output_file, vector_data, script_ver="99.9",
-                  dec_file="DEC_FILE.DEC", pin_channels="PIN_CHANNELS",
-                  pattern_name="PATTERN", input_file_path="INPUT.VEC",
-                  header_pins="// HEADER_PINS"):
+def template_parts(template_str, script_ver="99.9", dec_file="DEC_FILE.DEC", pin_channels="PIN_CHANNELS",
+                   pattern_name="PATTERN", input_file_path="INPUT.VEC", header_pins="// HEADER_PINS"):
+    """Filled-in template text before and after <VECTOR>"""
     time_stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     template = template_str
@@ -234,50 +302,260 @@ def fill_template(template_str, output_file, vector_data, script_ver="99.9",
     template = template.replace("<DEC_File>", dec_file)
     template = template.replace("<PIN_CHANNELS>", pin_channels)
     template = template.replace("<PATTERN_NAME>", pattern_name)
-    template = template.replace("<VECTOR>", vector_data)
     template = template.replace("<input_file>", input_file_path)
     template = template.replace("<time_stamp>", time_stamp)
     template = template.replace("<HEADER_PINS>", header_pins)
+    head, _, tail = template.partition("<VECTOR>")
+    return head, tail
+
+def fill_template(template_str, output_file, vector_data, script_ver="99.9",
+                  dec_file="DEC_FILE.DEC", pin_channels="PIN_CHANNELS",
+                  pattern_name="PATTERN", input_file_path="INPUT.VEC",
+                  header_pins="// HEADER_PINS"):
+    head, tail = template_parts(template_str, script_ver, dec_file, pin_channels, pattern_name,
+                                input_file_path, header_pins)
 
     with open(output_file, 'w') as f:
-        f.write(template)
+        f.write(head + vector_data + tail)
 
-    print(f"Output written to {output_file}")
+    log.info(f"Output written to {output_file}")
 
 # --- Convert vec file ---
-def convert_vec_file(vec_file, cmf_file, dec_file="", file_extension=".vec", ate_type="J750", script_ver=sub_script_ver):
-    pin_channels = read_cmf_file(cmf_file)
+def _format_vectors(records, ate_type, pin_channels, batch_lines=BLOCK_SIZE):
+    """Formatted vector lines in lists of up to batch_lines"""
     num_pins = len(pin_channels.split(',')) if pin_channels else 1
-
     if ate_type.upper() == "J750":
-        vector_data = extract_vec_data_j750(vec_file, num_pins=num_pins)
+        lines = iter_j750_lines(records)
+    else:
+        lines = iter_chroma_lines(records, num_pins=num_pins)
+    while True:
+        batch = list(islice(lines, batch_lines))
+        if not batch:
+            return
+        yield batch
+
+def _format_block(ate_type, rows, comments, ts1_index=None, tsets=None, names=None, prev=None):
+    """Pool task: sanitize and format the vectors of one block. The parts that depend on the
+    whole stream (halt, STOP, dummy vector) are added by the caller, which knows where it ends.
+    With names (a multi-timeset pattern) tsets holds each vector's timeset code (None = all 0)
+    and prev the code of the vector before the block (None at the start of the pattern)."""
+    j750 = ate_type.upper() == "J750"
+    lines = []
+    if names is not None:
+        tsets = tsets if tsets is not None else bytes(len(rows))
+        for i, row in enumerate(rows):
+            data = sanitize_vector(row)
+            comment = (comments[i][-1].strip() or None) if i in comments else None
+            code = tsets[i]
+            if j750:
+                lines.append(_j750_line(data, comment, names[code]))
+            else:
+                lines.append(_chroma_line(data, comment, names[code] if code != prev else None))
+            prev = code
+        return lines
+    for i, row in enumerate(rows):
+        data = sanitize_vector(row)
+        comment = (comments[i][-1].strip() or None) if i in comments else None
+        lines.append(_j750_line(data, comment) if j750 else
+                     _chroma_line(data, comment, "TS1" if i == ts1_index else None))
+    return lines
+
+def _first_comment(block):
+    """Row of the first vector in block with a non-empty comment (Chroma TS1 goes there), or None"""
+    for i in sorted(block.comments):
+        if i < len(block.rows) and block.comments[i][-1].strip():
+            return i
+    return None
+
+def _format_blocks_parallel(blocks, ate_type, pin_channels, workers, timesets=None):
+    """Same batches as _format_vectors(records_from_blocks(blocks)), with each block formatted on
+    a process pool. Up to 2 * workers blocks are in flight and their lines come back in order;
+    only the last block's lines are held back to receive halt/STOP and the dummy vector."""
+    j750 = ate_type.upper() == "J750"
+    num_pins = len(pin_channels.split(',')) if pin_channels else 1
+    names = timesets.names if timesets is not None else None
+    ts1_done = j750 or names is not None
+    code = None         # timeset code of the last vector submitted
+    in_flight = deque()
+    held = None         # (lines, width of the last vector) of the newest finished block
+    total = 0
+    pool = ProcessPoolExecutor(workers)
+    try:
+        for block in blocks:
+            if not block.rows:
+                continue
+            ts1 = None
+            if not ts1_done:
+                ts1 = _first_comment(block)
+                ts1_done = ts1 is not None
+            total += len(block.rows)
+            in_flight.append((pool.submit(_format_block, ate_type, block.rows, block.comments, ts1,
+                                          block.tsets, names, code), len(block.rows[-1])))
+            if names is not None:
+                code = block.tsets[-1] if block.tsets is not None else 0
+            if len(in_flight) >= 2 * workers:
+                future, width = in_flight.popleft()
+                if held is not None:
+                    yield held[0]
+                held = (future.result(), width)
+        while in_flight:
+            future, width = in_flight.popleft()
+            if held is not None:
+                yield held[0]
+            held = (future.result(), width)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    if held is None:
+        return
+    lines, width = held
+    if j750:
+        # Insert halt before the last vector
+        if total > 1:
+            lines.insert(len(lines) - 1, "halt")
+        lines.append(_j750_dummy(width, names[code]) if names is not None else _j750_dummy(width))
+    else:
+        lines[-1] = _chroma_stop(lines[-1])
+        lines.append(_chroma_dummy(num_pins))
+    yield lines
+
+def j750_tset_import(head, timesets):
+    """J750 header importing the pattern's timesets instead of the single WFT"""
+    if timesets is None:
+        return head
+    return head.replace("import tset WFT;", f"import tset {', '.join(timesets)};", 1)
+
+def _write_ate(batches, output_file, ate_type, pin_channels, dec_file, script_ver, pattern_name,
+               input_file_path, timesets=None):
+    if ate_type.upper() == "J750":
         blank_header = 14
         template_str = J750_TEMPLATE
-    elif ate_type.upper() in ["C3380", "C3850"]:
-        vector_data = extract_vec_data_chroma(vec_file, num_pins=num_pins)
+    else:
         blank_header = 2
         template_str = CHROMA_TEMPLATE
-    else:
-        print(f"ERROR: Unknown ATE type '{ate_type}'")
-        return
 
     header_pins = generate_header_pins(pin_channels, dummy_count=blank_header)
     ##print(f"HEADER PINS\n{header_pins}\n")
     if ate_type.upper() == "J750": header_pins= space_out_header(header_pins)
     ##print(f"HEADER PINS\n{header_pins}\n")
-    base_name = os.path.splitext(os.path.basename(vec_file))[0]
-    output_file = os.path.join(os.path.dirname(vec_file), f"{base_name}{file_extension}")
 
-    fill_template(template_str, output_file, vector_data,
-                  script_ver=script_ver,
-                  dec_file=dec_file,
-                  pin_channels=pin_channels,
-                  pattern_name=base_name,
-                  input_file_path=vec_file,
-                  header_pins=header_pins)
+    head, tail = template_parts(template_str,
+                                script_ver=script_ver,
+                                dec_file=dec_file,
+                                pin_channels=pin_channels,
+                                pattern_name=pattern_name,
+                                input_file_path=input_file_path,
+                                header_pins=header_pins)
+    if ate_type.upper() == "J750":
+        head = j750_tset_import(head, timesets)
+
+    with pipeline.open_output(output_file) as f:
+        f.write(head)
+        sep = ""
+        for batch in batches:
+            f.write(sep + "\n".join(batch))
+            sep = "\n"
+        f.write(tail)
+
+    log.info(f"Output written to {output_file}")
+    return output_file
+
+def write_ate_file(records, output_file, ate_type, pin_channels, dec_file="", script_ver=sub_script_ver,
+                   pattern_name="PATTERN", input_file_path="INPUT.VEC", timesets=None):
+    """Write a (data, comment) record stream as a J750 .atp or Chroma .pat pattern.
+    Vectors are formatted and written a batch at a time, never held as one string.
+    timesets: Timesets named by (data, comment, timeset) records (None = the single WFT/TS1)"""
+    return _write_ate(_format_vectors(records, ate_type, pin_channels), output_file, ate_type, pin_channels,
+                      dec_file, script_ver, pattern_name, input_file_path, timesets)
+
+def write_ate_blocks(blocks, output_file, ate_type, pin_channels, dec_file="", script_ver=sub_script_ver,
+                     pattern_name="PATTERN", input_file_path="INPUT.VEC", workers=None, timesets=None, progress=None):
+    """write_ate_file for a VectorBlock stream; workers > 1 (0 = all cores) formats blocks in parallel"""
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if workers and workers > 1:
+        batches = _format_blocks_parallel(blocks, ate_type, pin_channels, workers, timesets)
+    else:
+        batches = _format_vectors(records_from_blocks(blocks, timesets, progress), ate_type, pin_channels)
+    batches = staged(batches, progress, "format")
+    return _write_ate(batches, output_file, ate_type, pin_channels, dec_file, script_ver, pattern_name,
+                      input_file_path, timesets)
+
+def read_pattern(vec_file, start=None, stop=None, cmf_file=None, progress=None):
+    """Open .vec + .cmf as a Pattern; start/stop select vectors [start, stop) via the .vec index"""
+    if cmf_file is None:
+        cmf_file = os.path.splitext(vec_file)[0] + ".cmf"
+    try:
+        with open(cmf_file, 'r') as f:
+            cmf_text = f.read()
+    except FileNotFoundError:
+        log.error(f"CMF file '{cmf_file}' not found!")
+        cmf_text = ""
+
+    count = None
+    timesets = read_vec_timesets(vec_file)
+    if start is not None or stop is not None:
+        blocks = blocks_from_records(read_vec_records(vec_file, start, stop, progress, timesets),
+                                     timesets=timesets)
+        if stop is not None:
+            count = stop - (start or 0)
+    else:
+        blocks = read_vec_blocks(vec_file, progress=progress, timesets=timesets)
+    return Pattern(parse_cmf_pins(cmf_text), blocks, source=vec_file, cmf_text=cmf_text, count=count,
+                   timesets=timesets)
+
+def ate_writer(pattern, vec_file, target="J750", dec_file="", start=None, stop=None,
+               script_ver=sub_script_ver, file_extension=None, progress=None, workers=None):
+    """Writer factory (see formats.py): J750 .atp / Chroma .pat next to vec_file.
+    workers > 1 formats vector blocks on that many processes (0 = all cores)"""
+    if file_extension is None:
+        file_extension = ".atp" if target.upper() == "J750" else ".pat"
+    output_file, pattern_name = output_path(vec_file, file_extension, start, stop)
+    # ATE header lists the pins in reverse .cmf order
+    pin_channels = ','.join(reversed(pattern.cmf_pins))
+
+    def write(blocks):
+        log.info(f"Converting {vec_file} -> {target} using vec2ate...")
+        log.info(f"Collected pins: {pin_channels}")
+        write_ate_blocks(track_blocks(blocks, progress, count=False), output_file, target,
+                         pin_channels, dec_file or "", script_ver, pattern_name, vec_file, workers,
+                         pattern.timesets, progress)
+        log.info("vec2ate conversion done!")
+    write.outputs = [output_file]
+    return write
+
+def convert_vec_file(vec_file, cmf_file, dec_file="", file_extension=".vec", ate_type="J750", script_ver=sub_script_ver,
+                     start=None, stop=None, progress=None, workers=None, incremental=False):
+    """start/stop: optional vector range [start, stop) for partial conversion;
+    the output is then named <pattern>_<start>_<stop><ext>
+    vec_file may also be a .vecb, which carries its own pins (cmf_file is ignored)
+    incremental: re-format only the chunks of the .vec that changed since the last incremental
+                 run and splice them into the previous output (see vecsplice.py)"""
+    if ate_type.upper() not in ["J750", "C3380", "C3850"]:
+        log.error(f"Unknown ATE type '{ate_type}'")
+        return
+
+    if incremental and start is None and stop is None and not vec_file.lower().endswith(".vecb"):
+        import vecsplice
+        ext = file_extension if file_extension in (".atp", ".pat") else None
+        vecsplice.convert_incremental(vec_file, ate_type, dec_file, cmf_file, script_ver, ext)
+        return
+
+    if vec_file.lower().endswith(".vecb"):
+        pattern = vecb.read_pattern(vec_file, start, stop, progress)
+    else:
+        pattern = read_pattern(vec_file, start, stop, cmf_file, progress)
+    write = ate_writer(pattern, vec_file, ate_type.upper(), dec_file, start, stop, script_ver, file_extension,
+                       progress, workers)
+    try:
+        write(track_blocks(pattern.blocks, progress))
+    except BaseException:
+        remove_outputs(write.outputs)
+        raise
 
 # --- Main execution for CLI ---
 if __name__ == "__main__":
+    logger.init_logger()
     print("#############################################################")
     print("#\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t#")
     print("#\t\t\t\t\t\tVektorConverter\t\t\t\t\t\t#")
@@ -0,0 +1,217 @@
+# vec2stil.py
+import os
+import sys
+from datetime import datetime
+import metadata
+import logger
+import formats
+import pipeline
+from pattern import output_path
+from progress import track_blocks, remove_outputs
+from vec2vcd import pack_rows, row_changes
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("vec2stil")
+
+# Any parsed pattern as STIL, structured like the STIL files stil2vec reads: Signals, an "all"
+# SignalGroup, one WaveformTable and a Pattern whose first V { } sets every pin. Each later V
+# lists only the pins that changed since the vector before it. A run of identical vectors is
+# written once as Loop n { V { ... } }. The changes of a block come from vec2vcd's row_changes,
+# so NumPy (optional) makes this one comparison per block.
+#
+# A pattern with several timesets gets one WaveformTable per timeset (same waveforms) and a
+# W statement wherever the timeset changes.
+
+DEFAULT_PERIOD_NS = 100     # when neither the caller nor the pattern gives a period
+STROBE = 0.9                # compare strobe, as a fraction of the period
+GROUP_LINE = 8              # signals per line of the "all" group
+
+# .vec state -> waveform character; anything else is X
+WFC = "01LHXZ"
+_STATE_WFC = {"0": 0, "1": 1, "L": 2, "H": 3, "l": 2, "h": 3, "Z": 5, "z": 5}
+WFC_TABLE = bytes(_STATE_WFC.get(chr(c), 4) for c in range(256))
+
+
+def stil_header(pins, period, tables, name, source):
+    """Everything before the Pattern's first statement"""
+    period = f"{float(period):g}"
+    quoted = [f'"{pin}"' for pin in pins]
+    group = " +\n      ".join(" + ".join(quoted[i:i + GROUP_LINE]) for i in range(0, len(quoted), GROUP_LINE))
+    lines = [
+        "STIL 1.0;",
+        "",
+        "Header {",
+        f'   Title "Generated by VektorConverter: vec2stil v{sub_script_ver}";',
+        f'   Date "{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}";',
+        f'   Source "{source}";',
+        "}",
+        "",
+        "Signals {",
+    ]
+    lines += [f'   "{pin}" InOut;' for pin in pins]
+    lines += ["}", "", "SignalGroups {", f"   \"all\" = '{group}';", "}", "", "Timing {"]
+    for table in tables:
+        lines += [
+            f'   WaveformTable "{table}" {{',
+            f"      Period '{period}ns';",
+            "      Waveforms {",
+            f"         \"all\" {{ 01 {{ '0ns' D/U; }} LHX {{ '0ns' Z; '{STROBE:g}*{period}ns' L/H/X; }}"
+            f" Z {{ '0ns' Z; }} }}",
+            "      }",
+            "   }",
+        ]
+    lines += [
+        "}",
+        "",
+        f'PatternBurst "{name}_burst" {{',
+        "   PatList {",
+        f'      "{name}";',
+        "   }",
+        "}",
+        "",
+        f'PatternExec "{name}_exec" {{',
+        f'   PatternBurst "{name}_burst";',
+        "}",
+        "",
+        f'Pattern "{name}" {{',
+        "",
+    ]
+    return "\n".join(lines)
+
+
+class StilEncoder:
+    """Pattern statements of consecutive blocks; feed every block in order to encode(), then finish().
+    The statement of the newest changed vector is held back until the next change shows how often
+    it repeats."""
+
+    def __init__(self, pins, timesets=None, use_numpy=None):
+        self.width = len(pins)
+        self.names = timesets.names if timesets is not None else None
+        self.use_numpy = use_numpy
+        self.levels = max(len(WFC), len(self.names or ()))
+        # "pin"=c; of pin j taking waveform character v: tokens[j * levels + v]
+        pad = [None] * (self.levels - len(WFC))
+        self.tokens = [t for pin in pins for t in [f'"{pin}"={c}; ' for c in WFC] + pad]
+        self.columns = self.width
+        if self.names is not None:
+            # the timeset is one more column, whose "change" is a W statement
+            self.tokens += [f'W "{name}";' for name in self.names] + [None] * (self.levels - len(self.names))
+            self.columns += 1
+        self.count = 0
+        self._prev = None       # last row of the previous block (waveform codes, as bytes)
+        self._pending = None    # (W statement, V statement, first vector) not written yet
+
+    def _packed(self, block):
+        packed = pack_rows(block.rows, self.width, WFC_TABLE)
+        if self.names is None:
+            return packed
+        n, w, stride = len(block.rows), self.width, self.columns
+        out = bytearray(n * stride)
+        for j in range(w):
+            out[j::stride] = packed[j::w]
+        out[w::stride] = block.tsets if block.tsets is not None else bytes(n)
+        return bytes(out)
+
+    def _statement(self, keys):
+        tokens = self.tokens
+        w = ""
+        if keys and keys[-1] >= self.width * self.levels:
+            w = tokens[keys[-1]]
+            keys = keys[:-1]
+        return w, "V { " + "".join([tokens[k] for k in keys]) + "}"
+
+    def _flush(self, out, upto):
+        w, v, first = self._pending
+        if w:
+            out.append(f"   {w}\n")
+        count = upto - first
+        out.append(f"   {v}\n" if count == 1 else f"   Loop {count} {{ {v} }}\n")
+
+    def encode(self, block):
+        n = len(block.rows)
+        if not n:
+            return ""
+        packed = self._packed(block)
+        stride, levels = self.columns, self.levels
+        out = []
+        if self._prev is None:
+            self._pending = self._statement([j * levels + v for j, v in enumerate(packed[:stride])]) + (0,)
+        changed, starts, keys = row_changes(packed, n, stride, self._prev, levels, self.use_numpy)
+        for row, a, b in zip(changed, starts, starts[1:] + [len(keys)]):
+            self._flush(out, self.count + row)
+            self._pending = self._statement(keys[a:b]) + (self.count + row,)
+        self._prev = packed[-stride:]
+        self.count += n
+        return "".join(out)
+
+    def finish(self):
+        out = []
+        if self._pending is not None:
+            self._flush(out, self.count)
+            self._pending = None
+        return "".join(out)
+
+
+def write_stil_blocks(blocks, stil_file, pins, period=None, timesets=None, name="pattern", source="",
+                      use_numpy=None):
+    """Write a VectorBlock stream as STIL; period in ns (default 100)"""
+    period = period or DEFAULT_PERIOD_NS
+    encoder = StilEncoder(pins, timesets, use_numpy)
+    tables = timesets.names if timesets is not None else ["WFT"]
+    with pipeline.open_output(stil_file) as f:
+        f.write(stil_header(pins, period, tables, name, source))
+        if timesets is None:
+            f.write('   W "WFT";\n')
+        for block in blocks:
+            f.write(encoder.encode(block))
+        f.write(encoder.finish())
+        f.write("}\n")
+    return stil_file
+
+
+def stil_writer(pattern, vec_file, target="STIL", start=None, stop=None, progress=None, period=None):
+    """Writer factory (see formats.py): delta-encoded STIL as <vec_file base>.stil.
+    period: ns (default: the pattern's period, else 100 ns)"""
+    stil_file, pattern_name = output_path(vec_file, ".stil", start, stop)
+
+    def write(blocks):
+        write_stil_blocks(track_blocks(blocks, progress, count=False), stil_file, pattern.pins,
+                          period or pattern.period, pattern.timesets, pattern_name, pattern.source)
+        log.info(f"STIL file written: {stil_file}")
+    write.outputs = [stil_file]
+    return write
+
+
+def convert_to_stil(path, stil_file=None, period=None, interval=None, progress=None):
+    """Read any registered input and write it as STIL (default: next to the input); returns the path"""
+    ext = os.path.splitext(path)[1].lower()
+    if formats.get_reader(ext) is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    pattern = formats.read(path, ext, progress=progress, interval=interval)
+    stil_file = stil_file or os.path.splitext(path)[0] + ".stil"
+    if os.path.abspath(stil_file) == os.path.abspath(path):
+        raise ValueError(f"Output would overwrite the input: {path}")
+    write = stil_writer(pattern, os.path.splitext(stil_file)[0] + ".vec", period=period)
+    try:
+        write(track_blocks(pattern.blocks, progress))
+    except BaseException:
+        remove_outputs(write.outputs)
+        raise
+    return stil_file
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Pattern -> STIL v{sub_script_ver}")
+    parser.add_argument("file", help="input .atp/.pat/.vcd/.vec/.vecb")
+    parser.add_argument("-o", "--output", help="output .stil (default: next to the input)")
+    parser.add_argument("--period", type=float, help="vector period in ns (default: the pattern's period)")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval (VCD input)")
+    args = parser.parse_args()
+    try:
+        convert_to_stil(args.file, args.output, args.period, args.interval)
+    except (OSError, ValueError) as e:
+        log.error(str(e))
+        sys.exit(1)
@@ -0,0 +1,226 @@
+# vec2vcd.py
+import os
+import re
+import sys
+from datetime import datetime
+import metadata
+import logger
+import formats
+import pipeline
+from pattern import output_path
+from progress import track_blocks, remove_outputs
+
+try:
+    import numpy as np
+except ImportError:     # optional: the pure-Python engine writes the same file, only slower
+    np = None
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("vec2vcd")
+
+# Any parsed pattern back to a VCD, for replaying a tester failure in the simulator. Vector i is
+# placed at time i * period; after the $dumpvars of vector 0 only value changes are written, each
+# under the timestamp of the vector that makes it. Every pin gets the shortest free identifier
+# code ("!", '"', ..., "!!", ...), so a change costs a few bytes. vcd2vec with the same interval
+# reads the same vectors back.
+#
+# Rows are first mapped to VCD values with one translate per block (H/L compares become 1/0), so
+# a compare that follows a drive of the same level is no change. With NumPy a block is one
+# (rows x pins) matrix and the changes come from a single comparison of consecutive rows.
+
+DEFAULT_TIMESCALE = "1ps"
+DEFAULT_PERIOD_NS = 100     # when neither the caller nor the pattern gives a period
+
+VCD_VALUES = "01xz"
+# .vec state -> VCD value (index into VCD_VALUES); anything else is x
+_STATE_VALUE = {"0": 0, "1": 1, "L": 0, "H": 1, "l": 0, "h": 1, "Z": 3, "z": 3}
+VALUE_TABLE = bytes(_STATE_VALUE.get(chr(c), 2) for c in range(256))
+
+TIMESCALE_RE = re.compile(r"^\s*(1|10|100)\s*(s|ms|us|ns|ps|fs)\s*$")
+_UNIT_SECONDS = {"s": 1, "ms": 1e-3, "us": 1e-6, "ns": 1e-9, "ps": 1e-12, "fs": 1e-15}
+
+
+def identifier(n):
+    """n-th VCD identifier code: printable ASCII '!'..'~', shortest first"""
+    code = chr(33 + n % 94)
+    n //= 94
+    while n:
+        n -= 1
+        code += chr(33 + n % 94)
+        n //= 94
+    return code
+
+
+def timescale_seconds(timescale):
+    m = TIMESCALE_RE.match(timescale)
+    if not m:
+        raise ValueError(f"bad timescale '{timescale}' (use 1/10/100 s, ms, us, ns, ps or fs)")
+    return int(m.group(1)) * _UNIT_SECONDS[m.group(2)]
+
+
+def period_units(period_ns, timescale):
+    """A period in ns as a whole number of timescale units"""
+    units = round(float(period_ns) * 1e-9 / timescale_seconds(timescale))
+    if units <= 0:
+        raise ValueError(f"period {period_ns} ns is below the timescale {timescale}")
+    return units
+
+
+def pack_rows(rows, width, table):
+    """Rows as one bytes object of value codes (`table` maps each state character to its code)"""
+    if any(len(r) != width for r in rows):
+        rows = [r[:width].ljust(width, "X") for r in rows]     # ragged input: pad/cut like a mask
+    return "".join(rows).encode("latin-1").translate(table)
+
+
+def vcd_header(pins, ids, timescale, scope, source):
+    lines = [
+        "$date", f"   {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", "$end",
+        "$version", f"   VektorConverter: vec2vcd v{sub_script_ver}", "$end",
+        "$comment", f"   Source : {source}", "$end",
+        "$timescale", f"   {timescale}", "$end",
+        f"$scope module {scope} $end",
+    ]
+    lines += [f"$var wire 1 {code} {pin} $end" for pin, code in zip(pins, ids)]
+    lines += ["$upscope $end", "$enddefinitions $end", ""]
+    return "\n".join(lines)
+
+
+def row_changes(packed, n, width, prev=None, levels=4, use_numpy=None):
+    """Changes between consecutive rows of a packed block: n rows of `width` value codes (< levels),
+    row-major bytes. prev is the row before the block (None: row 0 starts the pattern and is only
+    compared with what follows). Returns (rows, starts, keys): the offsets of the rows that change,
+    in order, and one key col * levels + value per change; the changes of rows[i] are
+    keys[starts[i]:starts[i + 1]] (the last ones up to len(keys))"""
+    if np is not None and (use_numpy or use_numpy is None):
+        block = np.frombuffer(packed, dtype=np.uint8).reshape(n, width)
+        if prev is None:
+            full, first = block, 1
+        else:
+            full, first = np.vstack([np.frombuffer(prev, dtype=np.uint8), block]), 0
+        rows, cols = np.nonzero(full[1:] != full[:-1])
+        if not len(rows):
+            return [], [], []
+        keys = (cols * levels + full[1:][rows, cols]).tolist()
+        starts = [0] + (np.flatnonzero(np.diff(rows)) + 1).tolist()
+        return (rows[starts] + first).tolist(), starts, keys
+
+    rows, starts, keys = [], [], []
+    last = prev if prev is not None else packed[:width]
+    for i in range(0 if prev is not None else 1, n):
+        row = packed[i * width:(i + 1) * width]
+        if row != last:
+            rows.append(i)
+            starts.append(len(keys))
+            keys += [j * levels + v for j, (v, p) in enumerate(zip(row, last)) if v != p]
+        last = row
+    return rows, starts, keys
+
+
+class VcdEncoder:
+    """Value-change text of consecutive blocks; feed every block in order to encode()"""
+
+    def __init__(self, pins, period, use_numpy=None):
+        self.width = len(pins)
+        self.period = period
+        self.ids = [identifier(j) for j in range(self.width)]
+        self.use_numpy = np is not None if use_numpy is None else use_numpy and np is not None
+        # change line of pin j taking value v: tokens[j * 4 + v]
+        self.tokens = [f"{v}{code}\n" for code in self.ids for v in VCD_VALUES]
+        self.count = 0
+        self.last_change = None     # vector number of the last timestamp written
+        self._prev = None           # last row of the previous block (VCD values, as bytes)
+
+    def encode(self, rows):
+        if not rows or not self.width:
+            self.count += len(rows)
+            return ""
+        packed = pack_rows(rows, self.width, VALUE_TABLE)
+        tokens, period = self.tokens, self.period
+        out = []
+        if self._prev is None:
+            out.append("#0\n$dumpvars\n")
+            out.append("".join(tokens[j * 4 + v] for j, v in enumerate(packed[:self.width])))
+            out.append("$end\n")
+            self.last_change = 0
+        changed, starts, keys = row_changes(packed, len(rows), self.width, self._prev, 4, self.use_numpy)
+        lines = [tokens[k] for k in keys]
+        for row, a, b in zip(changed, starts, starts[1:] + [len(lines)]):
+            out.append(f"#{(self.count + row) * period}\n")
+            out.append("".join(lines[a:b]))
+        if changed:
+            self.last_change = self.count + changed[-1]
+        self._prev = packed[-self.width:]
+        self.count += len(rows)
+        return "".join(out)
+
+    def finish(self):
+        """Closing timestamp, so a reader sees the unchanged vectors at the end as well"""
+        if self.count and self.last_change != self.count - 1:
+            return f"#{(self.count - 1) * self.period}\n"
+        return ""
+
+
+def write_vcd_blocks(blocks, vcd_file, pins, period, timescale=DEFAULT_TIMESCALE, scope="pattern", source="",
+                     use_numpy=None):
+    """Write a VectorBlock stream as a VCD; period is in timescale units"""
+    timescale_seconds(timescale)
+    encoder = VcdEncoder(pins, period, use_numpy)
+    with pipeline.open_output(vcd_file) as f:
+        f.write(vcd_header(pins, encoder.ids, timescale, scope, source))
+        for block in blocks:
+            f.write(encoder.encode(block.rows))
+        f.write(encoder.finish())
+    return vcd_file
+
+
+def vcd_writer(pattern, vec_file, target="VCD", start=None, stop=None, progress=None, period=None,
+               timescale=DEFAULT_TIMESCALE):
+    """Writer factory (see formats.py): value-change dump as <vec_file base>.vcd.
+    period: vector period in timescale units (default: the pattern's period, else 100 ns)"""
+    vcd_file, pattern_name = output_path(vec_file, ".vcd", start, stop)
+    if period is None:
+        period = period_units(pattern.period or DEFAULT_PERIOD_NS, timescale)
+
+    def write(blocks):
+        write_vcd_blocks(track_blocks(blocks, progress, count=False), vcd_file, pattern.pins, period,
+                         timescale, pattern_name, pattern.source)
+        log.info(f"VCD file written: {vcd_file} ({period} x {timescale} per vector)")
+    write.outputs = [vcd_file]
+    return write
+
+
+def convert_to_vcd(path, vcd_file=None, period=None, timescale=DEFAULT_TIMESCALE, interval=None, progress=None):
+    """Read any registered input and write it as a VCD (default: next to the input); returns the path"""
+    ext = os.path.splitext(path)[1].lower()
+    if formats.get_reader(ext) is None:
+        raise ValueError(f"Unsupported file type: {ext}")
+    pattern = formats.read(path, ext, progress=progress, interval=interval)
+    vcd_file = vcd_file or os.path.splitext(path)[0] + ".vcd"
+    if os.path.abspath(vcd_file) == os.path.abspath(path):
+        raise ValueError(f"Output would overwrite the input: {path}")
+    write = vcd_writer(pattern, os.path.splitext(vcd_file)[0] + ".vec", period=period, timescale=timescale)
+    try:
+        write(track_blocks(pattern.blocks, progress))
+    except BaseException:
+        remove_outputs(write.outputs)
+        raise
+    return vcd_file
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"Pattern -> VCD v{sub_script_ver}")
+    parser.add_argument("file", help="input .atp/.pat/.stil/.vcd/.vec/.vecb")
+    parser.add_argument("-o", "--output", help="output .vcd (default: next to the input)")
+    parser.add_argument("--period", type=int, help="vector period in timescale units (default: the pattern's period)")
+    parser.add_argument("--timescale", default=DEFAULT_TIMESCALE, help="e.g. 1ps, 10ns")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval (VCD input)")
+    args = parser.parse_args()
+    try:
+        convert_to_vcd(args.file, args.output, args.period, args.timescale, args.interval)
+    except (OSError, ValueError) as e:
+        log.error(str(e))
+        sys.exit(1)
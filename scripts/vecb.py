@@ -0,0 +1,285 @@
+# vecb.py
+import os
+import sys
+import json
+import bisect
+import mmap
+import zlib
+import struct
+import metadata
+import logger
+from progress import track_blocks
+from pattern import (BLOCK_SIZE, Pattern, Timesets, VectorBlock, read_vec_blocks, write_vec_blocks,
+                     read_vec_timesets, period_from_comments, parse_cmf_pins, output_path)
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("vecb")
+
+# Binary columnar intermediate format (.vecb)
+#
+#   "VECB" u16 version
+#   block 0 .. block n-1     pin states column-major (pin 0 of every row, pin 1, ...),
+#                            [one timeset code byte per row,] then the block's comments as JSON;
+#                            zlib per block
+#   footer                   zlib(JSON): pins, cmf text, period, block index [, timeset names]
+#                            (a multi-timeset file has a 7th index field: timeset bytes per block)
+#   u64 footer offset, u64 footer length, "VECB"
+VECB_MAGIC = b"VECB"
+VECB_VERSION = 1
+VECB_HEAD = struct.Struct("<4sH")
+VECB_TAIL = struct.Struct("<QQ4s")
+COMPRESS_LEVEL = 1
+
+
+# -------------------- Block codec --------------------
+
+def _encode_states(rows):
+    """Column-major state bytes; width 0 marks ragged rows stored newline-joined"""
+    width = len(rows[0]) if rows else 0
+    data = "".join(rows).encode("latin-1")
+    if width == 0 or len(data) != width * len(rows):
+        return 0, "\n".join(rows).encode("latin-1")
+    return width, b"".join(data[c::width] for c in range(width))
+
+
+def _decode_states(data, n_rows, width):
+    if width == 0:
+        return data.decode("latin-1").split("\n") if n_rows else []
+    return [data[r::n_rows].decode("latin-1") for r in range(n_rows)]
+
+
+# -------------------- Writer --------------------
+
+class VecbWriter:
+    """Streams VectorBlocks into a .vecb file; the index is written on close()"""
+
+    def __init__(self, vecb_file, pins, cmf_text="", period=None, compress=True, timesets=None):
+        self.vecb_file = vecb_file
+        self.pins = list(pins)
+        self.cmf_text = cmf_text
+        self.period = period
+        self.compress = compress
+        self.timesets = timesets
+        self.index = []
+        self.count = 0
+        self._f = open(vecb_file, "wb")
+        self._f.write(VECB_HEAD.pack(VECB_MAGIC, VECB_VERSION))
+
+    def write_block(self, block):
+        width, states = _encode_states(block.rows)
+        notes = json.dumps({str(k): v for k, v in block.comments.items()}).encode("utf-8") if block.comments else b""
+        tsets = b""
+        if self.timesets is not None:
+            tsets = bytes(block.tsets) if block.tsets is not None else bytes(len(block.rows))
+        payload = states + tsets + notes
+        packed = 0
+        if self.compress:
+            z = zlib.compress(payload, COMPRESS_LEVEL)
+            if len(z) < len(payload):
+                payload, packed = z, 1
+
+        offset = self._f.tell()
+        self._f.write(payload)
+        # [offset, stored bytes, rows, width, state bytes, compressed(, timeset bytes)]
+        entry = [offset, len(payload), len(block.rows), width, len(states), packed]
+        if self.timesets is not None:
+            entry.append(len(tsets))
+        self.index.append(entry)
+        self.count += len(block.rows)
+
+    def close(self):
+        if self._f is None:
+            return
+        info = {
+            "pins": self.pins,
+            "cmf": self.cmf_text,
+            "period": self.period,
+            "count": self.count,
+            "blocks": self.index,
+        }
+        if self.timesets is not None:
+            info["timesets"] = self.timesets.names
+        footer = zlib.compress(json.dumps(info).encode("utf-8"))
+        offset = self._f.tell()
+        self._f.write(footer)
+        self._f.write(VECB_TAIL.pack(offset, len(footer), VECB_MAGIC))
+        self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -------------------- Reader --------------------
+
+class VecbReader:
+    """mmap-backed .vecb reader; blocks are decoded only when requested"""
+
+    def __init__(self, vecb_file):
+        self.vecb_file = vecb_file
+        self._f = open(vecb_file, "rb")
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version = VECB_HEAD.unpack_from(self._mm, 0)
+            offset, length, tail_magic = VECB_TAIL.unpack_from(self._mm, len(self._mm) - VECB_TAIL.size)
+            if magic != VECB_MAGIC or tail_magic != VECB_MAGIC or version != VECB_VERSION:
+                raise ValueError(f"'{vecb_file}' is not a .vecb v{VECB_VERSION} file")
+        except (ValueError, struct.error):
+            self._f.close()
+            raise ValueError(f"'{vecb_file}' is not a valid .vecb file")
+
+        info = json.loads(zlib.decompress(self._mm[offset:offset + length]))
+        self.pins = info["pins"]
+        self.cmf_text = info["cmf"]
+        self.period = info["period"]
+        self.count = info["count"]
+        self.index = info["blocks"]
+        self.timesets = Timesets(info["timesets"]) if "timesets" in info else None
+
+        # first vector number of every block, for range lookups
+        self.starts = []
+        n = 0
+        for entry in self.index:
+            self.starts.append(n)
+            n += entry[2]
+
+    def __len__(self):
+        return self.count
+
+    def read_block(self, i):
+        offset, length, n_rows, width, states_len, packed, *tsets_len = self.index[i]
+        payload = self._mm[offset:offset + length]
+        if packed:
+            payload = zlib.decompress(payload)
+        rows = _decode_states(payload[:states_len], n_rows, width)
+        tsets = None
+        if tsets_len:
+            tsets = bytearray(payload[states_len:states_len + tsets_len[0]])
+            states_len += tsets_len[0]
+        notes = payload[states_len:]
+        comments = {int(k): v for k, v in json.loads(notes).items()} if notes else {}
+        return VectorBlock(self.starts[i], rows, comments, tsets)
+
+    def iter_blocks(self, start=None, stop=None):
+        """Yield all blocks, or only the vectors [start, stop) trimmed out of them"""
+        if start is None and stop is None:
+            for i in range(len(self.index)):
+                yield self.read_block(i)
+            return
+
+        start = start or 0
+        stop = self.count if stop is None else min(stop, self.count)
+        for i in range(max(bisect.bisect_right(self.starts, start) - 1, 0), len(self.index)):
+            first = self.starts[i]
+            if first >= stop:
+                break
+            block = self.read_block(i)
+            lo, hi = max(start - first, 0), min(stop - first, len(block))
+            comments = {k - lo: v for k, v in block.comments.items() if lo <= k < hi}
+            tsets = block.tsets[lo:hi] if block.tsets is not None else None
+            yield VectorBlock(first + lo, block.rows[lo:hi], comments, tsets)
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -------------------- Conversions --------------------
+
+def vec_to_vecb(vec_file, cmf_file=None, vecb_file=None, compress=True, block_size=BLOCK_SIZE):
+    """Pack .vec + .cmf into .vecb; returns the .vecb path"""
+    if cmf_file is None:
+        cmf_file = os.path.splitext(vec_file)[0] + ".cmf"
+    if vecb_file is None:
+        vecb_file = os.path.splitext(vec_file)[0] + ".vecb"
+
+    cmf_text = ""
+    if os.path.exists(cmf_file):
+        with open(cmf_file, "r") as f:
+            cmf_text = f.read()
+    else:
+        log.warning(f"CMF file '{cmf_file}' not found, storing vectors without pins")
+
+    timesets = read_vec_timesets(vec_file)
+    blocks = read_vec_blocks(vec_file, block_size, timesets=timesets)
+    first = next(blocks, None)
+    period = period_from_comments(first.comments.get(0, [])) if first else None
+
+    with VecbWriter(vecb_file, parse_cmf_pins(cmf_text), cmf_text, period, compress, timesets) as w:
+        if first is not None:
+            w.write_block(first)
+        for block in blocks:
+            w.write_block(block)
+
+    log.info(f"VECB file written: {vecb_file}")
+    return vecb_file
+
+
+def read_pattern(vecb_file, start=None, stop=None, progress=None):
+    """Open a .vecb as a Pattern; blocks are decoded lazily and the file is closed at the end"""
+    reader = VecbReader(vecb_file)
+    first = start or 0
+    last = reader.count if stop is None else min(stop, reader.count)
+
+    def blocks():
+        with reader:
+            for block in reader.iter_blocks(start, stop):
+                if progress:
+                    progress.read(reader.index[bisect.bisect_right(reader.starts, block.start) - 1][0])
+                yield block
+
+    return Pattern(reader.pins, blocks(), source=vecb_file, period=reader.period, cmf_text=reader.cmf_text,
+                   count=max(last - first, 0), timesets=reader.timesets)
+
+
+def vecb_writer(pattern, vec_file, target="VECB", start=None, stop=None, progress=None):
+    """Writer factory (see formats.py): pack the block stream into <vec_file base>.vecb"""
+    vecb_file, _ = output_path(vec_file, ".vecb", start, stop)
+
+    def write(blocks):
+        with VecbWriter(vecb_file, pattern.pins, pattern.cmf(), pattern.period, timesets=pattern.timesets) as w:
+            for block in track_blocks(blocks, progress, count=False):
+                w.write_block(block)
+        log.info(f"VECB file written: {vecb_file}")
+    write.outputs = [vecb_file]
+    return write
+
+
+def vecb_to_vec(vecb_file, vec_file=None, cmf_file=None):
+    """Unpack .vecb back to the original .vec + .cmf; returns (vec_file, cmf_file)"""
+    base = os.path.splitext(vecb_file)[0]
+    vec_file = vec_file or base + ".vec"
+    cmf_file = cmf_file or base + ".cmf"
+
+    with VecbReader(vecb_file) as r:
+        write_vec_blocks(r.iter_blocks(), vec_file, r.timesets)
+        with open(cmf_file, "w") as f:
+            f.write(r.cmf_text)
+
+    log.info(f"VEC file written: {vec_file}")
+    log.info(f"CMF file written: {cmf_file}")
+    return vec_file, cmf_file
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    print("#############################################################")
+    print("#\t\t\t\t\t\tVektorConverter\t\t\t\t\t\t#")
+    print(f"#\t\t\t\t\t\tvec <-> vecb v{sub_script_ver}\t\t\t\t\t#")
+    print(f"#\t\t\t\t\tby: {author}\t\t\t#")
+    print("##############################################################")
+    path = sys.argv[1] if len(sys.argv) > 1 else input("Enter .vec or .vecb file: ").strip().strip('"')
+    if path.lower().endswith(".vecb"):
+        vecb_to_vec(path)
+    else:
+        vec_to_vecb(path)
@@ -0,0 +1,167 @@
+# vecindex.py
+import io
+import os
+import re
+import mmap
+import struct
+import logger
+from array import array
+from itertools import islice
+
+log = logger.get_logger("vecindex")
+
+# Sidecar layout: header + one uint64 byte offset per INDEX_STRIDE vectors
+INDEX_MAGIC = b"VIDX"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHQqQQ")  # magic, version, src size, src mtime_ns, stride, vector count
+INDEX_STRIDE = 1024
+# Vector lines are counted in newline-aligned windows of this many bytes (regex over the mmap, no
+# copies); small enough that most windows hold no stride boundary and are never walked
+SCAN_CHUNK = 16 * 1024
+
+
+def index_path(vec_file):
+    """Sidecar index file next to the .vec"""
+    return vec_file + ".idx"
+
+
+class VecIndex:
+    """Sparse vector-number -> byte-offset map of a .vec file.
+
+    offsets[k] is the position right after the line of vector k*stride-1, so a
+    reader started there still sees the comment lines that belong to vector k*stride.
+    """
+
+    def __init__(self, stride, offsets, count, src_size=0, src_mtime=0):
+        self.stride = stride
+        self.offsets = offsets
+        self.count = count
+        self.src_size = src_size
+        self.src_mtime = src_mtime
+
+    def __len__(self):
+        return self.count
+
+    def locate(self, vector_num):
+        """Return (byte offset, vectors to skip from there) for a vector number"""
+        if vector_num < 0 or vector_num > self.count:
+            raise IndexError(f"vector {vector_num} out of range (0..{self.count - 1})")
+        k = min(vector_num // self.stride, len(self.offsets) - 1)
+        return self.offsets[k], vector_num - k * self.stride
+
+
+# -------------------- Build --------------------
+
+def is_vector_line(line):
+    # Same rule as the .vec readers: 2+ tokens and not a '#' comment
+    parts = line.split(None, 1)
+    return len(parts) == 2 and parts[0][:1] != b"#"
+
+
+def line_marks(head):
+    """(first, rest) regexes finding lines that start with `head`: `first` is matched at the start of
+    a chunk, `rest` finds every later line as a literal "\n" plus lookahead (match end = line start).
+    As with patinspect.LineMark, chunks are counted in C and each match is the same one-byte string"""
+    return re.compile(head), re.compile(rb"\n(?=" + head + rb")")
+
+
+# is_vector_line as a regex: a first token not starting with '#', then blanks and a second token
+VECTOR_HEAD = rb"[ \t\r\x0b\x0c]*[^#\s]\S*[ \t\r\x0b\x0c]+\S"
+VECTOR_FIRST, VECTOR_REST = line_marks(VECTOR_HEAD)
+
+
+def scan_lines(mm, pos, end, count, stride, phase=0, marks=(VECTOR_FIRST, VECTOR_REST)):
+    """Vector lines of the newline-aligned range mm[pos:end], numbered on from `count`.
+    Returns (how many, start offsets of those whose number is `phase` mod stride). The lines are
+    counted by regex; the matches are only walked, with islice stepping from one such line to the
+    next, when the range holds one"""
+    first, rest = marks
+    at_start = first.match(mm, pos, end) is not None
+    n = at_start + len(rest.findall(mm, pos, end))
+    starts = []
+    j = (phase - count) % stride    # the first wanted line, counted within the range
+    if j < n:
+        if at_start and j == 0:
+            starts.append(pos)
+            j += stride
+        starts += [m.end() for m in islice(rest.finditer(mm, pos, end), j - at_start, None, stride)]
+    return n, starts
+
+
+def build_vec_index(vec_file, stride=INDEX_STRIDE):
+    """Scan the .vec once (mmap, newline-aligned chunks) and record every stride-th vector offset
+    (scan_lines: only the chunks holding one are walked)"""
+    st = os.stat(vec_file)
+    offsets = array("Q", [0])
+    count = 0
+
+    if st.st_size == 0:
+        return VecIndex(stride, offsets, 0, st.st_size, st.st_mtime_ns)
+
+    with open(vec_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        size = len(mm)
+        while pos < size:
+            end = mm.find(b"\n", min(pos + SCAN_CHUNK, size - 1))
+            end = size if end < 0 else end + 1
+            # offsets[k] follows the line of vector k*stride-1
+            n, starts = scan_lines(mm, pos, end, count, stride, stride - 1)
+            for start in starts:
+                line_end = mm.find(b"\n", start)
+                offsets.append(size if line_end < 0 else line_end + 1)
+            count += n
+            pos = end
+
+    # A trailing offset equal to the vector count would point past the last vector
+    if count and count % stride == 0:
+        offsets.pop()
+    return VecIndex(stride, offsets, count, st.st_size, st.st_mtime_ns)
+
+
+# -------------------- Sidecar I/O --------------------
+
+def save_vec_index(index, idx_file):
+    with open(idx_file, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, index.src_size,
+                                  index.src_mtime, index.stride, index.count))
+        index.offsets.tofile(f)
+
+
+def read_vec_index(idx_file):
+    """Read a sidecar index; returns None if it is missing or unreadable"""
+    try:
+        with open(idx_file, "rb") as f:
+            head = f.read(INDEX_HEADER.size)
+            magic, version, size, mtime, stride, count = INDEX_HEADER.unpack(head)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                return None
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+    except (OSError, struct.error, ValueError):
+        return None
+    return VecIndex(stride, offsets, count, size, mtime)
+
+
+def load_vec_index(vec_file, stride=INDEX_STRIDE):
+    """Return the cached index of vec_file, rebuilding the sidecar if it is stale"""
+    st = os.stat(vec_file)
+    idx_file = index_path(vec_file)
+    index = read_vec_index(idx_file)
+    if index and index.src_size == st.st_size and index.src_mtime == st.st_mtime_ns:
+        return index
+
+    index = build_vec_index(vec_file, stride)
+    try:
+        save_vec_index(index, idx_file)
+    except OSError as e:
+        log.warning(f"Could not write index '{idx_file}': {e}")
+    return index
+
+
+def open_at_vector(vec_file, vector_num):
+    """Open vec_file as text positioned near vector_num.
+    Returns (file object, number of vectors to skip before vector_num)."""
+    offset, skip = load_vec_index(vec_file).locate(vector_num)
+    raw = open(vec_file, "rb")
+    raw.seek(offset)
+    return io.TextIOWrapper(raw), skip
@@ -0,0 +1,213 @@
+# vecsplice.py
+import io
+import os
+import json
+import mmap
+import locale
+import hashlib
+import logger
+import metadata
+import vecindex
+import vec2ate
+from pattern import vec_line_blocks, output_path
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("vecsplice")
+
+# Incremental .vec -> .atp/.pat: the .vec is cut into chunks of CHUNK_VECTORS vectors at the
+# byte offsets of its vecindex sidecar, and each chunk's raw bytes are hashed. A manifest next
+# to the output (<output>.chunks, JSON) keeps every chunk's hash and the byte range its lines
+# occupy in the output. On the next run only chunks whose hash changed are parsed and formatted;
+# all others are copied from the previous output into the new one, which then replaces it.
+#
+# Parts that depend on the whole stream are handled per chunk: the last chunk (halt / STOP and
+# the dummy vector) is always formatted, a chunk that used to be last is formatted again, and
+# for Chroma the chunk holding TS1 (first commented vector) is re-formatted whenever it moves.
+# In a multi-timeset pattern Chroma names a timeset only where it changes, so a Chroma chunk is
+# reused only if the vector before it still has the timeset it had when the chunk was formatted.
+
+MANIFEST_VERSION = 1
+CHUNK_VECTORS = 4 * vecindex.INDEX_STRIDE
+DIGEST_SIZE = 16
+
+# Output bytes are written exactly as a text-mode open() would write them
+_ENCODING = locale.getpreferredencoding(False)
+
+
+def manifest_path(output_file):
+    return output_file + ".chunks"
+
+
+class Chunk:
+    """One run of vectors: input digest and where its lines sit in the output"""
+    __slots__ = ("digest", "offset", "length", "commented", "ts1", "prev_tset", "last_tset")
+
+    def __init__(self, digest, offset=0, length=0, commented=False, ts1=False, prev_tset=None, last_tset=None):
+        self.digest = digest
+        self.offset = offset
+        self.length = length
+        self.commented = commented  # has a vector with a comment (Chroma TS1 candidate)
+        self.ts1 = ts1              # its output carries TS1
+        self.prev_tset = prev_tset  # timeset code of the vector before the chunk when formatted
+        self.last_tset = last_tset  # timeset code of its last vector
+
+    def to_list(self):
+        return [self.digest, self.offset, self.length, self.commented, self.ts1, self.prev_tset, self.last_tset]
+
+
+def read_manifest(output_file, settings):
+    """Chunks of the previous conversion, or None if it cannot be reused"""
+    try:
+        with open(manifest_path(output_file), "r") as f:
+            data = json.load(f)
+        st = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+    if (data.get("version") != MANIFEST_VERSION or data.get("settings") != settings
+            or data.get("output_size") != st.st_size or data.get("output_mtime_ns") != st.st_mtime_ns):
+        return None
+    return [Chunk(*c) for c in data["chunks"]]
+
+
+def write_manifest(output_file, settings, chunks):
+    st = os.stat(output_file)
+    data = {"version": MANIFEST_VERSION, "settings": settings, "output_size": st.st_size,
+            "output_mtime_ns": st.st_mtime_ns, "chunks": [c.to_list() for c in chunks]}
+    tmp = manifest_path(output_file) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, manifest_path(output_file))
+
+
+def chunk_ranges(index, size):
+    """(start, end) byte range of every chunk; comment lines go with the vector after them"""
+    if not index.count:
+        return []
+    step = max(1, CHUNK_VECTORS // index.stride)
+    starts = list(index.offsets[::step])
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _parse_chunk(data, first_vector, timesets=None):
+    """The single VectorBlock of a chunk's raw bytes (trailing comments included)"""
+    lines = io.TextIOWrapper(io.BytesIO(data))
+    return next(vec_line_blocks(lines, block_size=len(data) + 1, start=first_vector, timesets=timesets))
+
+
+def _encode(text):
+    return text.replace("\n", os.linesep).encode(_ENCODING)
+
+
+def convert_incremental(vec_file, ate_type="J750", dec_file="", cmf_file=None, script_ver=sub_script_ver,
+                        file_extension=None):
+    """Write the .atp/.pat of vec_file, re-formatting only the chunks that changed since the last run.
+    Returns (output file, chunks formatted, chunk count)"""
+    ate_type = ate_type.upper()
+    j750 = ate_type == "J750"
+    if file_extension is None:
+        file_extension = ".atp" if j750 else ".pat"
+    output_file, pattern_name = output_path(vec_file, file_extension)
+    pattern = vec2ate.read_pattern(vec_file, cmf_file=cmf_file)
+    pin_channels = ','.join(reversed(pattern.cmf_pins))
+    num_pins = len(pin_channels.split(',')) if pin_channels else 1
+    timesets = pattern.timesets
+    names = timesets.names if timesets is not None else None
+
+    index = vecindex.load_vec_index(vec_file)
+    step = max(1, CHUNK_VECTORS // index.stride)
+    settings = {"input": os.path.abspath(vec_file), "ate_type": ate_type, "dec_file": dec_file or "",
+                "pin_channels": pin_channels, "pattern_name": pattern_name, "script_ver": script_ver,
+                "chunk_vectors": step * index.stride, "timesets": names and list(names)}
+    old = read_manifest(output_file, settings)
+    if old is None:
+        log.info(f"No reusable chunk manifest for {output_file}; formatting every chunk")
+
+    if not index.count:
+        # nothing to splice
+        vec2ate.convert_vec_file(vec_file, cmf_file, dec_file, file_extension, ate_type, script_ver)
+        return output_file, 0, 0
+
+    head, tail = vec2ate.template_parts(*_template_args(j750, pin_channels, dec_file, script_ver,
+                                                        pattern_name, vec_file))
+    if j750:
+        head = vec2ate.j750_tset_import(head, timesets)
+    tmp_file = output_file + ".tmp"
+    chunks = []
+    formatted = 0
+    with open(vec_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open(tmp_file, "wb") as out:
+        prev_out = open(output_file, "rb") if old else None
+        try:
+            ranges = chunk_ranges(index, len(mm))
+            last = len(ranges) - 1
+            ts1_done = j750 or names is not None
+            tset = None         # timeset code of the last vector so far
+            pos = out.write(_encode(head))
+            for i, (start, end) in enumerate(ranges):
+                with memoryview(mm)[start:end] as view:
+                    digest = hashlib.blake2b(view, digest_size=DIGEST_SIZE).hexdigest()
+                prior = old[i] if old and i < len(old) and old[i].digest == digest else None
+                if prior is not None and (i == last or i == len(old) - 1):
+                    prior = None                    # halt / STOP / dummy vector moved
+                if prior is not None and not ts1_done and prior.commented != prior.ts1:
+                    prior = None                    # TS1 moves into this chunk
+                if prior is not None and ts1_done and prior.ts1:
+                    prior = None                    # TS1 moves out of this chunk
+                if prior is not None and names is not None and not j750 and prior.prev_tset != tset:
+                    prior = None                    # timeset change moves to / from its first vector
+
+                if prior is not None:
+                    prev_out.seek(prior.offset)
+                    data = prev_out.read(prior.length)
+                    chunk = Chunk(digest, pos, len(data), prior.commented, prior.ts1, tset, prior.last_tset)
+                else:
+                    block = _parse_chunk(mm[start:end], i * settings["chunk_vectors"], timesets)
+                    ts1_at = None if ts1_done else vec2ate._first_comment(block)
+                    lines = vec2ate._format_block(ate_type, block.rows, block.comments, ts1_at,
+                                                  block.tsets, names, tset)
+                    last_tset = block.tsets[-1] if block.tsets else None
+                    if i == last:
+                        _finish_lines(lines, j750, index.count, len(block.rows[-1]), num_pins,
+                                      names[last_tset] if names is not None else "WFT")
+                    text = ("\n" if i else "") + "\n".join(lines)
+                    data = _encode(text)
+                    chunk = Chunk(digest, pos, len(data), vec2ate._first_comment(block) is not None,
+                                  ts1_at is not None, tset, last_tset)
+                    formatted += 1
+                ts1_done = ts1_done or chunk.ts1
+                tset = chunk.last_tset
+                pos += out.write(data)
+                chunks.append(chunk)
+            out.write(_encode(tail))
+        except BaseException:
+            out.close()
+            os.remove(tmp_file)
+            raise
+        finally:
+            if prev_out is not None:
+                prev_out.close()
+    os.replace(tmp_file, output_file)
+    write_manifest(output_file, settings, chunks)
+    log.info(f"Output written to {output_file} ({formatted} of {len(chunks)} chunks formatted)")
+    return output_file, formatted, len(chunks)
+
+
+def _template_args(j750, pin_channels, dec_file, script_ver, pattern_name, vec_file):
+    """template_parts() arguments, as vec2ate's _write_ate fills them in"""
+    header_pins = vec2ate.generate_header_pins(pin_channels, dummy_count=14 if j750 else 2)
+    if j750:
+        header_pins = vec2ate.space_out_header(header_pins)
+    return (vec2ate.J750_TEMPLATE if j750 else vec2ate.CHROMA_TEMPLATE, script_ver, dec_file or "",
+            pin_channels, pattern_name, vec_file, header_pins)
+
+
+def _finish_lines(lines, j750, total, width, num_pins, tset="WFT"):
+    """Add what follows the last vector, as the full conversion does"""
+    if j750:
+        if total > 1:
+            lines.insert(len(lines) - 1, "halt")
+        lines.append(vec2ate._j750_dummy(width, tset))
+    else:
+        lines[-1] = vec2ate._chroma_stop(lines[-1])
+        lines.append(vec2ate._chroma_dummy(num_pins))
@@ -0,0 +1,514 @@
+# watcher.py
+import os
+import sys
+import json
+import time
+import errno
+import ctypes
+import select
+import struct
+import threading
+import metadata
+import formats
+import logger
+import jobs
+
+author = metadata.author
+sub_script_ver = metadata.script_ver
+log = logger.get_logger("watcher")
+
+# Watch-folder conversion: files dropped into the watched folders are converted with that
+# folder's targets on a jobs.JobQueue. A file is picked up once its size and mtime have stayed
+# the same for `settle` seconds, so files still being copied are never read half-written.
+#
+# Changes are found with inotify on Linux, and by polling everywhere else. Polling is incremental:
+# the scan state keeps every directory's mtime and subdirectories, and only directories whose
+# mtime changed are listed again. The state (plus the (mtime, size) of every handled file and
+# the files still waiting) is saved to a JSON file, so a restart neither converts everything
+# again nor misses files dropped while it was down.
+
+DEFAULT_SETTLE = 2.0    # seconds a file must stay unchanged before it is converted
+DEFAULT_POLL = 5.0      # seconds between scans without inotify
+STATE_FILE = "watch_state.json"
+STATE_VERSION = 1
+
+
+class WatchFolder:
+    """A watched directory and the conversion settings for files dropped into it"""
+
+    def __init__(self, path, targets=("VEC",), dec_file=None, interval=None, recursive=True, extensions=None):
+        self.path = os.path.abspath(path)
+        self.targets = [t.upper() for t in ([targets] if isinstance(targets, str) else targets)]
+        self.dec_file = dec_file
+        self.interval = interval
+        self.recursive = recursive
+        self.extensions = {e.lower() for e in (extensions or formats.input_extensions())}
+
+    @classmethod
+    def from_dict(cls, d, base_dir="."):
+        """Folder entry of a watch config; relative paths are taken from the config's directory"""
+        def resolve(p):
+            return os.path.join(base_dir, p) if p else p
+
+        return cls(resolve(d["path"]), d.get("targets", ("VEC",)), resolve(d.get("dec")),
+                   d.get("interval"), d.get("recursive", True), d.get("extensions"))
+
+    def accepts(self, name):
+        # skip hidden and editor/copy temp files
+        if name.startswith((".", "~")):
+            return False
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def make_jobs(self, path):
+        """Jobs for a new file; targets that do not apply to it are skipped"""
+        made = []
+        for target in self.targets:
+            job = jobs.Job(path, target, self.dec_file, self.interval)
+            error = jobs.check_job(job)
+            if error:
+                log.warning(f"{os.path.basename(path)} -> {target} skipped: {error}")
+            else:
+                made.append(job)
+        return made
+
+
+def load_config(config_file):
+    """(folders, settings) from a watch config JSON file"""
+    with open(config_file) as f:
+        doc = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(config_file))
+    folders = [WatchFolder.from_dict(d, base_dir) for d in doc.get("folders", [])]
+    settings = {k: doc[k] for k in ("workers", "settle", "poll", "state") if k in doc}
+    if "state" in settings:
+        settings["state"] = os.path.join(base_dir, settings["state"])
+    return folders, settings
+
+
+# -------------------- Scan state --------------------
+
+def _signature(st):
+    return [st.st_mtime_ns, st.st_size]
+
+
+class ScanState:
+    """Directory mtimes/subdirectories and handled-file signatures, saved as JSON"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dirs = {}          # dir -> {"mtime": ns, "subdirs": [names], "files": {name: [mtime_ns, size]}}
+        self.pending = set()    # files seen but not converted yet
+        self.dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                doc = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning(f"Scan state {self.path} not loaded, starting over: {e}")
+            return
+        if doc.get("version") != STATE_VERSION:
+            return
+        self.dirs = doc.get("dirs", {})
+        self.pending = set(doc.get("pending", []))
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": STATE_VERSION, "dirs": self.dirs, "pending": sorted(self.pending)}, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    def _entry(self, d):
+        entry = self.dirs.get(d)
+        if entry is None:
+            entry = self.dirs[d] = {"mtime": None, "subdirs": [], "files": {}}
+        return entry
+
+    def handled(self, path, st):
+        d, name = os.path.split(path)
+        entry = self.dirs.get(d)
+        return entry is not None and entry["files"].get(name) == _signature(st)
+
+    def mark(self, path, st):
+        d, name = os.path.split(path)
+        self._entry(d)["files"][name] = _signature(st)
+        self.pending.discard(path)
+        self.dirty = True
+
+    def unchanged(self, d, st):
+        entry = self.dirs.get(d)
+        return entry is not None and entry["mtime"] == st.st_mtime_ns
+
+    def listed(self, d, st, subdirs, names):
+        """Record a fresh listing of d; files that are gone are forgotten"""
+        entry = self._entry(d)
+        entry["mtime"] = st.st_mtime_ns
+        entry["subdirs"] = subdirs
+        entry["files"] = {n: s for n, s in entry["files"].items() if n in names}
+        for sub in [k for k in self.dirs if os.path.dirname(k) == d and os.path.basename(k) not in subdirs]:
+            self.forget_dir(sub)
+        self.dirty = True
+
+    def forget_dir(self, d):
+        prefix = d + os.sep
+        for k in [k for k in self.dirs if k == d or k.startswith(prefix)]:
+            del self.dirs[k]
+        self.pending = {p for p in self.pending if not p.startswith(prefix)}
+        self.dirty = True
+
+
+# -------------------- inotify --------------------
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF
+
+_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Inotify:
+    """Minimal inotify binding (ctypes); read() returns (watched dir, name, mask) events"""
+
+    def __init__(self):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}     # wd -> dir
+        self._wds = {}      # dir -> wd
+
+    def add(self, d):
+        if d in self._wds:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(d), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"inotify_add_watch failed: {os.strerror(code)}", d)
+        self._dirs[wd], self._wds[d] = d, wd
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0"))
+            pos += _EVENT.size + length
+            d = self._dirs.get(wd)
+            if mask & IN_IGNORED:
+                if d is not None:
+                    del self._dirs[wd]
+                    self._wds.pop(d, None)
+                continue
+            events.append((d, name, mask))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+# -------------------- Watcher --------------------
+
+class Watcher:
+    """Watches `folders` and runs their conversions on a pool of `workers` threads"""
+
+    def __init__(self, folders, state_file=STATE_FILE, workers=jobs.DEFAULT_WORKERS,
+                 settle=DEFAULT_SETTLE, poll=DEFAULT_POLL, use_inotify=True):
+        self.folders = sorted(folders, key=lambda f: len(f.path), reverse=True)  # deepest first
+        self.settle = settle
+        self.poll = poll
+        self.state = ScanState(state_file)
+        self.queue = jobs.JobQueue(workers, on_update=self._on_job)
+        self._lock = threading.Lock()
+        self._pending = {}      # path -> [signature, monotonic time it last changed]
+        self._active = {}       # path -> (input stat when queued, unfinished jobs)
+        self._finished = []     # jobs to take off the queue
+        self._stop = threading.Event()
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = Inotify()
+            except OSError as e:
+                log.info(f"inotify not available ({e.strerror}), polling every {poll:g}s")
+
+    def folder_of(self, path):
+        for folder in self.folders:
+            if path == folder.path or path.startswith(folder.path + os.sep):
+                return folder
+        return None
+
+    # ---------- scanning ----------
+
+    def scan(self):
+        """Incremental scan of every folder: only directories whose mtime changed are listed"""
+        with self._lock:
+            for folder in self.folders:
+                self._scan_dir(folder, folder.path)
+            for path in list(self.state.pending):
+                if path not in self._pending and path not in self._active:
+                    self._offer(path)
+
+    def _scan_dir(self, folder, d):
+        if self._inotify is not None:
+            self._watch(d)
+        try:
+            st = os.stat(d)
+        except OSError:
+            self.state.forget_dir(d)
+            return
+        if self.state.unchanged(d, st):
+            subdirs = self.state.dirs[d]["subdirs"]
+        else:
+            subdirs, names = [], set()
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file() and folder.accepts(entry.name):
+                            names.add(entry.name)
+                            self._offer(entry.path)
+            except OSError as e:
+                log.warning(f"Cannot list {d}: {e}")
+                return
+            self.state.listed(d, st, subdirs, names)
+        if folder.recursive:
+            for name in subdirs:
+                sub = os.path.join(d, name)
+                if self.folder_of(sub) is folder:
+                    self._scan_dir(folder, sub)
+
+    def _watch(self, d):
+        try:
+            self._inotify.add(d)
+        except OSError as e:
+            # e.g. the inotify watch limit; the rest is found by polling
+            log.warning(f"{e.strerror}: {d}; falling back to polling")
+            self._inotify.close()
+            self._inotify = None
+
+    def _offer(self, path):
+        """Start the settle timer for a new or changed file"""
+        if path in self._pending or path in self._active:
+            return
+        base = os.path.splitext(path)[0]
+        if any(os.path.splitext(p)[0] == base for p in self._active):
+            return  # an output of a running conversion
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.state.pending.discard(path)
+            return
+        if self.state.handled(path, st):
+            return
+        self._pending[path] = [_signature(st), time.monotonic()]
+        if path not in self.state.pending:
+            self.state.pending.add(path)
+            self.state.dirty = True
+
+    def _handle_events(self, events):
+        if any(mask & IN_Q_OVERFLOW for _, _, mask in events):
+            log.warning("inotify queue overflowed, rescanning")
+            self.scan()
+        with self._lock:
+            for d, name, mask in events:
+                if d is None:
+                    continue
+                path = os.path.join(d, name) if name else d
+                folder = self.folder_of(path)
+                if folder is None:
+                    continue
+                if mask & (IN_DELETE | IN_MOVED_FROM | IN_DELETE_SELF):
+                    if mask & IN_ISDIR or mask & IN_DELETE_SELF:
+                        self.state.forget_dir(path)
+                    else:
+                        self._pending.pop(path, None)
+                        self.state.pending.discard(path)
+                elif mask & IN_ISDIR:
+                    if folder.recursive:
+                        self._scan_dir(folder, path)
+                elif folder.accepts(name):
+                    self._offer(path)
+
+    # ---------- converting ----------
+
+    def _check_pending(self):
+        """Queue the files that stayed unchanged for `settle` seconds"""
+        now = time.monotonic()
+        with self._lock:
+            for path, (sig, since) in list(self._pending.items()):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self._pending[path]
+                    self.state.pending.discard(path)
+                    self.state.dirty = True
+                    continue
+                if _signature(st) != sig:
+                    self._pending[path] = [_signature(st), now]
+                elif now - since >= self.settle:
+                    del self._pending[path]
+                    self._submit(path, st)
+
+    def _submit(self, path, st):
+        folder = self.folder_of(path)
+        new_jobs = folder.make_jobs(path) if folder else []
+        if not new_jobs:
+            self.state.mark(path, st)
+            return
+        log.info(f"Queued {path} -> {', '.join(j.target for j in new_jobs)}")
+        self._active[path] = (st, list(new_jobs))
+        for job in new_jobs:
+            self.queue.add(job)
+
+    def _on_job(self, job):
+        """JobQueue callback (worker threads)"""
+        if job.status not in (jobs.DONE, jobs.FAILED, jobs.CANCELLED):
+            return
+        with self._lock:
+            self._finished.append(job)
+            st, waiting = self._active.get(job.path, (None, []))
+            if job in waiting:
+                waiting.remove(job)
+            if job.status == jobs.DONE:
+                log.info(f"Converted {job.path} -> {job.target} in {job.duration:.1f}s")
+            elif job.status == jobs.FAILED:
+                log.error(f"{job.path} -> {job.target} failed: {job.error}")
+            # outputs are written next to the input under its name (Job.base) and are not new inputs
+            for ext in self.folder_of(job.path).extensions:
+                out = job.base + ext
+                if out != job.path and os.path.isfile(out):
+                    self.state.mark(out, os.stat(out))
+            if job.path in self._active and not waiting:
+                del self._active[job.path]
+                if job.status == jobs.CANCELLED:
+                    return  # stays pending in the state file, retried on the next start
+                # failed files are not retried until they change
+                self.state.mark(job.path, st)
+
+    def _reap(self):
+        with self._lock:
+            finished, self._finished = self._finished, []
+        for job in finished:
+            self.queue.remove(job)
+
+    def busy(self):
+        with self._lock:
+            return bool(self._pending or self._active)
+
+    # ---------- main loop ----------
+
+    def run(self, once=False):
+        """Watch until stop(); with once=True, convert what is there now and return"""
+        for folder in self.folders:
+            if not os.path.isdir(folder.path):
+                log.warning(f"Watched folder {folder.path} does not exist")
+        self.queue.start()
+        mode = "inotify" if self._inotify is not None else f"polling every {self.poll:g}s"
+        log.info(f"Watching {len(self.folders)} folder(s) ({mode}), Ctrl+C to stop")
+        self.scan()
+        last_scan = last_save = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                self._check_pending()
+                self._reap()
+                now = time.monotonic()
+                if now - last_save >= self.poll:
+                    with self._lock:
+                        self.state.save()
+                    last_save = now
+                if once and not self.busy():
+                    break
+                timeout = min(self.poll, self.settle / 2) if self.busy() else self.poll
+                if self._inotify is not None:
+                    self._handle_events(self._inotify.read(timeout))
+                else:
+                    self._stop.wait(timeout)
+                    if time.monotonic() - last_scan >= self.poll:
+                        self.scan()
+                        last_scan = time.monotonic()
+        finally:
+            self.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.queue.close()
+        self.queue.wait()   # cancelled conversions remove their partial outputs
+        self._reap()
+        with self._lock:
+            self.state.save()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+if __name__ == "__main__":
+    logger.init_logger()
+    import argparse
+    parser = argparse.ArgumentParser(description=f"VektorConverter watch folders v{sub_script_ver}")
+    parser.add_argument("folders", nargs="*", help="folders to watch (all with the same settings)")
+    parser.add_argument("-c", "--config", help="watch config JSON with per-folder settings")
+    parser.add_argument("-t", "--target", action="append", help="J750, C3380, C3850, VEC or VECB; may be repeated")
+    parser.add_argument("--dec", help="DEC file for Chroma targets")
+    parser.add_argument("--interval", type=int, help="VCD sampling interval")
+    parser.add_argument("--no-recursive", action="store_true", help="do not watch subfolders")
+    parser.add_argument("-w", "--workers", type=int, help=f"conversions run at once (default {jobs.DEFAULT_WORKERS})")
+    parser.add_argument("--settle", type=float, help=f"seconds a file must stay unchanged (default {DEFAULT_SETTLE:g})")
+    parser.add_argument("--poll", type=float, help=f"seconds between scans without inotify (default {DEFAULT_POLL:g})")
+    parser.add_argument("--force-poll", action="store_true", help="poll even where inotify is available")
+    parser.add_argument("--state", help=f"scan state file (default {STATE_FILE})")
+    parser.add_argument("--once", action="store_true", help="convert the files there now, then exit")
+    args = parser.parse_args()
+
+    folders, settings = load_config(args.config) if args.config else ([], {})
+    folders += [WatchFolder(p, args.target or ["VEC"], args.dec, args.interval, not args.no_recursive)
+                for p in args.folders]
+    if not folders:
+        parser.error("give folders to watch or --config")
+    for key in ("workers", "settle", "poll", "state"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+
+    watcher = Watcher(folders, state_file=settings.get("state", STATE_FILE),
+                      workers=settings.get("workers", jobs.DEFAULT_WORKERS),
+                      settle=settings.get("settle", DEFAULT_SETTLE), poll=settings.get("poll", DEFAULT_POLL),
+                      use_inotify=not args.force_poll)
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        log.info("Stopped")